@@ -1,13 +1,32 @@
-from flask import Flask, g
+from flask import Flask, g, has_request_context, session
+import functools
+import time
 import pymysql
 # Monkey patch MySQLdb to allow using pymysql
 pymysql.install_as_MySQLdb()
 import MySQLdb
 from config import Config
+from app.pool import ConnectionPool
+from app.replicas import Replica, ReplicaSet
+from app.search import search_index
+from app.cache import cache, availability
+from app.circulation import retry
+from app.holds import holds
+from app.events import events
+from app.recommendations import recommendations
+from app.passwords import hasher
+from app.instrumentation import instrumentation
+from app.covers import covers
+from app.sessions import sessions
+from app.fragments import fragments
+from app.health import health
 
 class MySQL:
     def __init__(self, app=None):
         self.app = app
+        self.pool = None
+        self.replicas = ReplicaSet([])
+        self.instrumentation = None
         if app is not None:
             self.init_app(app)
 
@@ -20,19 +39,132 @@ class MySQL:
         self.db = app.config.get('MYSQL_DB')
         self.cursor_class = app.config.get('MYSQL_CURSORCLASS', 'DictCursor')
 
+        self.sticky_seconds = app.config.get('MYSQL_REPLICA_STICKY_SECONDS', 10)
+
+        # Connections are opened lazily, so creating the pool never touches the DB
+        self.pool = self._pool(self._connect)
+
+        # One pool per replica, same credentials and sizing as the primary
+        replicas = []
+        for address in app.config.get('MYSQL_REPLICAS') or []:
+            host, _, port = address.partition(':')
+            port = int(port or 3306)
+            replicas.append(Replica(host, port, self._pool(functools.partial(self._connect, host, port))))
+        self.replicas = ReplicaSet(
+            replicas,
+            policy=app.config.get('MYSQL_REPLICA_POLICY', 'round_robin'),
+            health_interval=app.config.get('MYSQL_REPLICA_HEALTH_INTERVAL', 5),
+            max_lag=app.config.get('MYSQL_REPLICA_MAX_LAG', 10),
+            retry_after=app.config.get('MYSQL_REPLICA_RETRY_AFTER', 30),
+        )
+
+    def _pool(self, connect):
+        return ConnectionPool(
+            connect,
+            size=self.app.config.get('MYSQL_POOL_SIZE', 10),
+            timeout=self.app.config.get('MYSQL_POOL_TIMEOUT', 5.0),
+            recycle=self.app.config.get('MYSQL_POOL_RECYCLE', 3600),
+            ping_interval=self.app.config.get('MYSQL_POOL_PING_INTERVAL', 30),
+        )
+
+    def _connect(self, host=None, port=3306):
+        return MySQLdb.connect(
+            host=host or self.host,
+            port=port,
+            user=self.user,
+            password=self.password,
+            database=self.db,
+            cursorclass=getattr(MySQLdb.cursors, self.cursor_class, MySQLdb.cursors.DictCursor)
+        )
+
+    def _checkout(self, pool):
+        started = time.perf_counter()
+        conn = pool.checkout()
+        if self.instrumentation is not None:
+            self.instrumentation.record_checkout(time.perf_counter() - started)
+            conn = self.instrumentation.wrap(conn)
+        return conn
+
     @property
     def connection(self):
-        # Open a new connection if one doesn't exist for this request
+        # Views marked read_only get a replica for everything they run
+        if g.get('db_read_only'):
+            return self.read_connection
+        return self._primary()
+
+    @property
+    def primary_connection(self):
+        # Per-query override inside a read_only view, e.g. for reads whose
+        # result gets cached and must not be stale
+        return self._primary()
+
+    @property
+    def read_connection(self):
+        # For queries that tolerate a few seconds of replication lag. Falls
+        # back to the primary when there are no healthy replicas, or when
+        # this user has just borrowed or returned and must see their write.
+        if 'db_read_conn' in g:
+            return g.db_read_conn
+        if not self.replicas or self._sticky():
+            return self._primary()
+        replica = self.replicas.choose()
+        if replica is None:
+            return self._primary()
+        try:
+            g.db_read_conn = self._checkout(replica.pool)
+        except Exception:
+            self.replicas.mark_down(replica)
+            return self._primary()
+        g.db_read_replica = replica
+        return g.db_read_conn
+
+    def _primary(self):
+        # Check a connection out of the pool if this request doesn't hold one yet
         if 'db_conn' not in g:
-            g.db_conn = MySQLdb.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.db,
-                cursorclass=getattr(MySQLdb.cursors, self.cursor_class, MySQLdb.cursors.DictCursor)
-            )
+            g.db_conn = self._checkout(self.pool)
         return g.db_conn
 
+    def _sticky(self):
+        return has_request_context() and session.get('primary_until', 0) > time.time()
+
+    def stick_to_primary(self):
+        # Call after committing a user's own write, so their next pages read it back
+        if self.replicas:
+            session['primary_until'] = time.time() + self.sticky_seconds
+
+    def read_only(self, view):
+        # Per-view routing: every query the view runs goes to a replica.
+        # Only for views that never write.
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.db_read_only = True
+            return view(*args, **kwargs)
+        return wrapper
+
+    def release(self, conn, error=None):
+        # Hand the pool the raw connection, not the instrumentation proxy
+        conn = getattr(conn, 'raw', conn)
+        # Connections that saw a driver-level error may be broken; don't reuse them
+        discard = isinstance(error, (MySQLdb.OperationalError, MySQLdb.InterfaceError))
+        self.pool.checkin(conn, discard=discard)
+
+    def release_read(self, replica, conn, error=None):
+        conn = getattr(conn, 'raw', conn)
+        discard = isinstance(error, (MySQLdb.OperationalError, MySQLdb.InterfaceError))
+        if discard:
+            # Likely the replica itself; skip it until a health check passes
+            self.replicas.mark_down(replica)
+        replica.pool.checkin(conn, discard=discard)
+
+    def teardown(self, error=None):
+        # Returns whatever this request checked out, primary and replica
+        db = g.pop('db_conn', None)
+        if db is not None:
+            self.release(db, error)
+        db = g.pop('db_read_conn', None)
+        if db is not None:
+            self.release_read(g.pop('db_read_replica'), db, error)
+
 mysql = MySQL()
 
 def create_app(config_class=Config):
@@ -41,15 +173,52 @@ def create_app(config_class=Config):
 
     # Initialize shim
     mysql.init_app(app)
+    search_index.init_app(app)
+    cache.init_app(app)
+    availability.init_app(app)
+    retry.init_app(app)
+    holds.init_app(app)
+    events.init_app(app)
+    recommendations.init_app(app)
+    hasher.init_app(app)
+    covers.init_app(app)
+    # Server-side sessions; replaces Flask's signed-cookie sessions
+    sessions.init_app(app)
+    fragments.init_app(app)
+
+    # Time every statement and template; serves /metrics
+    instrumentation.init_app(app)
+    mysql.instrumentation = instrumentation
+    sessions.instrumentation = instrumentation
+    instrumentation.extra_metrics = [
+        lambda: {f'library_db_pool_{k}': v for k, v in mysql.pool.stats().items()},
+        lambda: {
+            'library_db_replicas_healthy': sum(r.healthy for r in mysql.replicas.replicas),
+            'library_db_replica_reads_total': sum(r.reads for r in mysql.replicas.replicas),
+            'library_db_replica_failures_total': sum(r.failures for r in mysql.replicas.replicas),
+            'library_db_replica_fallbacks_total': mysql.replicas.fallbacks,
+        },
+        lambda: {f'library_cache_{k}': v for k, v in cache.stats().items() if isinstance(v, (int, float))},
+        lambda: {'library_db_lock_retries_total': retry.retries},
+        lambda: {f'library_covers_{k}': v for k, v in covers.usage().items()},
+        lambda: {f'library_fragments_{k}': v for k, v in fragments.stats().items()},
+        lambda: {f'library_sessions_{k}': v for k, v in sessions.stats().items() if isinstance(v, (int, float))},
+        lambda: {f'library_events_{k}': v for k, v in events.stats().items() if isinstance(v, (int, float))},
+    ]
 
-    # Add teardown to close connection
+    # Add teardown to return the connection to the pool
     @app.teardown_appcontext
     def close_db(error):
-        db = g.pop('db_conn', None)
-        if db is not None:
-            db.close()
+        mysql.teardown(error)
 
-    from app import routes
+    from app import routes, api
     app.register_blueprint(routes.bp)
+    app.register_blueprint(api.api)
+
+    # /healthz and /readyz; with PRELOAD, warm up before taking traffic
+    health.init_app(app)
+    health.pools = [mysql.pool] + [replica.pool for replica in mysql.replicas.replicas]
+    if app.config.get('PRELOAD'):
+        health.preload(app)
 
     return app
@@ -0,0 +1,454 @@
+"""Async serving mode: Quart views over an aiomysql pool.
+
+The request paths that mostly wait on MySQL (catalog, suggest, dashboard,
+borrow and return) and the /events stream are served as coroutines, so one
+process can keep many of them in flight. Every other route still runs on the WSGI app; `Dispatcher`
+sends each request to the side that owns its URL. Both sides sign the same
+server-side session store (app/sessions.py), so logins, roles and flashed
+messages carry over between them. Serve it with `hypercorn asgi:app` (see asgi.py).
+
+Shared state (search index, caches, sessions, retry policy) is the same
+module-level objects the sync app uses. The Redis cache and session backends
+are blocking clients; with either set to redis each call briefly holds the
+event loop.
+"""
+import asyncio
+import datetime
+import time
+
+import aiomysql
+import MySQLdb
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import (Quart, Blueprint, g, render_template, request, redirect, url_for, flash, session, make_response,
+                   current_app)
+from quart.sessions import SessionInterface
+from werkzeug.exceptions import HTTPException, NotFound
+
+from config import Config
+from app.pool import PoolTimeout
+from app.search import search_index, LOAD_QUERY
+from app.cache import cache, availability
+from app.events import events, format_sse, EventsBusy
+from app.circulation import retry, borrow_book_async, return_book_async
+from app.holds import holds, USER_HOLDS_QUERY
+from app.recommendations import recommendations, BOOK_RECOMMENDATIONS_QUERY, USER_RECOMMENDATIONS_QUERY
+from app.covers import covers
+from app.sessions import sessions
+from app.fragments import fragments
+from app.health import compile_templates
+from app.pagination import decode_cursor, seek_rows, seek_list, cached_count, remember_count, APPROXIMATE_COUNT_QUERY
+from app.routes import (USER_QUERY, ADMIN_SUMMARY_QUERY, MY_LOANS_QUERY, AVAILABLE_BOOKS_QUERY, BOOK_QUERY,
+                        ADMIN_PANELS, CATALOG_SORTS, books_by_id_query, browse_cursors, browse_query, browse_keys,
+                        catalog_page)
+
+
+class AsyncMySQL:
+    """aiomysql counterpart of the MySQL shim.
+
+    The pool opens when the server starts serving; each request checks out at
+    most one connection, which is rolled back and returned on teardown.
+    """
+
+    def __init__(self, app=None):
+        self.pool = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.params = {
+            'host': app.config.get('MYSQL_HOST', 'localhost'),
+            'user': app.config.get('MYSQL_USER'),
+            'password': app.config.get('MYSQL_PASSWORD') or '',
+            'db': app.config.get('MYSQL_DB'),
+        }
+        self.size = app.config.get('MYSQL_POOL_SIZE', 10)
+        self.timeout = app.config.get('MYSQL_POOL_TIMEOUT', 5.0)
+        self.recycle = app.config.get('MYSQL_POOL_RECYCLE', 3600)
+        self.replicated = bool(app.config.get('MYSQL_REPLICAS'))
+        self.sticky_seconds = app.config.get('MYSQL_REPLICA_STICKY_SECONDS', 10)
+        # With PRELOAD the whole pool is opened before the first request
+        self.minsize = self.size if app.config.get('PRELOAD') else 1
+
+        app.before_serving(self.open)
+        app.after_serving(self.close)
+        app.teardown_appcontext(self._teardown)
+
+    async def open(self):
+        self.pool = await aiomysql.create_pool(
+            minsize=self.minsize, maxsize=self.size, pool_recycle=self.recycle,
+            cursorclass=aiomysql.DictCursor, autocommit=False, **self.params)
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def connection(self):
+        if 'db_conn' not in g:
+            try:
+                g.db_conn = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise PoolTimeout(f'No database connection available within {self.timeout}s')
+        return g.db_conn
+
+    async def release(self, conn, error=None):
+        # Same rules as ConnectionPool.checkin: never hand out an open
+        # transaction, and drop connections that saw a driver-level error
+        if isinstance(error, (MySQLdb.OperationalError, MySQLdb.InterfaceError)):
+            conn.close()
+        else:
+            try:
+                await conn.rollback()
+            except MySQLdb.MySQLError:
+                conn.close()
+        self.pool.release(conn)
+
+    def stick_to_primary(self):
+        # This side only reads the primary, but the WSGI views sharing the
+        # session use replicas; same marker as MySQL.stick_to_primary
+        if self.replicated:
+            session['primary_until'] = time.time() + self.sticky_seconds
+
+    def stats(self):
+        if self.pool is None:
+            return {'size': self.size, 'open': 0, 'idle': 0}
+        return {'size': self.pool.maxsize, 'open': self.pool.size, 'idle': self.pool.freesize}
+
+    async def _teardown(self, error):
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            await self.release(conn, error)
+
+
+db = AsyncMySQL()
+
+
+class AsyncSessionInterface(SessionInterface):
+    """Quart adapter over the sync app's ServerSessionInterface and store."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    async def open_session(self, app, request):
+        return self.sessions.open_session(app, request)
+
+    async def save_session(self, app, session, response):
+        self.sessions.save_session(app, session, response)
+
+bp = Blueprint('main', __name__)
+
+_index_lock = asyncio.Lock()
+
+
+async def refresh_search_index(conn, batch_size=5000):
+    # One coroutine loads; the rest wait for it instead of loading again
+    if not search_index.needs_refresh():
+        return
+    async with _index_lock:
+        if not search_index.needs_refresh():
+            return
+        async with conn.cursor() as cursor:
+            await cursor.execute(LOAD_QUERY, (search_index.watermark,))
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                search_index.ingest(rows)
+        search_index.mark_loaded()
+
+
+async def approximate_count(conn, table, ttl=300):
+    estimate = cached_count(table, ttl)
+    if estimate is not None:
+        return estimate
+    async with conn.cursor() as cursor:
+        await cursor.execute(APPROXIMATE_COUNT_QUERY, (table,))
+        return remember_count(table, await cursor.fetchone())
+
+
+async def overlay_availability(conn, books):
+    counts, missing = availability.cached([book['book_id'] for book in books])
+    if missing:
+        async with conn.cursor() as cursor:
+            await cursor.execute(*availability.lookup(missing))
+            counts.update(availability.store(await cursor.fetchall()))
+    return availability.apply(books, counts)
+
+
+async def announce(conn, book_ids, user_id=None, change=None, allocated=()):
+    # Async twin of routes.announce
+    try:
+        watched = [book_id for book_id in book_ids if events.wants(f'book:{book_id}')]
+        if watched:
+            counts, missing = availability.cached(watched)
+            if missing:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(*availability.lookup(missing))
+                    counts.update(availability.store(await cursor.fetchall()))
+            events.availability(counts)
+        if user_id is not None and change is not None:
+            for book_id in book_ids:
+                events.loans_changed(user_id, book_id, change)
+        for hold in allocated:
+            events.loans_changed(hold['user_id'], hold['book_id'], 'hold_ready')
+    except Exception:
+        current_app.logger.exception('could not publish events')
+
+
+async def load_catalog_page(conn, search_query, after, before, limit=12, sort='title'):
+    async with conn.cursor() as cursor:
+        if search_query:
+            await refresh_search_index(conn)
+            ranked = [(-score, book_id) for score, book_id in search_index.search_scored(search_query)]
+            keys, has_prev, has_next = seek_list(ranked, limit, after, before)
+            total = len(ranked)
+            books = []
+            if keys:
+                book_ids = [book_id for _, book_id in keys]
+                await cursor.execute(*books_by_id_query(book_ids))
+                rows = {row['book_id']: row for row in await cursor.fetchall()}
+                books = [rows[book_id] for book_id in book_ids if book_id in rows]
+        else:
+            after, before = browse_cursors(after, before, sort)
+            await cursor.execute(*browse_query(after, before, limit, sort))
+            books, has_prev, has_next = seek_rows(await cursor.fetchall(), limit, after, before)
+            keys = browse_keys(books, sort)
+            total = await approximate_count(conn, 'books')
+    return catalog_page(books, keys, total, has_prev, has_next)
+
+
+async def load_book(conn, book_id):
+    async with conn.cursor() as cursor:
+        await cursor.execute(BOOK_QUERY + " WHERE b.book_id = %s", (book_id,))
+        return await cursor.fetchone()
+
+
+@bp.route('/dashboard')
+async def dashboard():
+    if 'user_id' not in session:
+        return redirect(url_for('main.index'))
+
+    conn = await db.connection()
+    async with conn.cursor() as cursor:
+        user_info = sessions.cached_profile(session['user_id'])
+        if user_info is None:
+            await cursor.execute(USER_QUERY, (session['user_id'],))
+            user_info = sessions.remember_profile(session['user_id'], await cursor.fetchone())
+
+        if session['role'] == 'admin':
+            await cursor.execute(ADMIN_SUMMARY_QUERY)
+            summary = await cursor.fetchone()
+            return await render_template('dashboard.html', summary=summary, panels=ADMIN_PANELS, is_admin=True,
+                                         user_info=user_info)
+
+        await cursor.execute(MY_LOANS_QUERY, (session['user_id'],))
+        my_books = await cursor.fetchall()
+        await cursor.execute(USER_RECOMMENDATIONS_QUERY, (session['user_id'], 12))
+        recommended = await cursor.fetchall()
+        available_books = []
+        if not recommended:
+            await cursor.execute(AVAILABLE_BOOKS_QUERY)
+            available_books = await cursor.fetchall()
+        await cursor.execute(USER_HOLDS_QUERY, (session['user_id'],))
+        my_holds = await cursor.fetchall()
+    return await render_template('dashboard.html', my_books=my_books, recommended=recommended,
+                                 available_books=available_books, my_holds=my_holds, is_admin=False,
+                                 user_info=user_info)
+
+
+@bp.route('/books')
+async def catalog():
+    search_query = request.args.get('q', '')
+    sort = request.args.get('sort', 'title')
+    if sort not in CATALOG_SORTS:
+        sort = 'title'
+    after_token = request.args.get('after')
+    before_token = request.args.get('before')
+
+    conn = await db.connection()
+    # Same keys and tags as the sync catalog, so both sides share cached pages
+    key = f"catalog:{sort}:{after_token or ''}:{before_token or ''}:{search_query}"
+    page = cache.get(key)
+    if page is None:
+        page = await load_catalog_page(conn, search_query, decode_cursor(after_token), decode_cursor(before_token),
+                                       sort=sort)
+        cache.set(key, page, tags=['catalog'] + [f"book:{book['book_id']}" for book in page['books']])
+    books = await overlay_availability(conn, page['books'])
+
+    return await render_template('catalog.html', books=books, search_query=search_query, total=page['total'],
+                                 prev_cursor=page['prev_cursor'], next_cursor=page['next_cursor'],
+                                 is_estimate=not search_query, sort=sort)
+
+
+@bp.route('/books/suggest')
+async def suggest_books():
+    query = request.args.get('q', '')
+    if len(query.strip()) < 2:
+        return {'suggestions': []}
+    await refresh_search_index(await db.connection())
+    return {'suggestions': search_index.suggest(query)}
+
+
+@bp.route('/borrow/confirm/<int:book_id>')
+async def confirm_borrow(book_id):
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    conn = await db.connection()
+    book = cache.get(f'book:{book_id}')
+    if book is None:
+        book = await load_book(conn, book_id)
+        cache.set(f'book:{book_id}', book, tags=[f'book:{book_id}'])
+
+    if not book:
+        return redirect(url_for('main.catalog'))
+    book = (await overlay_availability(conn, [book]))[0]
+    async with conn.cursor() as cursor:
+        await cursor.execute(BOOK_RECOMMENDATIONS_QUERY, (book_id, 6))
+        also_borrowed = await cursor.fetchall()
+
+    today = datetime.date.today()
+    due_date = today + datetime.timedelta(days=14)
+
+    return await render_template('borrow_confirm.html', book=book, today=today, due_date=due_date,
+                                 also_borrowed=also_borrowed)
+
+
+@bp.route('/borrow/process/<int:book_id>', methods=['POST'])
+async def process_borrow(book_id):
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    try:
+        conn = await db.connection()
+        await borrow_book_async(conn, session['user_id'], book_id)
+        availability.invalidate(book_id)
+        db.stick_to_primary()
+        await announce(conn, [book_id], session['user_id'], 'borrowed')
+        await flash('Book borrowed successfully! Enjoy reading.', 'success')
+    except Exception as e:
+        await flash(f'Error borrowing book: {str(e)}', 'danger')
+
+    return redirect(url_for('main.dashboard'))
+
+
+@bp.route('/return/<int:transaction_id>')
+async def return_book_route(transaction_id):
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    try:
+        conn = await db.connection()
+        allocated = []
+        loan = await return_book_async(conn, transaction_id, allocated)
+        if loan is not None:
+            book_id, owner_id = loan
+            availability.invalidate(book_id)
+            # The loan's owner, who may not be the one returning it
+            await announce(conn, [book_id], owner_id, 'returned', allocated)
+        db.stick_to_primary()
+        await flash('Book returned successfully!', 'success')
+    except Exception as e:
+        await flash(f'Error returning book: {str(e)}', 'danger')
+
+    return redirect(url_for('main.dashboard'))
+
+
+@bp.route('/events')
+async def event_stream():
+    # Same stream as routes.event_stream, but an open stream costs a
+    # coroutine here instead of a server thread
+    try:
+        book_ids = [int(b) for b in request.args.get('books', '').split(',') if b.strip()][:events.max_books]
+    except ValueError:
+        return {'status': 'error', 'message': 'books must be a comma-separated list of ids'}, 400
+    try:
+        subscriber = events.subscribe(book_ids, session.get('user_id'), catalog=request.args.get('catalog') == '1')
+    except EventsBusy:
+        return {'status': 'error', 'message': 'Too many open event streams'}, 503, {'Retry-After': '30'}
+    subscriber.attach_loop(asyncio.get_running_loop())
+
+    async def stream():
+        try:
+            yield b'retry: 5000\n\n'
+            while not subscriber.closed:
+                pending = await subscriber.wait_async(events.heartbeat)
+                if pending:
+                    yield ''.join(format_sse(event) for event in pending).encode()
+                else:
+                    yield b': ping\n\n'
+        finally:
+            # Runs when the client goes away and the generator is closed
+            events.unsubscribe(subscriber)
+
+    response = await make_response(stream(), 200, {'Content-Type': 'text/event-stream',
+                                                    'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.timeout = None  # the stream outlives RESPONSE_TIMEOUT
+    return response
+
+
+@bp.app_template_global()
+def cover_url(book, size='card'):
+    # Same URLs as the sync side; /covers itself is served by the WSGI app
+    return url_for('main.cover', book_id=book['book_id'], size=size, v=covers.version(book.get('image_url')))
+
+
+async def served_by_wsgi(**kwargs):
+    # Placeholder for routes the WSGI app owns. They're registered here only
+    # so url_for() in shared templates can build them; Dispatcher never
+    # routes a request to this view.
+    raise NotFound()
+
+
+def create_app(wsgi_app, config_class=Config):
+    app = Quart(__name__)
+    app.config.from_object(config_class)
+
+    db.init_app(app)
+    search_index.init_app(app)
+    cache.init_app(app)
+    availability.init_app(app)
+    retry.init_app(app)
+    holds.init_app(app)
+    events.init_app(app)
+    recommendations.init_app(app)
+    app.session_interface = AsyncSessionInterface(sessions)
+    fragments.init_app(app)
+
+    app.register_blueprint(bp)
+    for rule in wsgi_app.url_map.iter_rules():
+        if rule.endpoint not in app.view_functions:
+            app.add_url_rule(rule.rule, rule.endpoint, served_by_wsgi, methods=rule.methods)
+    # /healthz and /readyz are among them; the WSGI app answers those
+    if app.config.get('PRELOAD'):
+        compile_templates(app)
+
+    return app
+
+
+class Dispatcher:
+    """ASGI entry point splitting requests between the async and WSGI apps.
+
+    A request goes to the async app when its URL matches one of the async
+    views (or static files); everything else, including 404s, runs on the
+    WSGI app in hypercorn's thread-pool adapter. Lifespan events go to the
+    async app so its pool opens and closes with the server.
+    """
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = AsyncioWSGIMiddleware(wsgi_app)
+        self.adapter = async_app.url_map.bind('localhost')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self.is_async(scope['path'], scope['method']):
+            return await self.wsgi_app(scope, receive, send)
+        return await self.async_app(scope, receive, send)
+
+    def is_async(self, path, method):
+        try:
+            endpoint, _ = self.adapter.match(path, method)
+        except HTTPException:
+            return False
+        return self.async_app.view_functions[endpoint] is not served_by_wsgi
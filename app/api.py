@@ -0,0 +1,458 @@
+"""Versioned JSON API for kiosk and mobile clients.
+
+Authentication is the same session cookie as the web UI. Every GET is
+conditional: its ETag is derived from cheap version lookups (MAX(updated_at)
+over an index, see 0007_change_versions.sql) plus the request arguments, so
+an unchanged resource answers 304 before any of the joins run.
+"""
+import datetime
+import hashlib
+
+from flask import Blueprint, request, session, make_response, current_app
+from app import mysql
+from app.cache import cache, availability
+from app.circulation import (borrow_book, return_book, borrow_books, return_books, place_hold, cancel_hold,
+                             BatchTooLarge)
+from app.holds import holds, HoldError
+from app.search import search_index
+from app.pagination import encode_cursor, decode_cursor, valid_cursor, seek_condition, seek_rows, SCALAR
+from app.routes import BOOK_QUERY, CATALOG_SORTS, load_catalog_page, _json_row, announce
+import MySQLdb
+import MySQLdb.cursors
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+BOOK_FIELDS = ('book_id', 'title', 'isbn', 'author_id', 'author_name', 'category_id', 'publication_year',
+               'total_copies', 'available_copies', 'image_url', 'description', 'updated_at')
+LOAN_FIELDS = ('transaction_id', 'book_id', 'title', 'image_url', 'borrow_date', 'due_date', 'return_date',
+               'fine_amount', 'is_overdue', 'status', 'updated_at')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_AVAILABILITY_IDS = 100
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def api_error(e):
+    return {'status': 'error', 'message': str(e)}, e.status
+
+
+def current_user_id():
+    if 'user_id' not in session:
+        raise APIError('Login required', 401)
+    return session['user_id']
+
+
+def page_size():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise APIError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def requested_fields(allowed):
+    # ?fields=title,author_name - the id is always included so clients can
+    # follow up on a row
+    raw = request.args.get('fields')
+    if not raw:
+        return list(allowed)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(unknown)}")
+    return [allowed[0]] + [field for field in fields if field != allowed[0]]
+
+
+def project(row, fields):
+    return _json_row({field: row.get(field) for field in fields})
+
+
+def make_etag(*parts):
+    # Versions and arguments in, stable tag out; the representation is fully
+    # determined by them, so the tag is strong
+    parts += (request.full_path,)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def http_date(epoch):
+    return datetime.datetime.fromtimestamp(float(epoch), datetime.timezone.utc) if epoch is not None else None
+
+
+def not_modified(etag, last_modified=None):
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        fresh = False
+    if fresh:
+        return conditional(make_response('', 304), etag, last_modified)
+    return None
+
+
+def conditional(response, etag, last_modified=None, private=False):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Always revalidate; the 304 path is cheap
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+def books_version(cursor):
+    cursor.execute("""
+        SELECT UNIX_TIMESTAMP((SELECT MAX(updated_at) FROM books)) AS updated,
+               (SELECT deletes FROM table_versions WHERE table_name = 'books') AS deletes,
+               UNIX_TIMESTAMP((SELECT changed_at FROM table_versions WHERE table_name = 'books')) AS deleted
+    """)
+    row = cursor.fetchone()
+    changed = max((value for value in (row['updated'], row['deleted']) if value is not None), default=None)
+    return (row['updated'], row['deletes']), http_date(changed)
+
+
+@api.route('/books')
+@mysql.read_only
+def list_books():
+    fields = requested_fields(BOOK_FIELDS)
+    limit = page_size()
+    search_query = request.args.get('q', '')
+    sort = request.args.get('sort', 'title')
+    if sort not in CATALOG_SORTS:
+        raise APIError(f"sort must be one of: {', '.join(CATALOG_SORTS)}")
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    version, last_modified = books_version(cursor)
+    cursor.close()
+    if search_query:
+        # Search results come from the in-process index, which picks up
+        # writes on its own timer, so its state is part of the version too
+        search_index.ensure_loaded(mysql.connection)
+        version += search_index.generation
+    etag = make_etag('books', version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    # Keyed by the version, so a cached page can never be stale
+    page = cache.get_or_set(f'api:books:{etag}',
+                            lambda: load_catalog_page(search_query, after, before, limit, sort),
+                            tags=['catalog'])
+    body = {
+        'data': [project(book, fields) for book in page['books']],
+        'total': page['total'],
+        'total_is_estimate': not search_query,
+        'prev': page['prev_cursor'],
+        'next': page['next_cursor'],
+    }
+    return conditional(make_response(body), etag, last_modified)
+
+
+@api.route('/books/<int:book_id>')
+@mysql.read_only
+def get_book(book_id):
+    fields = requested_fields(BOOK_FIELDS)
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    # Primary key lookup; the author join only runs when the book changed
+    cursor.execute("SELECT UNIX_TIMESTAMP(updated_at) AS updated FROM books WHERE book_id = %s", (book_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        raise APIError('Book not found', 404)
+
+    etag = make_etag('book', book_id, row['updated'])
+    last_modified = http_date(row['updated'])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        cursor.close()
+        return response
+
+    cursor.execute(BOOK_QUERY + " WHERE b.book_id = %s", (book_id,))
+    book = cursor.fetchone()
+    cursor.close()
+    return conditional(make_response({'data': project(book, fields)}), etag, last_modified)
+
+
+@api.route('/availability')
+def get_availability():
+    # Cheap polling: counts come from the availability counter cache and the
+    # ETag is derived from them, so an unchanged set costs no query at all
+    try:
+        book_ids = sorted({int(value) for value in request.args.get('ids', '').split(',') if value.strip()})
+    except ValueError:
+        raise APIError('ids must be a comma-separated list of book ids')
+    if not book_ids:
+        raise APIError('ids is required')
+    if len(book_ids) > MAX_AVAILABILITY_IDS:
+        raise APIError(f'At most {MAX_AVAILABILITY_IDS} ids per request')
+
+    counts = availability.get_many(mysql.connection, book_ids)
+    data = {str(book_id): counts[book_id] for book_id in book_ids if book_id in counts}
+    etag = make_etag('availability', sorted(data.items()))
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return conditional(make_response({'data': data}), etag)
+
+
+@api.route('/availability/summary')
+@mysql.read_only
+def availability_summary():
+    # Titles and copies per category from the slotted category_stats
+    # counters: O(categories), however large the catalog
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute("""
+        SELECT s.category_id, c.name, CAST(SUM(s.titles) AS SIGNED) AS titles,
+               CAST(SUM(s.total_copies) AS SIGNED) AS total_copies,
+               CAST(SUM(s.available_copies) AS SIGNED) AS available_copies
+        FROM category_stats s
+        LEFT JOIN categories c ON c.category_id = s.category_id
+        GROUP BY s.category_id, c.name
+        ORDER BY s.category_id
+    """)
+    categories = [_json_row(row) for row in cursor.fetchall()]
+    cursor.close()
+    totals = {key: sum(row[key] for row in categories) for key in ('titles', 'total_copies', 'available_copies')}
+    body = {'data': categories, 'totals': totals}
+    etag = make_etag('availability-summary', repr(body))
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return conditional(make_response(body), etag)
+
+
+LOANS_QUERY = """
+    SELECT t.transaction_id, t.book_id, b.title, b.image_url, t.borrow_date, t.due_date, t.return_date,
+           t.fine_amount, t.is_overdue, t.status, t.updated_at
+    FROM transactions t
+    JOIN books b ON t.book_id = b.book_id
+"""
+
+
+@api.route('/me/loans')
+@mysql.read_only
+def list_loans():
+    user_id = current_user_id()
+    fields = requested_fields(LOAN_FIELDS)
+    limit = page_size()
+    status = request.args.get('status', 'issued')
+    if status not in ('issued', 'returned', 'all'):
+        raise APIError("status must be 'issued', 'returned' or 'all'")
+    columns = ['t.borrow_date', 't.transaction_id']
+    after = valid_cursor(decode_cursor(request.args.get('after')), [SCALAR] * len(columns))
+    before = valid_cursor(decode_cursor(request.args.get('before')), [SCALAR] * len(columns))
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    # Covered by idx_tx_user_updated. The count catches loans removed with
+    # their book; title/image edits don't bump the version.
+    cursor.execute("""
+        SELECT UNIX_TIMESTAMP(MAX(updated_at)) AS updated, COUNT(*) AS loans
+        FROM transactions WHERE user_id = %s
+    """, (user_id,))
+    version = cursor.fetchone()
+    etag = make_etag('loans', user_id, version['updated'], version['loans'])
+    last_modified = http_date(version['updated'])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        cursor.close()
+        return response
+
+    # Newest first; with a status this is a range scan on idx_tx_user_status
+    where, params = ["t.user_id = %s"], [user_id]
+    if status != 'all':
+        where.append("t.status = %s")
+        params.append(status)
+    cursor_values = before if before is not None else after
+    if cursor_values is not None:
+        condition, seek_params = seek_condition(columns, cursor_values, reverse=before is None)
+        where.append(condition)
+        params.extend(seek_params)
+    direction = 'ASC' if before is not None else 'DESC'
+    cursor.execute(LOANS_QUERY + " WHERE " + " AND ".join(where) +
+                   f" ORDER BY t.borrow_date {direction}, t.transaction_id {direction} LIMIT %s",
+                   tuple(params) + (limit + 1,))
+    rows, has_prev, has_next = seek_rows(cursor.fetchall(), limit, after, before)
+    cursor.close()
+
+    keys = [(row['borrow_date'], row['transaction_id']) for row in rows]
+    body = {
+        'data': [project(row, fields) for row in rows],
+        'prev': encode_cursor(keys[0]) if has_prev and keys else None,
+        'next': encode_cursor(keys[-1]) if has_next and keys else None,
+    }
+    return conditional(make_response(body), etag, last_modified, private=True)
+
+
+def load_loan(cursor, transaction_id):
+    cursor.execute(LOANS_QUERY + " WHERE t.transaction_id = %s", (transaction_id,))
+    return cursor.fetchone()
+
+
+def is_id(value):
+    # bool is an int subclass; JSON true must not mean id 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+@api.route('/loans', methods=['POST'])
+def create_loan():
+    user_id = current_user_id()
+    data = request.get_json(silent=True) or {}
+    book_id = data.get('book_id')
+    if not is_id(book_id):
+        raise APIError('book_id (integer) is required')
+
+    try:
+        transaction_id = borrow_book(mysql.connection, user_id, book_id)
+    except MySQLdb.MySQLError as e:
+        raise APIError(f'Could not borrow book: {e.args[-1]}', 409)
+    availability.invalidate(book_id)
+    mysql.stick_to_primary()
+    announce([book_id], user_id, 'borrowed')
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    loan = load_loan(cursor, transaction_id)
+    cursor.close()
+    return {'data': _json_row(loan)}, 201
+
+
+@api.route('/loans/<int:transaction_id>/return', methods=['POST'])
+def return_loan(transaction_id):
+    user_id = current_user_id()
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute("SELECT user_id FROM transactions WHERE transaction_id = %s", (transaction_id,))
+    owner = cursor.fetchone()
+    cursor.close()
+    # Members may only return their own loans
+    if owner is None or (owner['user_id'] != user_id and session.get('role') != 'admin'):
+        raise APIError('Loan not found', 404)
+
+    allocated = []
+    try:
+        loan = return_book(mysql.connection, transaction_id, allocated)
+    except MySQLdb.MySQLError as e:
+        raise APIError(f'Could not return book: {e.args[-1]}', 409)
+    if loan is not None:
+        book_id, owner_id = loan
+        availability.invalidate(book_id)
+        announce([book_id], owner_id, 'returned', allocated)
+    mysql.stick_to_primary()
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    loan = load_loan(cursor, transaction_id)
+    cursor.close()
+    return {'data': _json_row(loan)}
+
+
+def id_list(data, key):
+    values = data.get(key)
+    if not isinstance(values, list) or not all(is_id(value) for value in values):
+        raise APIError(f'{key} (list of integers) is required')
+    return values
+
+
+@api.route('/loans/batch', methods=['POST'])
+def create_loans():
+    # Circulation desk: several books for one member in one transaction.
+    # Admins may borrow on behalf of another user with "user_id".
+    user_id = current_user_id()
+    data = request.get_json(silent=True) or {}
+    book_ids = id_list(data, 'book_ids')
+    if data.get('user_id') is not None and data['user_id'] != user_id:
+        if session.get('role') != 'admin':
+            raise APIError('Only admins may borrow for another user', 403)
+        if not is_id(data['user_id']):
+            raise APIError('user_id must be an integer')
+        user_id = data['user_id']
+
+    try:
+        results = borrow_books(mysql.connection, user_id, book_ids,
+                               max_batch=current_app.config.get('CIRCULATION_MAX_BATCH', 50))
+    except BatchTooLarge as e:
+        raise APIError(str(e), 413)
+    except ValueError as e:
+        raise APIError(str(e))
+    except MySQLdb.MySQLError as e:
+        raise APIError(f'Could not borrow books: {e.args[-1]}', 409)
+    issued = [r['book_id'] for r in results if r['status'] == 'issued']
+    availability.invalidate(*issued)
+    mysql.stick_to_primary()
+    announce(issued, user_id, 'borrowed')
+    return {'data': results, 'issued': sum(1 for r in results if r['status'] == 'issued')}
+
+
+@api.route('/returns/batch', methods=['POST'])
+def create_returns():
+    # Members can only return their own loans; admins can return any
+    user_id = current_user_id()
+    data = request.get_json(silent=True) or {}
+    transaction_ids = id_list(data, 'transaction_ids')
+
+    admin = session.get('role') == 'admin'
+    allocated = []
+    try:
+        results = return_books(mysql.connection, transaction_ids,
+                               user_id=None if admin else user_id,
+                               fine_per_day=current_app.config.get('FINE_PER_DAY', 1.00),
+                               max_batch=current_app.config.get('CIRCULATION_MAX_BATCH', 50),
+                               allocated=allocated)
+    except BatchTooLarge as e:
+        raise APIError(str(e), 413)
+    except ValueError as e:
+        raise APIError(str(e))
+    except MySQLdb.MySQLError as e:
+        raise APIError(f'Could not return books: {e.args[-1]}', 409)
+    returned = sorted({r['book_id'] for r in results if r['status'] == 'returned'})
+    availability.invalidate(*returned)
+    mysql.stick_to_primary()
+    # An admin's batch can span members, so only the stock is announced then
+    announce(returned, None if admin else user_id, 'returned', allocated)
+    return {'data': [_json_row(r) for r in results],
+            'returned': sum(1 for r in results if r['status'] == 'returned')}
+
+
+@api.route('/me/holds')
+@mysql.read_only
+def list_holds():
+    # Open holds with their place in line: one range scan of idx_holds_user
+    # plus a count over uq_holds_queue per waiting hold. Poll this instead
+    # of the catalog while waiting for a copy.
+    user_id = current_user_id()
+    return {'data': [_json_row(row) for row in holds.for_user(mysql.connection, user_id)]}
+
+
+@api.route('/holds', methods=['POST'])
+def create_hold():
+    user_id = current_user_id()
+    data = request.get_json(silent=True) or {}
+    book_id = data.get('book_id')
+    if not is_id(book_id):
+        raise APIError('book_id (integer) is required')
+    try:
+        hold_id = place_hold(mysql.connection, user_id, book_id)
+    except HoldError as e:
+        raise APIError(str(e), 409)
+    mysql.stick_to_primary()
+    announce([book_id], user_id, 'hold_placed')
+    return {'data': {'hold_id': hold_id, 'book_id': book_id, 'status': 'waiting'}}, 201
+
+
+@api.route('/holds/<int:hold_id>/cancel', methods=['POST'])
+def cancel_hold_route(hold_id):
+    user_id = current_user_id()
+    book_id = cancel_hold(mysql.connection, user_id, hold_id)
+    if book_id is None:
+        raise APIError('Hold not found', 404)
+    # A cancelled ready hold passes its copy on or puts it back in stock
+    availability.invalidate(book_id)
+    mysql.stick_to_primary()
+    announce([book_id], user_id, 'hold_cancelled')
+    return {'data': {'hold_id': hold_id, 'book_id': book_id, 'status': 'cancelled'}}
@@ -0,0 +1,272 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional, only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+
+class MemoryCache:
+    """Per-process TTL + LRU cache with tag-based invalidation."""
+
+    def __init__(self, max_entries=10000, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None, tags=()):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._stats['sets'] += 1
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def set_many(self, mapping, ttl=None):
+        for key, value in mapping.items():
+            self.set(key, value, ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def invalidate_tag(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.pop(tag, ())):
+                    if key in self._data:
+                        self._remove(key)
+                        self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend='memory', entries=len(self._data), max_entries=self.max_entries)
+
+    def _remove(self, key):
+        # Called with the lock held
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisCache:
+    """Shared cache on a local Redis-compatible server.
+
+    Values are pickled, so point it only at a server this app owns. Tags are
+    Redis sets of member keys. Hit/miss counters are per process; evictions
+    come from the server's own INFO stats.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', default_ttl=300, prefix='library:'):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        raw = self.client.mget([self.prefix + key for key in keys])
+        found = {key: pickle.loads(value) for key, value in zip(keys, raw) if value is not None}
+        with self._lock:
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(keys) - len(found)
+        return found
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = ttl or self.default_ttl
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, ttl * 2)
+        pipe.execute()
+        with self._lock:
+            self._stats['sets'] += 1
+
+    def set_many(self, mapping, ttl=None):
+        pipe = self.client.pipeline()
+        for key, value in mapping.items():
+            pipe.set(self.prefix + key, pickle.dumps(value), ex=ttl or self.default_ttl)
+        pipe.execute()
+        with self._lock:
+            self._stats['sets'] += len(mapping)
+
+    def delete(self, *keys):
+        if keys:
+            removed = self.client.delete(*[self.prefix + key for key in keys])
+            with self._lock:
+                self._stats['invalidations'] += removed
+
+    def invalidate_tag(self, *tags):
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            members = [member.decode() for member in self.client.smembers(tag_key)]
+            self.client.delete(tag_key)
+            self.delete(*members)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, backend='redis')
+        stats['evictions'] = self.client.info('stats').get('evicted_keys', 0)
+        return stats
+
+
+class Cache:
+    """Facade over the configured backend, set up like the MySQL shim."""
+
+    def __init__(self, app=None):
+        self.backend = MemoryCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        if app.config.get('CACHE_BACKEND', 'memory') == 'redis':
+            self.backend = RedisCache(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'), ttl)
+        else:
+            self.backend = MemoryCache(app.config.get('CACHE_MAX_ENTRIES', 10000), ttl)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None, tags=()):
+        self.backend.set(key, value, ttl, tags)
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        # Read-through: `loader` runs only on a miss. `tags` may be a callable
+        # deriving tags from the loaded value.
+        value = self.backend.get(key)
+        if value is None:
+            value = loader()
+            self.backend.set(key, value, ttl, tags(value) if callable(tags) else tags)
+        return value
+
+    def invalidate(self, *tags):
+        self.backend.invalidate_tag(*tags)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class AvailabilityCache:
+    """Small counter cache for books.available_copies.
+
+    Cached catalog pages and book details keep their metadata for minutes;
+    stock is overlaid from here on every render and invalidated per book by
+    the borrow and return paths, so it never lags behind the cached page.
+    """
+
+    def __init__(self, cache, ttl=30):
+        self.cache = cache
+        self.ttl = ttl
+
+    def init_app(self, app):
+        self.ttl = app.config.get('AVAILABILITY_CACHE_TTL', self.ttl)
+
+    def get_many(self, connection, book_ids):
+        # `connection` may also be a zero-argument callable returning one, so
+        # that nothing is checked out when every count is cached
+        counts, missing = self.cached(book_ids)
+        if missing:
+            if callable(connection):
+                connection = connection()
+            cursor = connection.cursor()
+            cursor.execute(*self.lookup(missing))
+            counts.update(self.store(cursor.fetchall()))
+            cursor.close()
+        return counts
+
+    def overlay(self, connection, books):
+        return self.apply(books, self.get_many(connection, [book['book_id'] for book in books]))
+
+    # The I/O-free halves of get_many/overlay, shared with the async app
+
+    def cached(self, book_ids):
+        # Returns ({book_id: count} for hits, [book_ids] still to look up)
+        keys = {f'avail:{book_id}': book_id for book_id in book_ids}
+        found = self.cache.backend.get_many(keys)
+        counts = {keys[key]: value for key, value in found.items()}
+        return counts, [book_id for book_id in book_ids if book_id not in counts]
+
+    def lookup(self, book_ids):
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        return (f"SELECT book_id, available_copies FROM books WHERE book_id IN ({placeholders})",
+                tuple(book_ids))
+
+    def store(self, rows):
+        fresh = {row['book_id']: row['available_copies'] for row in rows}
+        self.cache.backend.set_many({f'avail:{book_id}': count for book_id, count in fresh.items()}, self.ttl)
+        return fresh
+
+    def apply(self, books, counts):
+        # Copies, so cached rows are never mutated in place
+        return [dict(book, available_copies=counts.get(book['book_id'], book['available_copies'])) for book in books]
+
+    def invalidate(self, *book_ids):
+        self.cache.backend.delete(*[f'avail:{book_id}' for book_id in book_ids])
+
+
+cache = Cache()
+availability = AvailabilityCache(cache)
@@ -0,0 +1,293 @@
+import asyncio
+import random
+import time
+
+import MySQLdb
+
+from app.holds import holds
+
+# Lock wait timeout, deadlock: InnoDB rolled the statement (or transaction)
+# back and the same work can simply be tried again
+RETRYABLE_ERRORS = {1205, 1213}
+
+
+class RetryPolicy:
+    """Runs a unit of work in a transaction, retrying lock conflicts.
+
+    Retries back off exponentially with jitter so contending sessions don't
+    collide again in lockstep. Configured like the MySQL shim.
+    """
+
+    def __init__(self, attempts=4, backoff=0.02):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.retries = 0
+
+    def init_app(self, app):
+        self.attempts = app.config.get('DB_RETRY_ATTEMPTS', self.attempts)
+        self.backoff = app.config.get('DB_RETRY_BACKOFF', self.backoff)
+
+    def run(self, connection, work):
+        for attempt in range(1, self.attempts + 1):
+            cursor = connection.cursor()
+            try:
+                result = work(cursor)
+                connection.commit()
+                return result
+            except MySQLdb.OperationalError as e:
+                connection.rollback()
+                if e.args[0] not in RETRYABLE_ERRORS or attempt == self.attempts:
+                    raise
+                self.retries += 1
+                time.sleep(self.delay(attempt))
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    async def run_async(self, connection, work):
+        # Same policy for aiomysql connections; `work` is a coroutine function
+        for attempt in range(1, self.attempts + 1):
+            cursor = await connection.cursor()
+            try:
+                result = await work(cursor)
+                await connection.commit()
+                return result
+            except MySQLdb.OperationalError as e:
+                await connection.rollback()
+                if e.args[0] not in RETRYABLE_ERRORS or attempt == self.attempts:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.delay(attempt))
+            except Exception:
+                await connection.rollback()
+                raise
+            finally:
+                await cursor.close()
+
+    def delay(self, attempt):
+        # Exponential backoff with jitter
+        return self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+
+retry = RetryPolicy()
+
+
+# A loan for a copy the user already holds: same dates as issue_book, no stock change
+ISSUE_HELD_QUERY = """
+    INSERT INTO transactions (user_id, book_id, borrow_date, due_date)
+    VALUES (%s, %s, CURRENT_DATE, DATE_ADD(CURRENT_DATE, INTERVAL 14 DAY))
+"""
+
+LAST_LOAN_QUERY = "SELECT LAST_INSERT_ID() AS transaction_id"
+
+# Held for the whole borrow, taken before any holds row
+LOCK_BOOK_QUERY = "SELECT book_id FROM books WHERE book_id = %s FOR UPDATE"
+
+
+def borrow_book(connection, user_id, book_id):
+    # Returns the new loan's transaction_id. A ready hold's reserved copy is
+    # issued first. Otherwise issue_book raises 'Book not available'
+    # (SQLSTATE 45000) when no copy is left.
+    def work(cursor):
+        # Book row before holds rows, the order HoldQueue documents and
+        # borrow_books follows; the other order deadlocks against returns
+        cursor.execute(LOCK_BOOK_QUERY, (book_id,))
+        if holds.claim(cursor, user_id, [book_id]):
+            cursor.execute(ISSUE_HELD_QUERY, (user_id, book_id))
+            return cursor.lastrowid
+        cursor.callproc('issue_book', (user_id, book_id))
+        # The procedure's INSERT sets this session's LAST_INSERT_ID()
+        cursor.execute(LAST_LOAN_QUERY)
+        return cursor.fetchone()['transaction_id']
+    return retry.run(connection, work)
+
+
+def return_book(connection, transaction_id, allocated=None):
+    # Returns the loan's (book_id, user_id), or None for an unknown
+    # transaction. Returning an already returned loan is a no-op. The copy goes to the
+    # first waiting hold, if any, in the same transaction; pass a list as
+    # `allocated` to get that hold back as a {'hold_id', 'user_id', 'book_id'} row.
+    def work(cursor):
+        cursor.execute("SELECT book_id, user_id, status FROM transactions WHERE transaction_id = %s",
+                       (transaction_id,))
+        loan = cursor.fetchone()
+        cursor.callproc('return_book', (transaction_id,))
+        if loan is None:
+            return None
+        ready = holds.allocate(cursor, loan['book_id']) if loan['status'] == 'issued' else []
+        if allocated is not None:
+            allocated[:] = [dict(row, book_id=loan['book_id']) for row in ready]
+        return loan['book_id'], loan['user_id']
+    return retry.run(connection, work)
+
+
+def place_hold(connection, user_id, book_id):
+    # Raises HoldError with a user-facing reason
+    return retry.run(connection, lambda cursor: holds.place(cursor, user_id, book_id))
+
+
+def cancel_hold(connection, user_id, hold_id):
+    return retry.run(connection, lambda cursor: holds.cancel(cursor, user_id, hold_id))
+
+
+async def borrow_book_async(connection, user_id, book_id):
+    async def work(cursor):
+        await cursor.execute(LOCK_BOOK_QUERY, (book_id,))
+        if await holds.claim_async(cursor, user_id, book_id):
+            await cursor.execute(ISSUE_HELD_QUERY, (user_id, book_id))
+        else:
+            await cursor.callproc('issue_book', (user_id, book_id))
+    await retry.run_async(connection, work)
+
+
+async def return_book_async(connection, transaction_id, allocated=None):
+    async def work(cursor):
+        await cursor.execute("SELECT book_id, user_id, status FROM transactions WHERE transaction_id = %s",
+                             (transaction_id,))
+        loan = await cursor.fetchone()
+        await cursor.callproc('return_book', (transaction_id,))
+        if loan is None:
+            return None
+        ready = await holds.allocate_async(cursor, loan['book_id']) if loan['status'] == 'issued' else []
+        if allocated is not None:
+            allocated[:] = [dict(row, book_id=loan['book_id']) for row in ready]
+        return loan['book_id'], loan['user_id']
+    return await retry.run_async(connection, work)
+
+
+class BatchTooLarge(ValueError):
+    """Raised when a batch has more items than the configured maximum."""
+
+
+def _check_batch(items, max_batch):
+    if not items:
+        raise ValueError('Empty batch')
+    if len(items) > max_batch:
+        raise BatchTooLarge(f'At most {max_batch} items per batch, got {len(items)}')
+
+
+def _adjust_stock(cursor, deltas):
+    # One UPDATE for the whole batch: available_copies + delta per book
+    book_ids = sorted(deltas)
+    cases = ' '.join(['WHEN %s THEN %s'] * len(book_ids))
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    params = [value for book_id in book_ids for value in (book_id, deltas[book_id])]
+    cursor.execute(f"UPDATE books SET available_copies = available_copies + CASE book_id {cases} END "
+                   f"WHERE book_id IN ({placeholders})", tuple(params + book_ids))
+
+
+def borrow_books(connection, user_id, book_ids, max_batch=50):
+    """Issue several books to one user in a single transaction.
+
+    Returns one result per requested id, in request order, with status
+    'issued' (and the new transaction_id), 'unavailable', 'not_found' or
+    'duplicate'. Books that can't be issued don't fail the others.
+    """
+    _check_batch(book_ids, max_batch)
+    wanted = sorted(set(book_ids))
+
+    def work(cursor):
+        results = {}
+        placeholders = ', '.join(['%s'] * len(wanted))
+        # Lock in primary key order so concurrent batches can't deadlock on each other
+        cursor.execute(f"SELECT book_id, available_copies FROM books WHERE book_id IN ({placeholders}) "
+                       f"ORDER BY book_id FOR UPDATE", tuple(wanted))
+        stock = {row['book_id']: row['available_copies'] for row in cursor.fetchall()}
+        # Books the user holds a ready copy of are already out of stock
+        held = holds.claim(cursor, user_id, [book_id for book_id in wanted if book_id in stock])
+        granted = [book_id for book_id in wanted if book_id in held or stock.get(book_id, 0) > 0]
+        for book_id in wanted:
+            if book_id not in stock:
+                results[book_id] = {'status': 'not_found'}
+            elif book_id not in granted:
+                results[book_id] = {'status': 'unavailable'}
+
+        if granted:
+            taken = {book_id: -1 for book_id in granted if book_id not in held}
+            if taken:
+                _adjust_stock(cursor, taken)
+            # Same dates as issue_book, in one multi-row INSERT
+            values = ', '.join(['(%s, %s, CURRENT_DATE, DATE_ADD(CURRENT_DATE, INTERVAL 14 DAY))'] * len(granted))
+            cursor.execute(f"INSERT INTO transactions (user_id, book_id, borrow_date, due_date) VALUES {values}",
+                           tuple(value for book_id in granted for value in (user_id, book_id)))
+            placeholders = ', '.join(['%s'] * len(granted))
+            cursor.execute(f"SELECT transaction_id, book_id FROM transactions "
+                           f"WHERE transaction_id >= %s AND user_id = %s AND book_id IN ({placeholders})",
+                           (cursor.lastrowid, user_id) + tuple(granted))
+            for row in cursor.fetchall():
+                results[row['book_id']] = {'status': 'issued', 'transaction_id': row['transaction_id']}
+        return results
+
+    results = retry.run(connection, work)
+    out, seen = [], set()
+    for book_id in book_ids:
+        out.append(dict(results[book_id], book_id=book_id) if book_id not in seen
+                   else {'book_id': book_id, 'status': 'duplicate'})
+        seen.add(book_id)
+    return out
+
+
+def return_books(connection, transaction_ids, user_id=None, fine_per_day=1.00, max_batch=50, allocated=None):
+    """Return several loans in a single transaction.
+
+    With `user_id`, only that user's loans are returned (others report
+    'not_found'). Returns one result per requested id with status
+    'returned', 'already_returned', 'not_found' or 'duplicate'; returned
+    items carry their book_id and fine. Fines and hold allocation follow
+    return_book.
+    """
+    _check_batch(transaction_ids, max_batch)
+    wanted = sorted(set(transaction_ids))
+
+    def work(cursor):
+        placeholders = ', '.join(['%s'] * len(wanted))
+        cursor.execute(f"SELECT transaction_id, user_id, book_id, status FROM transactions "
+                       f"WHERE transaction_id IN ({placeholders}) ORDER BY transaction_id FOR UPDATE",
+                       tuple(wanted))
+        loans = {row['transaction_id']: row for row in cursor.fetchall()
+                 if user_id is None or row['user_id'] == user_id}
+        results = {}
+        open_loans = []
+        for transaction_id in wanted:
+            loan = loans.get(transaction_id)
+            if loan is None:
+                results[transaction_id] = {'status': 'not_found'}
+            elif loan['status'] != 'issued':
+                results[transaction_id] = {'status': 'already_returned', 'book_id': loan['book_id']}
+            else:
+                open_loans.append(transaction_id)
+
+        if open_loans:
+            placeholders = ', '.join(['%s'] * len(open_loans))
+            cursor.execute(f"""
+                UPDATE transactions
+                SET return_date = CURRENT_DATE,
+                    fine_amount = GREATEST(DATEDIFF(CURRENT_DATE, due_date), 0) * %s,
+                    status = 'returned'
+                WHERE transaction_id IN ({placeholders}) AND status = 'issued'
+            """, (fine_per_day,) + tuple(open_loans))
+            deltas = {}
+            for transaction_id in open_loans:
+                book_id = loans[transaction_id]['book_id']
+                deltas[book_id] = deltas.get(book_id, 0) + 1
+            _adjust_stock(cursor, deltas)
+            ready = [dict(row, book_id=book_id) for book_id in sorted(deltas)
+                     for row in holds.allocate(cursor, book_id)]
+            if allocated is not None:
+                allocated[:] = ready
+            cursor.execute(f"SELECT transaction_id, book_id, fine_amount FROM transactions "
+                           f"WHERE transaction_id IN ({placeholders})", tuple(open_loans))
+            for row in cursor.fetchall():
+                results[row['transaction_id']] = {'status': 'returned', 'book_id': row['book_id'],
+                                                  'fine_amount': row['fine_amount']}
+        return results
+
+    results = retry.run(connection, work)
+    out, seen = [], set()
+    for transaction_id in transaction_ids:
+        out.append(dict(results[transaction_id], transaction_id=transaction_id) if transaction_id not in seen
+                   else {'transaction_id': transaction_id, 'status': 'duplicate'})
+        seen.add(transaction_id)
+    return out
@@ -0,0 +1,325 @@
+import contextlib
+import functools
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it every size is the original
+    Image = None
+
+# Bounding boxes (2x the CSS sizes for high-density screens). Thumbnails keep
+# the source's aspect ratio.
+SIZES = {
+    'card': (480, 640),   # .card-image, 320px tall
+    'confirm': (200, 300),  # .confirm-thumb, 100x150
+    'thumb': (80, 120),   # .mini-thumb, 40x60
+    'original': None,
+}
+
+MAGIC = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+]
+
+
+class CoverUnavailable(Exception):
+    """Raised when a cover can't be fetched or decoded."""
+
+
+# Remembered failed URLs; past this the oldest are forgotten first
+MAX_FAILURES = 10000
+
+
+def check_url(url, allowed_hosts=()):
+    """Raise CoverUnavailable unless `url` is http(s) on a public address.
+
+    image_url comes from the catalog, so without this a cover request could
+    read local files or reach hosts on the internal network. Hosts in
+    `allowed_hosts` (names, addresses or networks like '10.0.0.0/8') may be
+    private, e.g. an internal image server.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise CoverUnavailable(f'{url} is not an http(s) URL')
+    host = parts.hostname
+    if host in allowed_hosts:
+        return
+    try:
+        infos = socket.getaddrinfo(host, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise CoverUnavailable(f'Could not resolve {host}: {e}') from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if any(address in network for network in _networks(allowed_hosts)):
+            continue
+        if not address.is_global or address.is_multicast:
+            raise CoverUnavailable(f'{host} resolves to a non-public address ({address})')
+
+
+def _networks(allowed_hosts):
+    networks = []
+    for entry in allowed_hosts:
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            pass  # a host name
+    return networks
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    # Redirects get the same check, or an origin could bounce us inward
+    def __init__(self, allowed_hosts):
+        self.allowed_hosts = allowed_hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl, self.allowed_hosts)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def http_fetch(url, timeout=10, max_bytes=5 * 1024 * 1024, allowed_hosts=()):
+    # Default origin fetcher; any callable (url) -> bytes can replace it
+    check_url(url, allowed_hosts)
+    opener = urllib.request.build_opener(_CheckedRedirects(allowed_hosts))
+    request = urllib.request.Request(url, headers={'User-Agent': 'Librarysis cover proxy'})
+    with opener.open(request, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise CoverUnavailable(f'{url} is larger than {max_bytes} bytes')
+    return data
+
+
+class CoverCache:
+    """Content-addressed on-disk cache of cover images and their thumbnails.
+
+    Each source URL is fetched once. Its bytes are stored under their SHA-256
+    (`objects/ab/abcd...`) and the URL maps to that digest through a small
+    file under `urls/`, so books sharing a placeholder share one object.
+    Thumbnails are stored beside their source as `<digest>-<size>.jpg`.
+    Objects are evicted least recently used first once the cache is larger
+    than `max_bytes`. Configured like the MySQL shim.
+    """
+
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024, fetcher=http_fetch, failure_ttl=300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = None  # path -> [bytes, last access], built on first use
+        self._total = 0
+        self._failures = {}
+        self.stats = {'hits': 0, 'fetches': 0, 'resizes': 0, 'evictions': 0, 'failures': 0}
+
+    def init_app(self, app):
+        self.directory = app.config.get('COVER_CACHE_DIR') or os.path.join(app.instance_path, 'covers')
+        self.max_bytes = app.config.get('COVER_CACHE_MAX_BYTES', self.max_bytes)
+        self.fetcher = app.config.get('COVER_FETCHER') or functools.partial(
+            http_fetch, allowed_hosts=frozenset(app.config.get('COVER_ALLOWED_HOSTS') or ()))
+        self._entries = None
+
+    @staticmethod
+    def version(url):
+        # Short tag for ?v= in cover URLs; changes whenever image_url does
+        return hashlib.sha1((url or '').encode()).hexdigest()[:10]
+
+    def get(self, url, size):
+        """Path of the cover for `url` at `size`, fetching and resizing as needed."""
+        if size not in SIZES:
+            raise KeyError(size)
+        if not url:
+            raise CoverUnavailable('Book has no image_url')
+
+        digest = self._digest(url)
+        if size == 'original' or Image is None:
+            return self._touch(self._object_path(digest))
+
+        path = self._object_path(digest, size)
+        if os.path.exists(path):
+            return self._touch(path)
+        with self._key_lock(path):
+            if not os.path.exists(path):
+                self._write(path, self._resize(self._read(self._object_path(digest), url), SIZES[size]))
+                self.stats['resizes'] += 1
+        return self._touch(path)
+
+    @staticmethod
+    def mimetype(path):
+        # Objects are stored without an extension, so sniff the magic bytes.
+        # Anything else (SVG included, which can carry script) is served as
+        # an opaque download rather than rendered from our origin.
+        with open(path, 'rb') as f:
+            head = f.read(12)
+        for magic, mimetype in MAGIC:
+            if head.startswith(magic):
+                return mimetype
+        if head[8:12] == b'WEBP':
+            return 'image/webp'
+        return 'application/octet-stream'
+
+    def _digest(self, url):
+        url_path = os.path.join(self.directory, 'urls', hashlib.sha1(url.encode()).hexdigest())
+        digest = self._read_text(url_path)
+        if digest and os.path.exists(self._object_path(digest)):
+            self.stats['hits'] += 1
+            return digest
+
+        with self._key_lock(url_path):
+            # Another thread may have fetched it while we waited
+            digest = self._read_text(url_path)
+            if digest and os.path.exists(self._object_path(digest)):
+                return digest
+            with self._lock:
+                failed_at = self._failures.get(url)
+            if failed_at and time.monotonic() - failed_at < self.failure_ttl:
+                raise CoverUnavailable(f'{url} failed recently')
+            try:
+                data = self.fetcher(url)
+                if Image is not None:
+                    Image.open(io.BytesIO(data)).verify()
+            except Exception as e:
+                self._failed(url)
+                self.stats['failures'] += 1
+                raise CoverUnavailable(f'Could not fetch {url}: {e}') from e
+            with self._lock:
+                self._failures.pop(url, None)
+            self.stats['fetches'] += 1
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                self._write(path, data)
+            self._write(url_path, digest.encode(), track=False)
+            return digest
+
+    def _object_path(self, digest, size=None):
+        name = digest if size is None else f'{digest}-{size}.jpg'
+        return os.path.join(self.directory, 'objects', digest[:2], name)
+
+    def _resize(self, data, box):
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(box, Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def _read(self, path, url):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted between lookup and read; fetch it again
+            return self._read(self._object_path(self._digest(url)), url)
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, data, track=True):
+        # Write-then-rename so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if track:
+            with self._lock:
+                self._index()
+                old = self._entries.get(path)
+                self._total += len(data) - (old[0] if old else 0)
+                self._entries[path] = [len(data), time.time()]
+            self._evict()
+
+    def _touch(self, path):
+        with self._lock:
+            entry = self._index().get(path)
+            if entry is not None:
+                entry[1] = time.time()
+        return path
+
+    def _index(self):
+        # Called with the lock held. Rebuilt from disk once per process, with
+        # mtime standing in for last access.
+        if self._entries is None:
+            self._entries, self._total = {}, 0
+            root = os.path.join(self.directory, 'objects')
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    self._entries[path] = [st.st_size, st.st_mtime]
+                    self._total += st.st_size
+        return self._entries
+
+    def _evict(self):
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            # Down to 90% so eviction doesn't run on every write at the limit
+            target = self.max_bytes * 0.9
+            for path, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+                if self._total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del self._entries[path]
+                self._total -= size
+                self.stats['evictions'] += 1
+
+    def _failed(self, url):
+        # Oldest first: re-inserting moves a URL to the end
+        now = time.monotonic()
+        with self._lock:
+            self._failures.pop(url, None)
+            self._failures[url] = now
+            while self._failures:
+                oldest = next(iter(self._failures))
+                if len(self._failures) <= MAX_FAILURES and now - self._failures[oldest] < self.failure_ttl:
+                    break
+                del self._failures[oldest]
+
+    @contextlib.contextmanager
+    def _key_lock(self, key):
+        # One lock per key while anyone holds or waits for it; dropped after
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def usage(self):
+        with self._lock:
+            self._index()
+            return dict(self.stats, bytes=self._total, max_bytes=self.max_bytes, objects=len(self._entries))
+
+
+covers = CoverCache()
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+try:
+    import redis
+except ImportError:  # optional, only needed for EVENTS_BACKEND = 'redis'
+    redis = None
+
+log = logging.getLogger(__name__)
+
+# Sent instead of the buffered events when a subscriber fell too far behind
+RESYNC = {'type': 'resync'}
+
+
+class EventsBusy(Exception):
+    """Raised when this process already streams to EVENTS_MAX_SUBSCRIBERS clients."""
+
+
+class Subscriber:
+    """The buffer behind one event stream.
+
+    Every event has a key naming what it describes ('book:12'), and a newer
+    event replaces an undelivered one with the same key, so a slow client
+    gets the latest state rather than every step. If more than `max_pending`
+    keys are waiting, the buffer is dropped and the stream ends with a
+    'resync' event telling the client to reload. Publishers never wait on a
+    slow client.
+
+    Consumers wait with `wait` from a thread or `wait_async` from an event
+    loop; publishers may call `put` from any thread.
+    """
+
+    def __init__(self, topics, max_pending=100):
+        self.topics = frozenset(topics)
+        self.max_pending = max_pending
+        self.overflowed = False
+        self.closed = False
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._loop = None
+        self._wakeup = None
+
+    def attach_loop(self, loop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def put(self, key, event):
+        # Returns False once the subscriber has overflowed or closed
+        with self._cond:
+            if self.closed or self.overflowed:
+                return False
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self.overflowed = True
+                self._pending.clear()
+            else:
+                self._pending.pop(key, None)
+                self._pending[key] = event
+            self._cond.notify()
+        self._wake()
+        return not self.overflowed
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def drain(self):
+        # Buffered events, oldest first; [RESYNC] once overflowed
+        with self._cond:
+            if self.overflowed:
+                self.closed = True
+                return [RESYNC]
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def _idle(self):
+        with self._cond:
+            return not self._pending and not self.overflowed and not self.closed
+
+    def wait(self, timeout):
+        with self._cond:
+            if not self._pending and not self.overflowed and not self.closed:
+                self._cond.wait(timeout)
+        return self.drain()
+
+    async def wait_async(self, timeout):
+        # Clear before checking, so a put between the two still wakes us
+        self._wakeup.clear()
+        if self._idle():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.drain()
+
+
+class RedisRelay:
+    """Carries events between processes over one Redis pub/sub channel.
+
+    Every process publishes to the channel and, once it has a subscriber
+    of its own, runs one listener thread that hands what arrives to the
+    local broker. With EVENTS_BACKEND = 'memory', events reach only streams
+    served by the process that made the change.
+    """
+
+    def __init__(self, url, dispatch, channel='library:events'):
+        if redis is None:
+            raise RuntimeError("EVENTS_BACKEND = 'redis' needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.dispatch = dispatch
+        self.channel = channel
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, topic, key, event):
+        self.client.publish(self.channel, json.dumps([topic, key, event], default=str))
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-relay', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.dispatch(*json.loads(message['data']))
+            except Exception:
+                log.exception('events relay lost its Redis connection; reconnecting')
+                time.sleep(1)
+
+
+class EventBroker:
+    """Fans change events out to the open event streams.
+
+    Topics are 'book:<id>' (stock of one book), 'user:<id>' (one member's
+    loans and holds) and 'catalog' (titles added). Write paths publish after
+    they commit; /events subscribes a stream to the books on the client's
+    page plus its own user. Configured like the MySQL shim.
+    """
+
+    def __init__(self, max_subscribers=1000, max_pending=100, heartbeat=15, max_books=100):
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self.max_books = max_books
+        self.relay = None
+        self._topics = defaultdict(set)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'overflowed': 0, 'rejected': 0}
+
+    def init_app(self, app):
+        self.max_subscribers = app.config.get('EVENTS_MAX_SUBSCRIBERS', self.max_subscribers)
+        self.max_pending = app.config.get('EVENTS_MAX_PENDING', self.max_pending)
+        self.heartbeat = app.config.get('EVENTS_HEARTBEAT', self.heartbeat)
+        self.max_books = app.config.get('EVENTS_MAX_BOOKS', self.max_books)
+        if app.config.get('EVENTS_BACKEND', 'memory') == 'redis':
+            self.relay = RedisRelay(app.config.get('EVENTS_REDIS_URL') or
+                                    app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'), self._dispatch)
+        else:
+            self.relay = None
+
+    def subscribe(self, book_ids=(), user_id=None, catalog=False):
+        topics = [f'book:{book_id}' for book_id in book_ids]
+        if user_id is not None:
+            topics.append(f'user:{user_id}')
+        if catalog:
+            topics.append('catalog')
+        subscriber = Subscriber(topics, self.max_pending)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                raise EventsBusy(f'{len(self._subscribers)} event streams open')
+            self._subscribers.add(subscriber)
+            for topic in subscriber.topics:
+                self._topics[topic].add(subscriber)
+        if self.relay is not None:
+            self.relay.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+            for topic in subscriber.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def wants(self, topic):
+        # Lets publishers skip building events nobody here would receive;
+        # with Redis another process may be listening
+        return self.relay is not None or topic in self._topics
+
+    def publish(self, topic, key, event):
+        with self._lock:
+            self._stats['published'] += 1
+        if self.relay is not None:
+            try:
+                self.relay.publish(topic, key, event)
+                return
+            except Exception:
+                log.exception('could not publish event over Redis; delivering locally only')
+        self._dispatch(topic, key, event)
+
+    def _dispatch(self, topic, key, event):
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        delivered = overflowed = 0
+        for subscriber in subscribers:
+            already = subscriber.overflowed
+            if subscriber.put(key, event):
+                delivered += 1
+            elif subscriber.overflowed and not already:
+                overflowed += 1
+        with self._lock:
+            self._stats['delivered'] += delivered
+            self._stats['overflowed'] += overflowed
+
+    # What the write paths publish
+
+    def availability(self, counts):
+        # {book_id: available_copies} after a borrow, return or restock
+        for book_id, count in counts.items():
+            if count is None:
+                continue
+            self.publish(f'book:{book_id}', f'book:{book_id}',
+                         {'type': 'availability', 'book_id': book_id, 'available_copies': count})
+
+    def loans_changed(self, user_id, book_id, change):
+        # change: 'borrowed', 'returned', 'hold_placed', 'hold_cancelled', 'hold_ready'
+        self.publish(f'user:{user_id}', f'loans:{book_id}',
+                     {'type': 'loans', 'book_id': book_id, 'change': change})
+
+    def catalog_changed(self):
+        self.publish('catalog', 'catalog', {'type': 'catalog'})
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscribers), topics=len(self._topics),
+                        backend='redis' if self.relay is not None else 'memory')
+
+
+def format_sse(event):
+    # One Server-Sent Events message; clients listen per `type`
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+events = EventBroker()
@@ -0,0 +1,130 @@
+"""Streaming CSV/NDJSON exports for reporting.
+
+Rows come off an unbuffered (server-side) cursor `batch_size` at a time and
+are encoded and yielded as they arrive, so memory use doesn't depend on the
+table size. The connection is busy until the stream ends; a client that
+stops reading for longer than net_write_timeout makes MySQL drop the query,
+so the export raises that timeout for its session.
+"""
+import csv
+import datetime
+import decimal
+import io
+import json
+import zlib
+
+import MySQLdb.cursors
+
+TRANSACTION_EXPORT_QUERY = """
+    SELECT t.transaction_id, t.user_id, u.username, t.book_id, b.isbn, b.title,
+           t.borrow_date, t.due_date, t.return_date, t.fine_amount, t.status
+    FROM transactions t
+    JOIN users u ON t.user_id = u.user_id
+    JOIN books b ON t.book_id = b.book_id
+"""
+
+BOOK_EXPORT_QUERY = """
+    SELECT b.book_id, b.isbn, b.title, a.name AS author, c.name AS category, b.publication_year,
+           b.total_copies, b.available_copies, s.borrows_total, s.borrows_30d, b.updated_at
+    FROM books b
+    LEFT JOIN authors a ON b.author_id = a.author_id
+    LEFT JOIN categories c ON b.category_id = c.category_id
+    LEFT JOIN book_stats s ON s.book_id = b.book_id
+"""
+
+# name -> (query, date column the from/to filter applies to, ordering)
+EXPORTS = {
+    'transactions': (TRANSACTION_EXPORT_QUERY, 't.borrow_date', 't.transaction_id'),
+    'books': (BOOK_EXPORT_QUERY, 'b.updated_at', 'b.book_id'),
+}
+
+
+def export_query(name, start=None, end=None):
+    # `start` and `end` are inclusive dates
+    query, date_column, order = EXPORTS[name]
+    where, params = [], []
+    if start is not None:
+        where.append(f"{date_column} >= %s")
+        params.append(start)
+    if end is not None:
+        where.append(f"{date_column} < %s")
+        params.append(end + datetime.timedelta(days=1))
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query + f" ORDER BY {order}", tuple(params)
+
+
+def stream_rows(connection, query, params=(), batch_size=1000, net_write_timeout=600):
+    # The connection is pooled, so the longer write timeout is put back after
+    settings = connection.cursor(MySQLdb.cursors.Cursor)
+    settings.execute("SELECT @@SESSION.net_write_timeout")
+    previous = settings.fetchone()[0]
+    settings.execute("SET SESSION net_write_timeout = %s", (net_write_timeout,))
+    settings.close()
+    cursor = connection.cursor(MySQLdb.cursors.SSDictCursor)
+    done = False
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        done = True
+    finally:
+        if done:
+            cursor.close()
+            settings = connection.cursor(MySQLdb.cursors.Cursor)
+            settings.execute("SET SESSION net_write_timeout = %s", (previous,))
+            settings.close()
+        else:
+            # Abandoned mid-result (client went away). Closing the cursor
+            # would read off every remaining row; close the connection
+            # instead and let the pool discard it on checkin, setting and all.
+            connection.close()
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = False
+    for rows in batches:
+        if not header and rows:
+            writer.writerow(rows[0].keys())
+            header = True
+        for row in rows:
+            writer.writerow([_plain(value) for value in row.values()])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode_ndjson(batches):
+    for rows in batches:
+        yield ''.join(json.dumps({key: _plain(value) for key, value in row.items()}) + '\n'
+                      for row in rows).encode()
+
+
+def gzip_stream(chunks, level=6):
+    # One gzip member across the whole stream; each chunk is flushed so the
+    # client keeps receiving data instead of waiting for zlib's window to fill
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'csv': (encode_csv, 'text/csv'),
+    'ndjson': (encode_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,62 @@
+import os
+import threading
+
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from app.cache import cache
+
+
+class FragmentCache:
+    """Rendered-HTML cache for per-row template fragments, plus Jinja's
+    bytecode cache.
+
+    Templates wrap a repeated block in `{% call fragment(name, *key) %}`.
+    The key must hold everything the block shows that can change: the row's
+    updated_at (0007_change_versions.sql) plus any value overlaid after the
+    row was cached, such as available_copies. A write bumps updated_at, so
+    the next render misses and the stale entry ages out with its TTL.
+    Fragments live in the shared read-through cache (app/cache.py).
+    Configured like the MySQL shim.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.ttl = 600
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL', self.ttl)
+        app.jinja_env.globals['fragment'] = self.render
+
+        # Compiled templates survive restarts, so a cold worker skips the
+        # parse/compile step on its first render of each template
+        directory = app.config.get('TEMPLATE_BYTECODE_DIR')
+        if directory is None:
+            directory = os.path.join(app.instance_path, 'jinja-bytecode')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    def render(self, name, *key, caller):
+        if not self.enabled:
+            return caller()
+        cache_key = 'frag:' + name + ':' + ':'.join(str(part) for part in key)
+        html = cache.get(cache_key)
+        with self._lock:
+            self._stats['hits' if html is not None else 'misses'] += 1
+        if html is None:
+            html = str(caller())
+            cache.set(cache_key, html, self.ttl)
+        return Markup(html)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+fragments = FragmentCache()
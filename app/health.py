@@ -0,0 +1,123 @@
+import logging
+import time
+
+import MySQLdb
+
+from app import migrations
+from app.pool import PoolTimeout
+from app.search import search_index
+
+log = logging.getLogger(__name__)
+
+
+class Health:
+    """Liveness and readiness probes, and the optional warm-up at startup.
+
+    /healthz answers whenever the process can serve a request and touches
+    nothing else. /readyz also checks that the primary answers and that no
+    migration is pending, and returns 503 with the failing checks otherwise.
+    A pool with every connection in use counts as busy, not down. Once the
+    migrations are found current they aren't checked again by this process.
+
+    With PRELOAD set, `preload` runs at the end of create_app: it opens every
+    pool connection, loads the search index and compiles every template, so
+    the first requests don't pay for them. Configured like the MySQL shim;
+    create_app hands it the pools.
+    """
+
+    def __init__(self, app=None):
+        self.pools = []
+        self.db_timeout = 2.0
+        self.migrations_current = False
+        self.preloaded = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.db_timeout = app.config.get('READYZ_DB_TIMEOUT', self.db_timeout)
+        app.add_url_rule('/healthz', 'healthz', self.healthz)
+        app.add_url_rule('/readyz', 'readyz', self.readyz)
+
+    def healthz(self):
+        return {'status': 'ok'}
+
+    def readyz(self):
+        checks = {'database': 'ok', 'migrations': 'ok'}
+        pool = self.pools[0]
+        try:
+            conn = pool.checkout(self.db_timeout)
+        except PoolTimeout:
+            # Every connection is serving requests: busy, not down. Failing
+            # here would pull all busy workers out at once.
+            checks['database'] = 'busy'
+            checks['migrations'] = 'ok' if self.migrations_current else 'unknown'
+        except Exception as e:
+            checks['database'] = f'unreachable: {e}'
+            checks['migrations'] = 'unknown'
+        else:
+            error = None
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+            except MySQLdb.MySQLError as e:
+                error = e
+                checks['database'] = f'error: {e}'
+                checks['migrations'] = 'unknown'
+            else:
+                try:
+                    checks['migrations'] = self._migrations(conn)
+                except Exception as e:
+                    error = e
+                    checks['migrations'] = f'error: {e}'
+            finally:
+                pool.checkin(conn, discard=isinstance(error, MySQLdb.MySQLError))
+
+        ready = checks['database'] in ('ok', 'busy') and checks['migrations'] in ('ok', 'unknown')
+        body = {'status': 'ready' if ready else 'not ready', 'checks': checks}
+        if self.preloaded is not None:
+            body['preloaded'] = self.preloaded
+        return body, 200 if ready else 503
+
+    def _migrations(self, conn):
+        if not self.migrations_current:
+            waiting = migrations.pending(conn)
+            if waiting:
+                return 'pending: ' + ', '.join(f'{version:04d}_{name}' for version, name, _ in waiting)
+            self.migrations_current = True
+        return 'ok'
+
+    def preload(self, app):
+        """Warm this process up; failures are logged, /readyz reports them."""
+        started = time.perf_counter()
+        opened = 0
+        for pool in self.pools:
+            try:
+                opened += pool.fill()
+            except Exception:
+                log.exception('preload: could not open pool connections')
+        try:
+            conn = self.pools[0].checkout()
+            try:
+                search_index.ensure_loaded(conn)
+            finally:
+                self.pools[0].checkin(conn)
+        except Exception:
+            log.exception('preload: could not load the search index')
+        templates = compile_templates(app)
+        self.preloaded = {'connections': opened, 'templates': templates, 'search_entries': len(search_index),
+                          'ms': round((time.perf_counter() - started) * 1000, 1)}
+        log.info('preloaded %s', self.preloaded)
+
+
+def compile_templates(app):
+    # Parse and compile every template into the environment's cache (and the
+    # bytecode cache, when one is configured); returns how many
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+health = Health()
@@ -0,0 +1,170 @@
+import MySQLdb.cursors
+
+
+class HoldError(ValueError):
+    """Raised when a hold can't be placed or cancelled; the message is user-facing."""
+
+
+# Next holders in line; a range scan of uq_holds_queue
+NEXT_IN_LINE = """
+    SELECT hold_id, user_id FROM holds
+    WHERE book_id = %s AND position IS NOT NULL
+    ORDER BY position LIMIT %s FOR UPDATE
+"""
+
+# A member's open holds with their place in the queue (1 = next)
+USER_HOLDS_QUERY = """
+    SELECT h.hold_id, h.book_id, b.title, b.image_url, h.status, h.created_at, h.expires_at,
+           IF(h.position IS NULL, NULL,
+              (SELECT COUNT(*) FROM holds q WHERE q.book_id = h.book_id AND q.position < h.position) + 1)
+               AS queue_position
+    FROM holds h
+    JOIN books b ON b.book_id = h.book_id
+    WHERE h.user_id = %s AND h.status IN ('waiting', 'ready')
+    ORDER BY h.created_at, h.hold_id
+"""
+
+
+class HoldQueue:
+    """FIFO hold queue per book, see 0009_holds.sql.
+
+    The helpers take a cursor and run inside the caller's transaction, so
+    a return and the hand-over of its copy commit together. Callers lock
+    the book row before the holds rows. Configured like the MySQL shim.
+    """
+
+    def __init__(self, pickup_hours=48, max_per_user=10):
+        self.pickup_hours = pickup_hours
+        self.max_per_user = max_per_user
+
+    def init_app(self, app):
+        self.pickup_hours = app.config.get('HOLD_PICKUP_HOURS', self.pickup_hours)
+        self.max_per_user = app.config.get('HOLD_MAX_PER_USER', self.max_per_user)
+
+    def place(self, cursor, user_id, book_id):
+        # Returns the new hold_id
+        cursor.execute("SELECT available_copies FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+        book = cursor.fetchone()
+        if book is None:
+            raise HoldError('Book not found')
+        if book['available_copies'] > 0:
+            raise HoldError('A copy is available; borrow it instead')
+        cursor.execute("SELECT book_id FROM holds WHERE user_id = %s AND status IN ('waiting', 'ready')",
+                       (user_id,))
+        open_holds = [row['book_id'] for row in cursor.fetchall()]
+        if book_id in open_holds:
+            raise HoldError('You already have a hold on this book')
+        if len(open_holds) >= self.max_per_user:
+            raise HoldError(f'At most {self.max_per_user} holds at a time')
+        # The book row lock serialises placements, so MAX + 1 can't collide
+        cursor.execute("""
+            INSERT INTO holds (book_id, user_id, position)
+            SELECT %s, %s, COALESCE(MAX(position), 0) + 1 FROM holds WHERE book_id = %s
+        """, (book_id, user_id, book_id))
+        return cursor.lastrowid
+
+    def cancel(self, cursor, user_id, hold_id):
+        # Returns the book_id, or None if the user has no open hold by that id.
+        # A ready hold's copy goes to the next in line.
+        cursor.execute("SELECT book_id FROM holds WHERE hold_id = %s AND user_id = %s", (hold_id, user_id))
+        hold = cursor.fetchone()
+        if hold is None:
+            return None
+        book_id = hold['book_id']
+        cursor.execute("SELECT book_id FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+        cursor.execute("SELECT status FROM holds WHERE hold_id = %s FOR UPDATE", (hold_id,))
+        status = cursor.fetchone()['status']
+        if status not in ('waiting', 'ready'):
+            return None
+        cursor.execute("UPDATE holds SET status = 'cancelled', position = NULL WHERE hold_id = %s", (hold_id,))
+        if status == 'ready':
+            cursor.execute("UPDATE books SET available_copies = available_copies + 1 WHERE book_id = %s",
+                           (book_id,))
+            self.allocate(cursor, book_id)
+        return book_id
+
+    def allocate(self, cursor, book_id):
+        """Hand available copies of `book_id` to the first waiting holds.
+
+        Call after a copy came back, in the same transaction. Returns the
+        holds made ready as {'hold_id', 'user_id'} rows.
+        """
+        cursor.execute("SELECT available_copies FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+        book = cursor.fetchone()
+        if book is None or book['available_copies'] <= 0:
+            return []
+        cursor.execute(NEXT_IN_LINE, (book_id, book['available_copies']))
+        ready = cursor.fetchall()
+        if ready:
+            cursor.execute("UPDATE books SET available_copies = available_copies - %s WHERE book_id = %s",
+                           (len(ready), book_id))
+            self._ready(cursor, [row['hold_id'] for row in ready])
+        return list(ready)
+
+    def _ready(self, cursor, hold_ids):
+        placeholders = ', '.join(['%s'] * len(hold_ids))
+        cursor.execute(f"""
+            UPDATE holds
+            SET status = 'ready', position = NULL, ready_at = NOW(), expires_at = NOW() + INTERVAL %s HOUR
+            WHERE hold_id IN ({placeholders})
+        """, (self.pickup_hours,) + tuple(hold_ids))
+
+    def claim(self, cursor, user_id, book_ids):
+        """Fulfil the user's ready holds on `book_ids`.
+
+        Returns the book_ids claimed. Their copies were taken out of stock
+        when the holds became ready, so the caller issues these without
+        touching available_copies.
+        """
+        if not book_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        cursor.execute(f"""
+            SELECT hold_id, book_id FROM holds
+            WHERE user_id = %s AND status = 'ready' AND expires_at >= NOW() AND book_id IN ({placeholders})
+            FOR UPDATE
+        """, (user_id,) + tuple(book_ids))
+        held = {row['book_id']: row['hold_id'] for row in cursor.fetchall()}
+        if held:
+            placeholders = ', '.join(['%s'] * len(held))
+            cursor.execute(f"UPDATE holds SET status = 'fulfilled' WHERE hold_id IN ({placeholders})",
+                           tuple(held.values()))
+        return sorted(held)
+
+    # Async twins for aiomysql cursors, same statements
+
+    async def allocate_async(self, cursor, book_id):
+        await cursor.execute("SELECT available_copies FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+        book = await cursor.fetchone()
+        if book is None or book['available_copies'] <= 0:
+            return []
+        await cursor.execute(NEXT_IN_LINE, (book_id, book['available_copies']))
+        ready = await cursor.fetchall()
+        if ready:
+            hold_ids = [row['hold_id'] for row in ready]
+            await cursor.execute("UPDATE books SET available_copies = available_copies - %s WHERE book_id = %s",
+                                 (len(hold_ids), book_id))
+            placeholders = ', '.join(['%s'] * len(hold_ids))
+            await cursor.execute(f"""
+                UPDATE holds
+                SET status = 'ready', position = NULL, ready_at = NOW(), expires_at = NOW() + INTERVAL %s HOUR
+                WHERE hold_id IN ({placeholders})
+            """, (self.pickup_hours,) + tuple(hold_ids))
+        return list(ready)
+
+    async def claim_async(self, cursor, user_id, book_id):
+        await cursor.execute("""
+            UPDATE holds SET status = 'fulfilled'
+            WHERE user_id = %s AND book_id = %s AND status = 'ready' AND expires_at >= NOW()
+        """, (user_id, book_id))
+        return cursor.rowcount == 1
+
+    def for_user(self, connection, user_id):
+        cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(USER_HOLDS_QUERY, (user_id,))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+
+holds = HoldQueue()
@@ -0,0 +1,317 @@
+import hmac
+import ipaddress
+import logging
+import re
+import threading
+import time
+
+from flask import g, request, Response, before_render_template, template_rendered, has_app_context
+
+slow_query_log = logging.getLogger('app.slow_queries')
+
+WHITESPACE_RE = re.compile(r'\s+')
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)', re.IGNORECASE)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Distinct normalized statements tracked in /metrics before new ones are folded
+# into a single "other" series
+MAX_STATEMENTS = 200
+
+
+def normalize_sql(sql):
+    # Statements are parameterized templates already; only the layout and
+    # IN-list length vary between executions of the same query
+    sql = sql.decode() if isinstance(sql, bytes) else sql
+    return IN_LIST_RE.sub('IN (...)', WHITESPACE_RE.sub(' ', sql).strip())
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total, n = self.series.get(labels) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.series[labels] = (counts, total + value, n + 1)
+
+    def render(self, name, label_names):
+        lines = []
+        for labels, (counts, total, n) in sorted(self.series.items()):
+            pairs = [f'{k}="{escape_label(v)}"' for k, v in zip(label_names, labels)]
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counts + [n]):
+                lines.append(name + '_bucket{' + ','.join(pairs + [f'le="{bound}"']) + '} ' + str(count))
+            suffix = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{name}_sum{suffix} {total}')
+            lines.append(f'{name}_count{suffix} {n}')
+        return lines
+
+
+class RequestStats:
+    """What one request (or app context) did against the database."""
+
+    __slots__ = ('queries', 'saved', 'db_time', 'slowest', 'checkout_time', 'render_time', '_render_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.saved = 0  # lookups answered from a cache instead of SQL
+        self.db_time = 0.0
+        self.slowest = []
+        self.checkout_time = 0.0
+        self.render_time = 0.0
+        self._render_started = None
+
+    def record(self, statement, elapsed, keep=5):
+        self.queries += 1
+        self.db_time += elapsed
+        self.slowest.append((elapsed, statement))
+        self.slowest.sort(reverse=True)
+        del self.slowest[keep:]
+
+
+def current_stats():
+    stats = g.get('_request_stats')
+    if stats is None:
+        stats = g._request_stats = RequestStats()
+    return stats
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, instrumentation):
+        self._cursor = cursor
+        self._instrumentation = instrumentation
+
+    def execute(self, query, args=None):
+        return self._timed(query, self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(query, self._cursor.executemany, query, args)
+
+    def callproc(self, procname, args=()):
+        return self._timed(f'CALL {procname}', self._cursor.callproc, procname, args)
+
+    def _timed(self, statement, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._instrumentation.record_query(statement, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Proxy around a pooled connection that times every cursor statement."""
+
+    def __init__(self, raw, instrumentation):
+        self.raw = raw
+        self._instrumentation = instrumentation
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs), self._instrumentation)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class Instrumentation:
+    """Per-request SQL and render timing, /metrics and Server-Timing.
+
+    Configured like the MySQL shim: `init_app` installs request hooks, the
+    template signals and the /metrics endpoint.
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_seconds = 0.2
+        self.server_timing = False
+        self.token = None
+        self.extra_metrics = []
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._saved = {}
+        self._request_duration = Histogram(DURATION_BUCKETS)
+        self._queries_per_request = Histogram(COUNT_BUCKETS)
+        self._db_time = Histogram(DURATION_BUCKETS)
+        self._checkout = Histogram(DURATION_BUCKETS)
+        self._render = Histogram(DURATION_BUCKETS)
+        self._statements = {}
+        self._slow_queries = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000.0
+        self.server_timing = app.config.get('SERVER_TIMING', False)
+        self.token = app.config.get('METRICS_TOKEN')
+
+        log_file = app.config.get('SLOW_QUERY_LOG_FILE')
+        if log_file:
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_log.addHandler(handler)
+            slow_query_log.setLevel(logging.WARNING)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def wrap(self, raw):
+        return InstrumentedConnection(raw, self)
+
+    def record_checkout(self, elapsed):
+        current_stats().checkout_time += elapsed
+        with self._lock:
+            self._checkout.observe((), elapsed)
+
+    def record_query(self, statement, elapsed):
+        statement = normalize_sql(statement)
+        current_stats().record(statement, elapsed)
+        with self._lock:
+            key = statement if statement in self._statements or len(self._statements) < MAX_STATEMENTS else 'other'
+            count, total, worst = self._statements.get(key, (0, 0.0, 0.0))
+            self._statements[key] = (count + 1, total + elapsed, max(worst, elapsed))
+            slow = elapsed >= self.slow_query_seconds
+            if slow:
+                self._slow_queries += 1
+        if slow:
+            endpoint = request.endpoint if request else None
+            slow_query_log.warning('slow query %.1f ms [%s] %s', elapsed * 1000, endpoint, statement)
+
+    def record_saved(self, count=1):
+        # A statement a cache made unnecessary, e.g. the session profile.
+        # Shared caches are also read from the async app, which isn't measured.
+        if has_app_context():
+            current_stats().saved += count
+
+    def _before_request(self):
+        g._request_started = time.perf_counter()
+        current_stats()
+
+    def _before_render(self, app, template, context, **extra):
+        current_stats()._render_started = time.perf_counter()
+
+    def _after_render(self, app, template, context, **extra):
+        stats = current_stats()
+        if stats._render_started is not None:
+            elapsed = time.perf_counter() - stats._render_started
+            stats.render_time += elapsed
+            stats._render_started = None
+            with self._lock:
+                self._render.observe((template.name,), elapsed)
+
+    def _after_request(self, response):
+        started = g.get('_request_started')
+        if started is None or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - started
+        stats = current_stats()
+        endpoint = request.endpoint or 'unmatched'
+
+        with self._lock:
+            key = (endpoint, request.method, str(response.status_code))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._request_duration.observe((endpoint,), elapsed)
+            self._queries_per_request.observe((endpoint,), stats.queries)
+            self._db_time.observe((endpoint,), stats.db_time)
+            if stats.saved:
+                self._saved[endpoint] = self._saved.get(endpoint, 0) + stats.saved
+
+        # Many fast statements add up too (N+1 loops); log the request with
+        # its slowest statements when its total DB time crosses the threshold
+        if stats.db_time >= self.slow_query_seconds:
+            slow_query_log.warning('slow request %.1f ms in %d queries [%s %s]\n%s',
+                                   stats.db_time * 1000, stats.queries, request.method, request.path,
+                                   '\n'.join(f'  {t * 1000:8.1f} ms  {sql}' for t, sql in stats.slowest))
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries, {stats.saved} saved"',
+                f'checkout;dur={stats.checkout_time * 1000:.2f}',
+                f'render;dur={stats.render_time * 1000:.2f}',
+                f'total;dur={elapsed * 1000:.2f}',
+            ])
+        return response
+
+    def metrics_view(self):
+        if self.token:
+            # Constant time, so response timing doesn't leak the token a prefix at a time
+            allowed = hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                          f'Bearer {self.token}'.encode())
+        else:
+            allowed = self._local_request()
+        if not allowed:
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response('\n'.join(self.render_metrics()) + '\n', mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _local_request():
+        # Without a token only same-host scrapers get in. A request relayed by
+        # a local reverse proxy also arrives from loopback, so refuse those.
+        if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+            return False
+        try:
+            return ipaddress.ip_address(request.remote_addr or '').is_loopback
+        except ValueError:
+            return False
+
+    def render_metrics(self):
+        lines = []
+        with self._lock:
+            lines += ['# HELP library_http_requests_total Requests served, by endpoint, method and status.',
+                      '# TYPE library_http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'library_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            for name, help_text, histogram, labels in (
+                ('library_http_request_duration_seconds', 'Request wall time.', self._request_duration, ('endpoint',)),
+                ('library_db_queries_per_request', 'SQL statements run per request.', self._queries_per_request, ('endpoint',)),
+                ('library_db_time_per_request_seconds', 'Total SQL time per request.', self._db_time, ('endpoint',)),
+                ('library_db_pool_checkout_seconds', 'Time to check a connection out of the pool.', self._checkout, ()),
+                ('library_template_render_seconds', 'Jinja render time per template.', self._render, ('template',)),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                lines += histogram.render(name, labels)
+
+            lines += ['# HELP library_db_statement_seconds Time spent per normalized SQL statement.',
+                      '# TYPE library_db_statement_seconds summary']
+            statements = [(escape_label(sql), stat) for sql, stat in sorted(self._statements.items())]
+            for label, (count, total, _) in statements:
+                lines.append(f'library_db_statement_seconds_sum{{statement="{label}"}} {total}')
+                lines.append(f'library_db_statement_seconds_count{{statement="{label}"}} {count}')
+            lines += ['# HELP library_db_statement_max_seconds Slowest execution of each normalized SQL statement.',
+                      '# TYPE library_db_statement_max_seconds gauge']
+            for label, (_, _, worst) in statements:
+                lines.append(f'library_db_statement_max_seconds{{statement="{label}"}} {worst}')
+
+            lines += ['# HELP library_db_queries_saved_total Lookups served from a cache instead of SQL, by endpoint.',
+                      '# TYPE library_db_queries_saved_total counter']
+            for endpoint, count in sorted(self._saved.items()):
+                lines.append(f'library_db_queries_saved_total{{endpoint="{endpoint}"}} {count}')
+
+            lines += ['# HELP library_db_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                      '# TYPE library_db_slow_queries_total counter',
+                      f'library_db_slow_queries_total {self._slow_queries}']
+
+        # Gauges from other components (pool, caches), registered as callables
+        # returning {metric_name: value}
+        for source in self.extra_metrics:
+            for name, value in source().items():
+                lines += [f'# TYPE {name} gauge', f'{name} {value}']
+        return lines
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,278 @@
+import datetime
+import logging
+import time
+
+import MySQLdb.cursors
+
+from app.cache import availability
+from app.events import events
+from app.holds import holds
+from app.recommendations import recommendations
+from app.pagination import seek_condition
+
+log = logging.getLogger(__name__)
+
+
+def accrue_fines(connection, fine_per_day=1.00, batch_size=1000):
+    """Bring fine_amount and is_overdue up to date for every overdue open loan.
+
+    Walks idx_tx_status_due in (due_date, transaction_id) order one batch at
+    a time; each batch is a single set-based UPDATE plus the overdue
+    reminders for the same loans, committed on its own so locks stay short.
+    The rate must match the one return_book charges.
+    """
+    touched = 0
+    last = None
+    cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+    while True:
+        query = """
+            SELECT transaction_id, due_date FROM transactions
+            WHERE status = 'issued' AND due_date < CURRENT_DATE
+        """
+        params = []
+        if last is not None:
+            condition, params = seek_condition(['due_date', 'transaction_id'], last)
+            query += f" AND {condition}"
+        query += " ORDER BY due_date, transaction_id LIMIT %s"
+        cursor.execute(query, tuple(params) + (batch_size,))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+
+        ids = tuple(row['transaction_id'] for row in batch)
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            UPDATE transactions
+            SET fine_amount = DATEDIFF(CURRENT_DATE, due_date) * %s, is_overdue = 1
+            WHERE transaction_id IN ({placeholders}) AND status = 'issued'
+        """, (fine_per_day,) + ids)
+        touched += cursor.rowcount
+        cursor.execute(f"""
+            INSERT IGNORE INTO notification_outbox (user_id, transaction_id, kind, notify_on)
+            SELECT user_id, transaction_id, 'overdue', CURRENT_DATE FROM transactions
+            WHERE transaction_id IN ({placeholders}) AND status = 'issued'
+        """, ids)
+        connection.commit()
+
+        last = (batch[-1]['due_date'], batch[-1]['transaction_id'])
+    cursor.close()
+    return touched
+
+
+def queue_due_soon_reminders(connection, days_ahead=1, batch_size=1000):
+    # Loans due in `days_ahead` days, walked by transaction_id within the due date
+    queued = 0
+    last_id = 0
+    cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+    while True:
+        cursor.execute("""
+            SELECT transaction_id FROM transactions
+            WHERE status = 'issued' AND due_date = CURRENT_DATE + INTERVAL %s DAY AND transaction_id > %s
+            ORDER BY transaction_id LIMIT %s
+        """, (days_ahead, last_id, batch_size))
+        ids = tuple(row['transaction_id'] for row in cursor.fetchall())
+        if not ids:
+            break
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            INSERT IGNORE INTO notification_outbox (user_id, transaction_id, kind, notify_on)
+            SELECT user_id, transaction_id, 'due_soon', CURRENT_DATE FROM transactions
+            WHERE transaction_id IN ({placeholders})
+        """, ids)
+        queued += cursor.rowcount
+        connection.commit()
+        last_id = ids[-1]
+    cursor.close()
+    return queued
+
+
+def reconcile_stats(connection, batch_size=1000):
+    """Recompute book_stats and category_stats from the ledger.
+
+    The triggers from 0008_book_stats.sql keep both tables current; this
+    corrects any drift and ages borrows out of the 7/30 day windows.
+    book_stats is rebuilt one book_id range at a time. INSERT ... SELECT
+    share-locks the loans it reads, so a borrow of a book in the current
+    range waits for that batch's commit instead of being lost.
+    """
+    touched = 0
+    last_id = 0
+    cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+    while True:
+        cursor.execute("SELECT book_id FROM books WHERE book_id > %s ORDER BY book_id LIMIT %s",
+                       (last_id, batch_size))
+        ids = [row['book_id'] for row in cursor.fetchall()]
+        if not ids:
+            break
+        cursor.execute("""
+            INSERT INTO book_stats (book_id, borrows_total, borrows_7d, borrows_30d, active_loans, last_borrowed_on)
+            SELECT b.book_id,
+                   COUNT(t.transaction_id),
+                   COALESCE(SUM(t.borrow_date >= CURRENT_DATE - INTERVAL 6 DAY), 0),
+                   COALESCE(SUM(t.borrow_date >= CURRENT_DATE - INTERVAL 29 DAY), 0),
+                   COALESCE(SUM(t.status = 'issued'), 0),
+                   MAX(t.borrow_date)
+            FROM books b
+            LEFT JOIN transactions t ON t.book_id = b.book_id
+            WHERE b.book_id BETWEEN %s AND %s
+            GROUP BY b.book_id
+            ON DUPLICATE KEY UPDATE borrows_total = VALUES(borrows_total), borrows_7d = VALUES(borrows_7d),
+                borrows_30d = VALUES(borrows_30d), active_loans = VALUES(active_loans),
+                last_borrowed_on = VALUES(last_borrowed_on)
+        """, (ids[0], ids[-1]))
+        touched += cursor.rowcount
+        connection.commit()
+        last_id = ids[-1]
+
+    # Category slots: lock them first, then aggregate books with a
+    # non-locking read-committed scan. A borrow during the scan blocks in its
+    # trigger on the locked slot, so its book change isn't in our totals yet
+    # and its delta lands on top of them after we commit. Borrows stall for
+    # the length of one scan over books.
+    cursor.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+    cursor.execute("SELECT category_id FROM category_stats FOR UPDATE")
+    cursor.execute("""
+        SELECT COALESCE(category_id, 0) AS category_id, book_id % 16 AS slot, COUNT(*) AS titles,
+               COALESCE(SUM(total_copies), 0) AS total_copies, COALESCE(SUM(available_copies), 0) AS available_copies
+        FROM books
+        GROUP BY COALESCE(category_id, 0), book_id % 16
+    """)
+    slots = cursor.fetchall()
+    cursor.execute("UPDATE category_stats SET titles = 0, total_copies = 0, available_copies = 0")
+    if slots:
+        cursor.executemany("""
+            INSERT INTO category_stats (category_id, slot, titles, total_copies, available_copies)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE titles = VALUES(titles), total_copies = VALUES(total_copies),
+                available_copies = VALUES(available_copies)
+        """, [(row['category_id'], row['slot'], row['titles'], row['total_copies'], row['available_copies'])
+              for row in slots])
+    connection.commit()
+    cursor.close()
+    return touched
+
+
+def expire_holds(connection, batch_size=1000, on_commit=None):
+    """Expire ready holds whose pickup window has passed.
+
+    Walks idx_holds_expiry in batches. Each book's expired copies go back to
+    stock and straight on to the next waiting holds, one transaction per
+    book with the book row locked first, like the return path. Then books
+    that have both stock and a queue (copies added by an admin, say) are
+    allocated the same way. After each commit `on_commit(book_id, ready)`
+    gets the book and the holds made ready, as {'hold_id', 'user_id',
+    'book_id'} rows.
+    """
+    touched = 0
+    cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+    while True:
+        cursor.execute("""
+            SELECT hold_id, book_id FROM holds
+            WHERE status = 'ready' AND expires_at < NOW()
+            ORDER BY expires_at LIMIT %s
+        """, (batch_size,))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        by_book = {}
+        for row in batch:
+            by_book.setdefault(row['book_id'], []).append(row['hold_id'])
+        for book_id, hold_ids in sorted(by_book.items()):
+            cursor.execute("SELECT book_id FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+            placeholders = ', '.join(['%s'] * len(hold_ids))
+            # Re-checked under the lock: the holder may have borrowed meanwhile
+            cursor.execute(f"""
+                UPDATE holds SET status = 'expired'
+                WHERE hold_id IN ({placeholders}) AND status = 'ready' AND expires_at < NOW()
+            """, tuple(hold_ids))
+            expired = cursor.rowcount
+            ready = []
+            if expired:
+                cursor.execute("UPDATE books SET available_copies = available_copies + %s WHERE book_id = %s",
+                               (expired, book_id))
+                ready = holds.allocate(cursor, book_id)
+            connection.commit()
+            touched += expired
+            if expired and on_commit is not None:
+                on_commit(book_id, [dict(row, book_id=book_id) for row in ready])
+
+    cursor.execute("""
+        SELECT DISTINCT h.book_id FROM holds h
+        JOIN books b ON b.book_id = h.book_id
+        WHERE h.status = 'waiting' AND b.available_copies > 0
+    """)
+    for row in cursor.fetchall():
+        ready = holds.allocate(cursor, row['book_id'])
+        connection.commit()
+        touched += len(ready)
+        if ready and on_commit is not None:
+            on_commit(row['book_id'], [dict(hold, book_id=row['book_id']) for hold in ready])
+    cursor.close()
+    return touched
+
+
+def announce_holds(connection, book_id, ready):
+    # What the return path does after a commit: drop the cached stock, push
+    # the new count and tell each holder their copy is waiting. Reaches the
+    # web processes through the redis cache and events backends.
+    try:
+        availability.invalidate(book_id)
+        if events.wants(f'book:{book_id}'):
+            events.availability(availability.get_many(connection, [book_id]))
+        for hold in ready:
+            events.loans_changed(hold['user_id'], hold['book_id'], 'hold_ready')
+    except Exception:
+        # The sweep committed; pages catch up when the cached count expires
+        log.exception('could not publish hold changes for book %s', book_id)
+
+
+def run_job(connection, name, job):
+    """Run `job(connection)` and record it in job_runs.
+
+    `job` returns the number of rows it touched.
+    """
+    started = datetime.datetime.now()
+    clock = time.perf_counter()
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO job_runs (job, started_at) VALUES (%s, %s)", (name, started))
+    run_id = cursor.lastrowid
+    connection.commit()
+
+    status, error, rows = 'ok', None, 0
+    try:
+        rows = job(connection)
+    except Exception as e:
+        connection.rollback()
+        status, error = 'failed', str(e)
+
+    duration_ms = int((time.perf_counter() - clock) * 1000)
+    cursor.execute("""
+        UPDATE job_runs SET finished_at = %s, duration_ms = %s, rows_touched = %s, status = %s, error = %s
+        WHERE run_id = %s
+    """, (datetime.datetime.now(), duration_ms, rows, status, error, run_id))
+    connection.commit()
+    cursor.close()
+    return {'job': name, 'status': status, 'rows_touched': rows, 'duration_ms': duration_ms, 'error': error}
+
+
+def nightly_jobs(app):
+    # (name, callable) pairs run in order by worker.py
+    batch_size = app.config.get('JOB_BATCH_SIZE', 1000)
+    return [
+        ('accrue_fines', lambda conn: accrue_fines(conn, app.config.get('FINE_PER_DAY', 1.00), batch_size)),
+        ('due_soon_reminders', lambda conn: queue_due_soon_reminders(
+            conn, app.config.get('REMINDER_DAYS_AHEAD', 1), batch_size)),
+        ('reconcile_stats', lambda conn: reconcile_stats(conn, batch_size)),
+    ]
+
+
+def periodic_jobs(app):
+    # (name, callable, interval in seconds) run by worker.py between nightly runs
+    batch_size = app.config.get('JOB_BATCH_SIZE', 1000)
+    return [
+        ('expire_holds', lambda conn: expire_holds(
+            conn, batch_size, on_commit=lambda book_id, ready: announce_holds(conn, book_id, ready)),
+         app.config.get('HOLD_SWEEP_INTERVAL', 300)),
+        ('recommendations', lambda conn: recommendations.build(conn, batch_size),
+         app.config.get('RECOMMEND_INTERVAL', 3600)),
+    ]
@@ -0,0 +1,96 @@
+import os
+import re
+
+import MySQLdb
+import MySQLdb.cursors
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'migrations')
+MIGRATION_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Databases bootstrapped by the old init_db.py/migrate_db.py scripts already
+# have some of these objects, so "already exists"/"doesn't exist" errors from
+# DDL are treated as applied: duplicate column, duplicate key name, can't drop.
+IDEMPOTENT_ERRORS = {1060, 1061, 1091}
+
+
+def discover(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a script into statements, honouring mysql-client DELIMITER lines."""
+    statements, buffer, delimiter = [], [], ';'
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not buffer and (not stripped or stripped.startswith('--')):
+            continue
+        if stripped.endswith(delimiter):
+            buffer.append(line.rstrip()[:-len(delimiter)])
+            statement = '\n'.join(buffer).strip()
+            if statement:
+                statements.append(statement)
+            buffer = []
+        else:
+            buffer.append(line)
+    if '\n'.join(buffer).strip():
+        statements.append('\n'.join(buffer).strip())
+    return statements
+
+
+def ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(connection):
+    cursor = connection.cursor(MySQLdb.cursors.Cursor)
+    ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def pending(connection, directory=MIGRATIONS_DIR):
+    applied = applied_versions(connection)
+    return [migration for migration in discover(directory) if migration[0] not in applied]
+
+
+def migrate(connection, directory=MIGRATIONS_DIR, log=print):
+    """Apply pending migrations in version order and record each one.
+
+    MySQL commits DDL implicitly, so a migration that fails halfway is not
+    rolled back; it stays unrecorded and is retried on the next run.
+    """
+    applied = []
+    for version, name, path in pending(connection, directory):
+        log(f"Applying {version:04d}_{name}...")
+        with open(path) as f:
+            statements = split_statements(f.read())
+
+        cursor = connection.cursor(MySQLdb.cursors.Cursor)
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except MySQLdb.MySQLError as e:
+                if not e.args or e.args[0] not in IDEMPOTENT_ERRORS:
+                    raise
+                log(f"  skipped (already applied): {e.args[1]}")
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        connection.commit()
+        cursor.close()
+        applied.append(version)
+    return applied
@@ -0,0 +1,133 @@
+import base64
+import json
+import math
+import time
+from bisect import bisect_left, bisect_right
+
+
+def encode_cursor(values):
+    # Opaque, URL-safe token for the sort key of a row
+    raw = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Tampered or malformed tokens are treated as "no cursor"
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+# Cursor value types, for valid_cursor. Dates and decimals are encoded as
+# strings, so every SQL sort key is one of these.
+SCALAR = (str, int, float)
+NUMBER = (int, float)
+
+
+def valid_cursor(values, kinds):
+    """`values` if it holds one value of each type in `kinds`, else None.
+
+    decode_cursor only checks for a JSON list; a token from another listing
+    or sort order, or an edited one, can have any length and types, which
+    would fail when compared or bound as query parameters.
+    """
+    if values is None or len(values) != len(kinds):
+        return None
+    for value, kind in zip(values, kinds):
+        if isinstance(value, bool) or not isinstance(value, kind):
+            return None
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+    return values
+
+
+def seek_condition(columns, values, reverse=False):
+    """WHERE fragment selecting rows strictly after `values` in `columns` order.
+
+    For (title, book_id) this yields
+    `(title > %s OR (title = %s AND book_id > %s))`, which MySQL can run as a
+    range scan on an index over those columns. With `reverse` the comparison
+    flips so the caller can walk backwards with the ORDER BY reversed.
+    """
+    op = '<' if reverse else '>'
+    clauses, params = [], []
+    for i, column in enumerate(columns):
+        parts = [f'{c} = %s' for c in columns[:i]] + [f'{column} {op} %s']
+        clauses.append(' AND '.join(parts))
+        params.extend(values[:i + 1])
+    return '(' + ' OR '.join(f'({c})' for c in clauses) + ')', params
+
+
+def seek_rows(rows, limit, after, before):
+    """Trim a `limit + 1` keyset fetch to one page and work out prev/next.
+
+    Rows fetched for a `before` cursor come back in reverse order and are
+    flipped here.
+    """
+    if before is not None:
+        has_prev = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        return rows, has_prev, True
+    has_next = len(rows) > limit
+    return list(rows[:limit]), after is not None, has_next
+
+
+def seek_list(keys, limit, after, before):
+    """Keyset pagination over an already sorted in-memory list of keys.
+
+    Cursors that don't match the shape of the keys are ignored.
+    """
+    if keys:
+        kinds = [NUMBER if isinstance(value, NUMBER) else SCALAR for value in keys[0]]
+        after, before = valid_cursor(after, kinds), valid_cursor(before, kinds)
+    if before is not None:
+        end = bisect_left(keys, tuple(before))
+        start = max(0, end - limit)
+    else:
+        start = bisect_right(keys, tuple(after)) if after is not None else 0
+        end = start + limit
+    return keys[start:end], start > 0, end < len(keys)
+
+
+_approximate_counts = {}
+
+
+def approximate_count(connection, table, ttl=300):
+    """Row estimate from InnoDB statistics, cached per process.
+
+    Exact COUNT(*) on InnoDB walks an entire index; this is good enough for
+    "about N books" style labels.
+    """
+    estimate = cached_count(table, ttl)
+    if estimate is not None:
+        return estimate
+
+    cursor = connection.cursor()
+    cursor.execute(APPROXIMATE_COUNT_QUERY, (table,))
+    row = cursor.fetchone()
+    cursor.close()
+    return remember_count(table, row)
+
+
+APPROXIMATE_COUNT_QUERY = """
+    SELECT TABLE_ROWS AS estimate FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+"""
+
+
+def cached_count(table, ttl=300):
+    cached = _approximate_counts.get(table)
+    if cached and time.monotonic() - cached[1] < ttl:
+        return cached[0]
+    return None
+
+
+def remember_count(table, row):
+    estimate = int(row['estimate'] or 0) if row else 0
+    _approximate_counts[table] = (estimate, time.monotonic())
+    return estimate
@@ -0,0 +1,102 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Stored for accounts that sign in through an identity provider. It is not a
+# valid werkzeug hash, so no password ever matches it.
+UNUSABLE_PASSWORD = '!'
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated for longer than the timeout."""
+
+
+class PasswordHasher:
+    """Password hashing off the request thread.
+
+    KDF work runs in a bounded process pool so a burst of logins occupies at
+    most `workers` cores and the request threads are only waiting, not
+    computing. At most `max_pending` hashes may be queued; past that callers
+    wait up to `timeout` seconds and then get HasherBusy, as they do when
+    their own hash takes longer than `timeout`. With workers = 0
+    hashing runs inline, which is what scripts and tests want.
+    """
+
+    def __init__(self, method='scrypt', workers=0, max_pending=64, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._prefix = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._prefix = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash or pwhash.startswith(UNUSABLE_PASSWORD):
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # werkzeug hashes are "<method:params>$salt$hash"; compare the method
+        # and cost part against what the current config would produce
+        if not pwhash or pwhash.startswith(UNUSABLE_PASSWORD):
+            return False
+        return pwhash.split('$', 1)[0] != self.current_prefix()
+
+    def current_prefix(self):
+        if self._prefix is None:
+            # Let werkzeug fill in its defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise HasherBusy('Password hashing is saturated, try again shortly')
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        # The slot stays taken until the worker is done, even if we stop waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()  # only takes effect while it is still queued
+            raise HasherBusy('Password hashing is too slow right now, try again shortly') from None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a threaded server process is unsafe.
+                # Spawned children re-import the __main__ script, so entry
+                # points must not build the app at import time (see run.py).
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class _PooledConnection:
+    # Book-keeping for one physical connection owned by the pool
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections.
+
+    `connect` is a zero-argument callable returning a new connection. At most
+    `size` connections exist at once; `checkout` blocks for up to `timeout`
+    seconds when all of them are in use and raises PoolTimeout after that.
+    Idle connections are pinged before reuse once they have been idle longer
+    than `ping_interval`, and connections older than `recycle` seconds are
+    closed instead of being handed out again.
+    """
+
+    def __init__(self, connect, size=10, timeout=5.0, recycle=3600, ping_interval=30):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        # Slots reserved by checkouts that are connecting or health-checking
+        self._pending = 0
+        self._cond = threading.Condition()
+
+        # Counters for pool sizing
+        self._checkouts = 0
+        self._timeouts = 0
+        self._opened = 0
+        self._closed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def checkout(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            pooled = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        self._pending += 1
+                        break
+                    if len(self._in_use) + self._pending < self.size:
+                        # Reserve a slot, then connect outside the lock
+                        self._pending += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f'Could not get a database connection within {timeout:.1f}s '
+                            f'({self.size} in use)'
+                        )
+                    self._cond.wait(remaining)
+
+            try:
+                if pooled is not None and (self._expired(pooled) or not self._healthy(pooled)):
+                    self._close(pooled)
+                    pooled = None
+                    with self._cond:
+                        self._pending -= 1
+                    continue
+                if pooled is None:
+                    pooled = _PooledConnection(self._connect())
+                    with self._cond:
+                        self._opened += 1
+            except Exception:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify()
+                raise
+            break
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._pending -= 1
+            self._in_use[id(pooled.raw)] = pooled
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return pooled.raw
+
+    def checkin(self, conn, discard=False):
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            return
+
+        if not discard:
+            # Never hand out a connection with an open transaction
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or self._expired(pooled):
+            self._close(pooled)
+            with self._cond:
+                self._cond.notify()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def fill(self, count=None):
+        """Open idle connections until `count` (default: all `size`) exist.
+
+        Returns how many were opened. Used to warm a worker up before it
+        takes traffic; a connect error is raised after the slot is released.
+        """
+        count = self.size if count is None else min(count, self.size)
+        opened = 0
+        while True:
+            with self._cond:
+                if len(self._idle) + len(self._in_use) + self._pending >= count:
+                    return opened
+                self._pending += 1
+            try:
+                pooled = _PooledConnection(self._connect())
+            except Exception:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._pending -= 1
+                self._opened += 1
+                self._idle.append(pooled)
+                self._cond.notify()
+            opened += 1
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'opened': self._opened,
+                'closed': self._closed,
+                'wait_avg_ms': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+            }
+
+    def _expired(self, pooled):
+        return self.recycle and time.monotonic() - pooled.created_at > self.recycle
+
+    def _healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.ping_interval:
+            return True
+        try:
+            pooled.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close(self, pooled):
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._closed += 1
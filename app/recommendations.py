@@ -0,0 +1,284 @@
+import os
+import time
+
+import MySQLdb.cursors
+
+try:
+    import numpy as np
+    import scipy.sparse as sparse
+except ImportError:  # only the worker's build job needs them; pages read the tables
+    np = sparse = None
+
+# "Readers who borrowed this also borrowed": one range of the primary key
+BOOK_RECOMMENDATIONS_QUERY = """
+    SELECT b.*, r.score
+    FROM book_recommendations r
+    JOIN books b ON b.book_id = r.recommended_book_id
+    WHERE r.book_id = %s
+    ORDER BY r.position LIMIT %s
+"""
+
+# A member's picks that are on the shelf right now
+USER_RECOMMENDATIONS_QUERY = """
+    SELECT b.*, r.score
+    FROM user_recommendations r
+    JOIN books b ON b.book_id = r.book_id
+    WHERE r.user_id = %s AND b.available_copies > 0
+    ORDER BY r.position LIMIT %s
+"""
+
+# Ledger rows fetched per round trip while building
+READ_BATCH = 50000
+
+
+class Recommender:
+    """Item-to-item recommendations built offline from the loan ledger.
+
+    Two books are similar when the same members borrowed both: the score is
+    the cosine of their borrower sets, counted from a sparse member x book
+    matrix. Each book keeps its `top_k` best matches with at least
+    `min_support` shared borrowers, and a member's recommendations add up
+    the matches of everything they borrowed, minus what they already have.
+    Both lists live in the tables from 0010_recommendations.sql.
+
+    `build` is incremental: the matrix and the book matches are kept in
+    `state_dir` with the last transaction_id read, so a run only reads new
+    loans and rescores the books and members they touch. Other members'
+    lists drift a little as scores change, and a loan committed out of id
+    order can be missed, so everything is rebuilt every `rebuild_days`.
+    Configured like the MySQL shim.
+    """
+
+    def __init__(self, top_k=20, min_support=2, rebuild_days=7, state_dir=None):
+        self.top_k = top_k
+        self.min_support = min_support
+        self.rebuild_days = rebuild_days
+        self.state_dir = state_dir
+
+    def init_app(self, app):
+        self.top_k = app.config.get('RECOMMEND_TOP_K', self.top_k)
+        self.min_support = app.config.get('RECOMMEND_MIN_SUPPORT', self.min_support)
+        self.rebuild_days = app.config.get('RECOMMEND_REBUILD_DAYS', self.rebuild_days)
+        self.state_dir = app.config.get('RECOMMEND_STATE_DIR') or os.path.join(app.instance_path, 'recommendations')
+
+    def for_book(self, connection, book_id, limit=6):
+        cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(BOOK_RECOMMENDATIONS_QUERY, (book_id, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def for_user(self, connection, user_id, limit=12):
+        cursor = connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(USER_RECOMMENDATIONS_QUERY, (user_id, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    # Building (worker only)
+
+    def build(self, connection, batch_size=1000, full=False):
+        """Bring both tables up to date; returns the rows written.
+
+        Each batch of `batch_size` books or members is replaced in its own
+        transaction, and the state is saved once every batch committed, so
+        a failed run is simply redone by the next one.
+        """
+        if np is None:
+            raise RuntimeError('building recommendations needs numpy and scipy '
+                               '(pip install -r requirements-recommend.txt)')
+        state = None if full else self._load()
+        if state is not None and (time.time() - state['built_at'] > self.rebuild_days * 86400
+                                  or state['neighbours'].shape[1] != self.top_k):
+            state = None
+        full = state is None
+        if full:
+            state = {'watermark': 0, 'built_at': time.time(),
+                     'borrowed': sparse.csr_matrix((0, 0), dtype=np.float32),
+                     'neighbours': np.zeros((0, self.top_k), dtype=np.int32),
+                     'scores': np.zeros((0, self.top_k), dtype=np.float32)}
+
+        book_ids = self._ids(connection, "SELECT book_id FROM books")
+        user_ids = self._ids(connection, "SELECT user_id FROM users")
+        users, books, watermark = self._read_loans(connection, state['watermark'])
+
+        # Member x book matrix, 1 where the member ever borrowed the book
+        old = state['borrowed']
+        shape = (max(old.shape[0], _next_id(users), _next_id(user_ids)),
+                 max(old.shape[1], _next_id(books), _next_id(book_ids)))
+        old = _resized(old, shape)
+        new = sparse.csr_matrix((np.ones(len(users), dtype=np.float32), (users, books)), shape=shape)
+        new.data[:] = 1  # repeat loans of a book count once
+        borrowed = old.maximum(new).tocsr()
+        book_exists = np.zeros(shape[1], dtype=bool)
+        book_exists[book_ids] = True
+        user_exists = np.zeros(shape[0], dtype=bool)
+        user_exists[user_ids] = True
+
+        if full:
+            # Every existing row is rewritten, which also clears stale ones
+            touched_users, touched_books = user_ids, book_ids
+        else:
+            added = borrowed - old
+            added.eliminate_zeros()
+            touched_users = np.flatnonzero(np.diff(added.indptr))
+            # Each book these members have borrowed gained co-borrowers
+            touched_books = np.unique(borrowed[touched_users].indices)
+
+        neighbours = _grown(state['neighbours'], shape[1])
+        scores = _grown(state['scores'], shape[1])
+        written = self._score_books(connection, borrowed, touched_books, book_exists, neighbours, scores,
+                                    batch_size)
+        written += self._score_users(connection, borrowed, touched_users, user_exists, book_exists, neighbours,
+                                     scores, batch_size)
+
+        state.update(watermark=watermark, borrowed=borrowed, neighbours=neighbours, scores=scores)
+        self._save(state)
+        return written
+
+    def _score_books(self, connection, borrowed, book_ids, book_exists, neighbours, scores, batch_size):
+        borrowers = np.asarray(borrowed.sum(axis=0)).ravel()
+        norm = np.zeros(len(borrowers), dtype=np.float32)
+        norm[borrowers > 0] = 1 / np.sqrt(borrowers[borrowers > 0])
+        by_book = borrowed.T.tocsr()
+        written = 0
+        for start in range(0, len(book_ids), batch_size):
+            chunk = book_ids[start:start + batch_size]
+            # Shared borrowers of each book in the chunk with every other book
+            together = (by_book[chunk] @ borrowed).tocsr()
+            picks = {}
+            for row, book_id in enumerate(chunk):
+                cols, counts = _row(together, row)
+                keep = (cols != book_id) & (counts >= self.min_support) & book_exists[cols]
+                cols = cols[keep]
+                ids, values = self._top(cols, counts[keep] * norm[book_id] * norm[cols])
+                neighbours[book_id] = 0
+                scores[book_id] = 0
+                neighbours[book_id, :len(ids)] = ids
+                scores[book_id, :len(ids)] = values
+                if book_exists[book_id]:
+                    picks[book_id] = (ids, values)
+            written += self._write(connection, 'book_recommendations', 'book_id', 'recommended_book_id', chunk,
+                                   picks)
+        return written
+
+    def _score_users(self, connection, borrowed, user_ids, user_exists, book_exists, neighbours, scores,
+                     batch_size):
+        n_books = neighbours.shape[0]
+        matches = sparse.csr_matrix((scores.ravel(), neighbours.ravel(),
+                                     np.arange(0, n_books * self.top_k + 1, self.top_k)), shape=(n_books, n_books))
+        matches.eliminate_zeros()
+        written = 0
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            history = borrowed[chunk]
+            totals = (history @ matches).tocsr()
+            picks = {}
+            for row, user_id in enumerate(chunk):
+                if not user_exists[user_id]:
+                    continue
+                cols, values = _row(totals, row)
+                seen, _ = _row(history, row)
+                keep = ~np.isin(cols, seen) & book_exists[cols]
+                picks[user_id] = self._top(cols[keep], values[keep])
+            written += self._write(connection, 'user_recommendations', 'user_id', 'book_id', chunk, picks)
+        return written
+
+    def _top(self, ids, values):
+        # The top_k highest values, best first, ties broken by id
+        order = np.lexsort((ids, -values))[:self.top_k]
+        return ids[order], values[order]
+
+    def _write(self, connection, table, owner_column, target_column, owners, picks):
+        # Replace the rows of `owners` with `picks` ({owner: (ids, scores)})
+        owners = tuple(int(owner) for owner in owners)
+        if not owners:
+            return 0
+        cursor = connection.cursor()
+        placeholders = ', '.join(['%s'] * len(owners))
+        cursor.execute(f"DELETE FROM {table} WHERE {owner_column} IN ({placeholders})", owners)
+        rows = [(int(owner), position, int(target), float(score))
+                for owner, (ids, values) in picks.items()
+                for position, (target, score) in enumerate(zip(ids, values), 1)]
+        if rows:
+            cursor.executemany(f"INSERT INTO {table} ({owner_column}, position, {target_column}, score) "
+                               f"VALUES (%s, %s, %s, %s)", rows)
+        connection.commit()
+        cursor.close()
+        return len(rows)
+
+    def _ids(self, connection, query):
+        cursor = connection.cursor(MySQLdb.cursors.Cursor)
+        cursor.execute(query)
+        ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        cursor.close()
+        return ids
+
+    def _read_loans(self, connection, after):
+        # (user_ids, book_ids, last transaction_id) of the loans after `after`
+        cursor = connection.cursor(MySQLdb.cursors.Cursor)
+        chunks = []
+        while True:
+            cursor.execute("""
+                SELECT transaction_id, user_id, book_id FROM transactions
+                WHERE transaction_id > %s ORDER BY transaction_id LIMIT %s
+            """, (after, READ_BATCH))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.int64)
+            chunks.append(chunk[:, 1:])
+            after = int(chunk[-1, 0])
+        cursor.close()
+        loans = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.int64)
+        return loans[:, 0], loans[:, 1], after
+
+    def _path(self):
+        return os.path.join(self.state_dir, 'state.npz')
+
+    def _load(self):
+        try:
+            with np.load(self._path()) as saved:
+                indptr = saved['indptr']
+                shape = tuple(saved['shape'])
+                borrowed = sparse.csr_matrix((np.ones(indptr[-1], dtype=np.float32), saved['indices'], indptr),
+                                             shape=shape)
+                return {'watermark': int(saved['watermark']), 'built_at': float(saved['built_at']),
+                        'borrowed': borrowed, 'neighbours': saved['neighbours'], 'scores': saved['scores']}
+        except (OSError, KeyError, ValueError):
+            return None  # missing or unreadable: rebuild from scratch
+
+    def _save(self, state):
+        os.makedirs(self.state_dir, exist_ok=True)
+        borrowed = state['borrowed']
+        tmp = self._path() + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, watermark=state['watermark'], built_at=state['built_at'], indices=borrowed.indices,
+                     indptr=borrowed.indptr, shape=np.array(borrowed.shape), neighbours=state['neighbours'],
+                     scores=state['scores'])
+        os.replace(tmp, self._path())
+
+
+def _next_id(ids):
+    return int(ids.max()) + 1 if len(ids) else 0
+
+
+def _resized(matrix, shape):
+    # Same rows and columns, room for ids seen since it was built
+    indptr = np.concatenate([matrix.indptr, np.full(shape[0] - matrix.shape[0], matrix.indptr[-1])])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+def _grown(array, rows):
+    if array.shape[0] >= rows:
+        return array.copy()
+    return np.concatenate([array, np.zeros((rows - array.shape[0], array.shape[1]), dtype=array.dtype)])
+
+
+def _row(matrix, row):
+    # Column ids and values of one CSR row
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    return matrix.indices[start:end], matrix.data[start:end]
+
+
+recommendations = Recommender()
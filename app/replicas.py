@@ -0,0 +1,128 @@
+import itertools
+import threading
+import time
+
+import MySQLdb
+
+
+class Replica:
+    """One read replica: its pool plus health and latency book-keeping."""
+
+    def __init__(self, host, port, pool):
+        self.host = host
+        self.port = port
+        self.pool = pool
+        self.healthy = True
+        self.latency = None  # EWMA of health-check round trips, seconds
+        self.lag = None  # Seconds_Behind_Source at the last check
+        self.checked_at = 0.0
+        self.reads = 0
+        self.failures = 0
+        self._checking = threading.Lock()
+
+    @property
+    def name(self):
+        return f'{self.host}:{self.port}'
+
+    def observe(self, elapsed, alpha=0.3):
+        self.latency = elapsed if self.latency is None else alpha * elapsed + (1 - alpha) * self.latency
+
+
+class ReplicaSet:
+    """Chooses a replica for read-only work.
+
+    `policy` is 'round_robin' or 'least_latency' (lowest health-check round
+    trip). Health is checked lazily: when a replica is considered and its
+    last check is older than `health_interval`, the calling thread pings it
+    and reads its replication lag, while other threads keep using the last
+    result. A replica that fails a check, a connection or a query, or
+    lags more than `max_lag` seconds, is skipped until it passes a check
+    again `retry_after` seconds later.
+    """
+
+    def __init__(self, replicas, policy='round_robin', health_interval=5, max_lag=10, retry_after=30):
+        self.replicas = replicas
+        self.policy = policy
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.retry_after = retry_after
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        candidates = [replica for replica in self.replicas if self._available(replica)]
+        if not candidates:
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        if self.policy == 'least_latency':
+            replica = min(candidates, key=lambda r: r.latency if r.latency is not None else 0.0)
+        else:
+            replica = candidates[next(self._next) % len(candidates)]
+        replica.reads += 1
+        return replica
+
+    def _available(self, replica):
+        interval = self.health_interval if replica.healthy else self.retry_after
+        if time.monotonic() - replica.checked_at >= interval:
+            self.check(replica)
+        return replica.healthy
+
+    def check(self, replica):
+        if not replica._checking.acquire(blocking=False):
+            return  # another thread is checking it
+        try:
+            started = time.monotonic()
+            conn = replica.pool.checkout(timeout=1.0)
+            try:
+                cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                replica.observe(time.monotonic() - started)
+                replica.lag = self._lag(cursor)
+                cursor.close()
+            finally:
+                replica.pool.checkin(conn)
+            replica.healthy = replica.lag is None or replica.lag <= self.max_lag
+        except Exception:
+            replica.healthy = False
+            replica.failures += 1
+        finally:
+            replica.checked_at = time.monotonic()
+            replica._checking.release()
+
+    @staticmethod
+    def _lag(cursor):
+        # None when the server isn't a replica or we may not ask (needs
+        # REPLICATION CLIENT); a stopped replica reports NULL lag, which is
+        # treated as too far behind
+        for statement, column in (("SHOW REPLICA STATUS", 'Seconds_Behind_Source'),
+                                  ("SHOW SLAVE STATUS", 'Seconds_Behind_Master')):
+            try:
+                cursor.execute(statement)
+            except MySQLdb.MySQLError:
+                continue
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            lag = row.get(column)
+            return float('inf') if lag is None else lag
+        return None
+
+    def mark_down(self, replica):
+        replica.healthy = False
+        replica.failures += 1
+        replica.checked_at = time.monotonic()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'fallbacks': self.fallbacks,
+            'replicas': [{'host': r.name, 'healthy': r.healthy, 'reads': r.reads, 'failures': r.failures,
+                          'lag': r.lag, 'latency_ms': r.latency * 1000 if r.latency is not None else None,
+                          'pool': r.pool.stats()} for r in self.replicas],
+        }
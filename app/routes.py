@@ -1,8 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session, send_file, abort,
+                   Response, stream_with_context, current_app)
 from app import mysql
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.covers import covers, CoverUnavailable, SIZES as COVER_SIZES
+from app.sessions import sessions
+from app.exports import EXPORTS, FORMATS as EXPORT_FORMATS, export_query, stream_rows, gzip_stream
+from app.search import search_index
+from app.cache import cache, availability
+from app.events import events, format_sse, EventsBusy
+from app.circulation import retry, borrow_book, return_book, place_hold, cancel_hold
+from app.holds import holds, HoldError
+from app.recommendations import recommendations
+from app.pagination import (encode_cursor, decode_cursor, valid_cursor, seek_condition, seek_rows, seek_list,
+                            approximate_count, SCALAR)
+from app.passwords import hasher, HasherBusy, UNUSABLE_PASSWORD
 import MySQLdb.cursors
 import datetime
+import decimal
 
 bp = Blueprint('main', __name__)
 
@@ -18,11 +31,11 @@ def register():
         username = request.form['username']
         email = request.form['email']
         password = request.form['password']
-        hashed_password = generate_password_hash(password)
         role = 'admin' if '@admin.com' in email else 'member'
         
         cursor = mysql.connection.cursor()
         try:
+            hashed_password = hasher.hash(password)
             cursor.execute("INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, %s, %s)", (username, email, hashed_password, role))
             mysql.connection.commit()
             flash('Registration successful! Please login.', 'success')
@@ -43,9 +56,26 @@ def login():
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
         cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
         user = cursor.fetchone()
+        
+        try:
+            valid = user is not None and hasher.verify(user['password_hash'], password)
+        except HasherBusy:
+            cursor.close()
+            flash('Too many sign-ins right now. Please try again in a moment.', 'danger')
+            return render_template('login.html')
+        
+        if valid and hasher.needs_rehash(user['password_hash']):
+            # Hash parameters changed since this password was stored; upgrade it
+            # now that we have the plaintext
+            try:
+                cursor.execute("UPDATE users SET password_hash = %s WHERE user_id = %s",
+                               (hasher.hash(password), user['user_id']))
+                mysql.connection.commit()
+            except HasherBusy:
+                pass
         cursor.close()
         
-        if user and check_password_hash(user['password_hash'], password):
+        if valid:
             session['user_id'] = user['user_id']
             session['username'] = user['username']
             session['role'] = user['role']
@@ -60,48 +90,226 @@ def logout():
     session.clear()
     return redirect(url_for('main.index'))
 
+# Queries shared with the async app (app/aio.py)
+# Cached with the session (app/sessions.py), so no password_hash
+USER_QUERY = "SELECT user_id, username, email, role, created_at FROM users WHERE user_id = %s"
+
+ADMIN_SUMMARY_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM transactions WHERE status = 'issued') AS active_loans,
+        (SELECT COUNT(*) FROM transactions WHERE status = 'issued' AND due_date < CURRENT_DATE) AS overdue,
+        (SELECT COUNT(*) FROM transactions
+         WHERE status = 'returned' AND return_date >= CURRENT_DATE - INTERVAL 30 DAY) AS recent_returns,
+        (SELECT CAST(COALESCE(SUM(titles), 0) AS SIGNED) FROM category_stats) AS titles,
+        (SELECT CAST(COALESCE(SUM(available_copies), 0) AS SIGNED) FROM category_stats) AS available_copies
+"""
+
+MY_LOANS_QUERY = """
+    SELECT t.transaction_id, t.book_id, b.title, b.image_url, t.borrow_date, t.due_date, t.fine_amount, t.is_overdue, t.status,
+           t.updated_at, b.updated_at AS book_updated_at
+    FROM transactions t
+    JOIN books b ON t.book_id = b.book_id
+    WHERE t.user_id = %s AND t.status = 'issued'
+"""
+
+# Walks the popularity index and stops at the 12th book on the shelf; shown
+# to members who have no recommendations yet
+AVAILABLE_BOOKS_QUERY = """
+    SELECT b.* FROM book_stats s
+    JOIN books b ON b.book_id = s.book_id
+    WHERE b.available_copies > 0
+    ORDER BY s.borrows_30d DESC, s.book_id DESC LIMIT 12
+"""
+
+BOOK_QUERY = """
+    SELECT b.*, a.name as author_name 
+    FROM books b 
+    LEFT JOIN authors a ON b.author_id = a.author_id
+"""
+
+POPULAR_BOOK_QUERY = """
+    SELECT b.*, a.name as author_name, s.borrows_30d
+    FROM book_stats s
+    JOIN books b ON b.book_id = s.book_id
+    LEFT JOIN authors a ON b.author_id = a.author_id
+"""
+
+# Catalog browse orders: (query, keyset columns, descending). Popularity
+# comes from book_stats (0008_book_stats.sql), so a page is a walk down
+# idx_book_stats_popular rather than an aggregate over transactions.
+CATALOG_SORTS = {
+    'title': (BOOK_QUERY, ['b.title', 'b.book_id'], False),
+    'popular': (POPULAR_BOOK_QUERY, ['s.borrows_30d', 's.book_id'], True),
+}
+
+def load_user(user_id):
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute(USER_QUERY, (user_id,))
+    user = cursor.fetchone()
+    cursor.close()
+    return user
+
 @bp.route('/dashboard')
+@mysql.read_only
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('main.index'))
     
+    # User details come from the session store; the query runs once per login
+    user_info = sessions.profile(session['user_id'], lambda: load_user(session['user_id']))
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Fetch User Details
-    cursor.execute("SELECT * FROM users WHERE user_id = %s", (session['user_id'],))
-    user_info = cursor.fetchone()
-    
+
     if session['role'] == 'admin':
-        cursor.execute("""
-            SELECT t.transaction_id, u.username, b.title, b.image_url, t.borrow_date, t.due_date, t.return_date, t.fine_amount, t.status 
-            FROM transactions t
-            JOIN users u ON t.user_id = u.user_id
-            JOIN books b ON t.book_id = b.book_id
-            ORDER BY t.borrow_date DESC
-        """)
-        transactions = cursor.fetchall()
-        
-        cursor.execute("SELECT * FROM books")
-        books = cursor.fetchall()
+        # Only counters here; the panel tables load through admin_panel()
+        cursor.execute(ADMIN_SUMMARY_QUERY)
+        summary = cursor.fetchone()
         
         cursor.close()
-        return render_template('dashboard.html', transactions=transactions, books=books, is_admin=True, user_info=user_info)
+        return render_template('dashboard.html', summary=summary, panels=ADMIN_PANELS, is_admin=True, user_info=user_info)
     else:
         # User: My Current Borrows (With Images)
-        cursor.execute("""
-            SELECT t.transaction_id, b.title, b.image_url, t.borrow_date, t.due_date, t.fine_amount, t.status 
-            FROM transactions t
-            JOIN books b ON t.book_id = b.book_id
-            WHERE t.user_id = %s AND t.status = 'issued'
-        """, (session['user_id'],))
+        cursor.execute(MY_LOANS_QUERY, (session['user_id'],))
         my_books = cursor.fetchall()
         
-        cursor.execute("SELECT * FROM books WHERE available_copies > 0")
-        available_books = cursor.fetchall()
+        # Precomputed picks (app/recommendations.py), else what's popular
+        recommended = recommendations.for_user(mysql.connection, session['user_id'])
+        if not recommended:
+            cursor.execute(AVAILABLE_BOOKS_QUERY)
+            available_books = cursor.fetchall()
+        else:
+            available_books = []
         
         cursor.close()
-        return render_template('dashboard.html', my_books=my_books, available_books=available_books, is_admin=False, user_info=user_info)
+        my_holds = holds.for_user(mysql.connection, session['user_id'])
+        return render_template('dashboard.html', my_books=my_books, recommended=recommended,
+                               available_books=available_books, my_holds=my_holds, is_admin=False,
+                               user_info=user_info)
+
+
+TRANSACTION_PANEL_QUERY = """
+    SELECT t.transaction_id, t.user_id, u.username, b.book_id, b.title,
+           t.borrow_date, t.due_date, t.return_date, t.fine_amount, t.status
+    FROM transactions t
+    JOIN users u ON t.user_id = u.user_id
+    JOIN books b ON t.book_id = b.book_id
+"""
+
+# Admin dashboard panels. Every sort is followed by the primary key as a
+# tie-breaker and matches an index from 0004_query_indexes.sql, so each page
+# is a range scan.
+ADMIN_PANELS = {
+    'active': {
+        'title': 'Active Loans',
+        'query': TRANSACTION_PANEL_QUERY,
+        'where': ["t.status = 'issued'"],
+        'pk': 't.transaction_id',
+        'sorts': {'borrow_date': ['t.borrow_date'], 'due_date': ['t.due_date']},
+        'default_sort': ('borrow_date', 'desc'),
+    },
+    'overdue': {
+        'title': 'Overdue',
+        'query': TRANSACTION_PANEL_QUERY,
+        'where': ["t.status = 'issued'", "t.due_date < CURRENT_DATE"],
+        'pk': 't.transaction_id',
+        'sorts': {'due_date': ['t.due_date']},
+        'default_sort': ('due_date', 'asc'),
+    },
+    'returned': {
+        'title': 'Recent Returns',
+        'query': TRANSACTION_PANEL_QUERY,
+        'where': ["t.status = 'returned'"],
+        'pk': 't.transaction_id',
+        'sorts': {'return_date': ['t.return_date']},
+        'default_sort': ('return_date', 'desc'),
+    },
+    'inventory': {
+        'title': 'Inventory',
+        'query': """
+            SELECT b.book_id, b.title, b.isbn, b.total_copies, b.available_copies, b.publication_year
+            FROM books b
+        """,
+        'where': [],
+        'pk': 'b.book_id',
+        'sorts': {'title': ['b.title'], 'available_copies': ['b.available_copies', 'b.title']},
+        'default_sort': ('title', 'asc'),
+    },
+}
+
+PANEL_PAGE_SIZE = 25
+
+
+def _json_row(row):
+    # Dates as ISO strings and money as numbers, rather than Flask's defaults
+    out = {}
+    for key, value in row.items():
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        elif isinstance(value, decimal.Decimal):
+            value = float(value)
+        out[key] = value
+    return out
+
+
+@bp.route('/admin/panels/<panel>')
+@mysql.read_only
+def admin_panel(panel):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return {'status': 'error', 'message': 'Forbidden'}, 403
+    spec = ADMIN_PANELS.get(panel)
+    if spec is None:
+        return {'status': 'error', 'message': 'Unknown panel'}, 404
 
+    sort = request.args.get('sort', spec['default_sort'][0])
+    if sort not in spec['sorts']:
+        sort = spec['default_sort'][0]
+    descending = request.args.get('dir', spec['default_sort'][1]) == 'desc'
+    columns = spec['sorts'][sort] + [spec['pk']]
+    after = valid_cursor(decode_cursor(request.args.get('after')), [SCALAR] * len(columns))
+    before = valid_cursor(decode_cursor(request.args.get('before')), [SCALAR] * len(columns))
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    where, params = list(spec['where']), []
+
+    # Filters map onto indexed equality predicates
+    if panel == 'inventory':
+        if request.args.get('stock') == 'out':
+            where.append("b.available_copies = 0")
+    else:
+        username = request.args.get('user', '').strip()
+        if username:
+            cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+            user = cursor.fetchone()
+            if not user:
+                cursor.close()
+                return {'rows': [], 'next': None, 'prev': None}
+            where.append("t.user_id = %s")
+            params.append(user['user_id'])
+
+    cursor_values = before if before is not None else after
+    if cursor_values is not None:
+        # Walking backwards flips the comparison, and so does a descending sort
+        condition, seek_params = seek_condition(columns, cursor_values, reverse=descending != (before is not None))
+        where.append(condition)
+        params.extend(seek_params)
+
+    direction = 'DESC' if descending != (before is not None) else 'ASC'
+    query = spec['query']
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY " + ", ".join(f"{column} {direction}" for column in columns) + " LIMIT %s"
+    params.append(PANEL_PAGE_SIZE + 1)
+
+    cursor.execute(query, tuple(params))
+    rows, has_prev, has_next = seek_rows(cursor.fetchall(), PANEL_PAGE_SIZE, after, before)
+    cursor.close()
+
+    names = [column.split('.')[1] for column in columns]
+    keys = [tuple(row[name] for name in names) for row in rows]
+    return {
+        'rows': [_json_row(row) for row in rows],
+        'prev': encode_cursor(keys[0]) if has_prev and keys else None,
+        'next': encode_cursor(keys[-1]) if has_next and keys else None,
+    }
 
 @bp.route('/add_book', methods=['POST'])
 def add_book():
@@ -118,6 +326,11 @@ def add_book():
         cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies, publication_year) VALUES (%s, %s, %s, %s, %s)", 
                        (title, isbn, copies, copies, year))
         mysql.connection.commit()
+        search_index.add(cursor.lastrowid, title)
+        # A new title can land on any listing or search page
+        cache.invalidate('catalog')
+        mysql.stick_to_primary()
+        events.catalog_changed()
         flash('Book added successfully!', 'success')
     except Exception as e:
         flash(f'Error adding book: {str(e)}', 'danger')
@@ -126,77 +339,146 @@ def add_book():
         
     return redirect(url_for('main.dashboard'))
 
-@bp.route('/books')
-def catalog():
-    page = request.args.get('page', 1, type=int)
-    search_query = request.args.get('q', '')
-    limit = 12
-    offset = (page - 1) * limit
-    
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    query = """
-        SELECT b.*, a.name as author_name 
-        FROM books b 
-        LEFT JOIN authors a ON b.author_id = a.author_id
-    """
+def books_by_id_query(book_ids):
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    return BOOK_QUERY + f" WHERE b.book_id IN ({placeholders})", tuple(book_ids)
+
+def browse_cursors(after, before, sort='title'):
+    # Drops cursors that can't be a key of this sort, e.g. from a search page
+    kinds = [SCALAR] * len(CATALOG_SORTS[sort][1])
+    return valid_cursor(after, kinds), valid_cursor(before, kinds)
+
+def browse_query(after, before, limit, sort='title'):
+    # Seek on the sort key plus book_id so deep pages cost the same as the
+    # first one. Cursors must have been through browse_cursors.
+    query, columns, descending = CATALOG_SORTS[sort]
     params = []
+    cursor_values = before if before is not None else after
+    if cursor_values is not None:
+        condition, params = seek_condition(columns, cursor_values, reverse=descending != (before is not None))
+        query += f" WHERE {condition}"
+    direction = 'DESC' if descending != (before is not None) else 'ASC'
+    query += " ORDER BY " + ", ".join(f"{column} {direction}" for column in columns) + " LIMIT %s"
+    params.append(limit + 1)
+    return query, tuple(params)
+
+def browse_keys(books, sort='title'):
+    names = [column.split('.')[1] for column in CATALOG_SORTS[sort][1]]
+    return [tuple(book[name] for name in names) for book in books]
+
+def catalog_page(books, keys, total, has_prev, has_next):
+    return {
+        'books': books,
+        'total': total,
+        'prev_cursor': encode_cursor(keys[0]) if has_prev and keys else None,
+        'next_cursor': encode_cursor(keys[-1]) if has_next and keys else None,
+    }
+
+def load_catalog_page(search_query, after, before, limit=12, sort='title'):
+    # Fills a cache entry that outlives any replica lag, so it reads the
+    # primary: a lagging replica would re-cache the page an edit just
+    # invalidated, or drop search hits the index already has
+    connection = mysql.primary_connection
+    cursor = connection.cursor(MySQLdb.cursors.DictCursor)
     
     if search_query:
-        query += " WHERE b.title LIKE %s OR a.name LIKE %s"
-        search_term = f"%{search_query}%"
-        params.extend([search_term, search_term])
-        
-    query += " LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
+        # Ranked ids come from the in-process index; MySQL only fetches the page.
+        # Cursors carry (-score, book_id) so pages follow relevance order.
+        search_index.ensure_loaded(connection)
+        ranked = [(-score, book_id) for score, book_id in search_index.search_scored(search_query)]
+        keys, has_prev, has_next = seek_list(ranked, limit, after, before)
+        total = len(ranked)
+        books = []
+        if keys:
+            book_ids = [book_id for _, book_id in keys]
+            cursor.execute(*books_by_id_query(book_ids))
+            rows = {row['book_id']: row for row in cursor.fetchall()}
+            books = [rows[book_id] for book_id in book_ids if book_id in rows]
+    else:
+        after, before = browse_cursors(after, before, sort)
+        cursor.execute(*browse_query(after, before, limit, sort))
+        books, has_prev, has_next = seek_rows(cursor.fetchall(), limit, after, before)
+        keys = browse_keys(books, sort)
+        total = approximate_count(connection, 'books')
     
-    cursor.execute(query, tuple(params))
-    books = cursor.fetchall()
+    cursor.close()
+    return catalog_page(books, keys, total, has_prev, has_next)
+
+@bp.route('/books')
+@mysql.read_only
+def catalog():
+    search_query = request.args.get('q', '')
+    sort = request.args.get('sort', 'title')
+    if sort not in CATALOG_SORTS:
+        sort = 'title'
+    after_token = request.args.get('after')
+    before_token = request.args.get('before')
     
-    # Simple count check
-    cursor.execute("SELECT COUNT(*) as count FROM books") 
-    has_next = len(books) == limit
+    # Cursor tokens are base64url, so the query text can safely come last
+    key = f"catalog:{sort}:{after_token or ''}:{before_token or ''}:{search_query}"
+    page = cache.get_or_set(
+        key,
+        lambda: load_catalog_page(search_query, decode_cursor(after_token), decode_cursor(before_token), sort=sort),
+        tags=lambda page: ['catalog'] + [f"book:{book['book_id']}" for book in page['books']],
+    )
+    # Stock comes from the counter cache, not the (possibly older) cached page.
+    # Counters are filled from the primary so a lagging replica can't re-cache
+    # a count that a borrow just invalidated.
+    books = availability.overlay(lambda: mysql.primary_connection, page['books'])
     
+    return render_template('catalog.html', books=books, search_query=search_query, total=page['total'],
+                           prev_cursor=page['prev_cursor'], next_cursor=page['next_cursor'],
+                           is_estimate=not search_query, sort=sort)
+
+@bp.route('/books/suggest')
+@mysql.read_only
+def suggest_books():
+    query = request.args.get('q', '')
+    if len(query.strip()) < 2:
+        return {'suggestions': []}
+    search_index.ensure_loaded(mysql.connection)
+    return {'suggestions': search_index.suggest(query)}
+
+def load_book(book_id):
+    # Cached like catalog pages, so read from the primary too
+    cursor = mysql.primary_connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute(BOOK_QUERY + " WHERE b.book_id = %s", (book_id,))
+    book = cursor.fetchone()
     cursor.close()
-    return render_template('catalog.html', books=books, page=page, search_query=search_query, has_next=has_next)
+    return book
 
 @bp.route('/borrow/confirm/<int:book_id>')
+@mysql.read_only
 def confirm_borrow(book_id):
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
         
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("""
-        SELECT b.*, a.name as author_name 
-        FROM books b 
-        LEFT JOIN authors a ON b.author_id = a.author_id 
-        WHERE b.book_id = %s
-    """, (book_id,))
-    book = cursor.fetchone()
-    cursor.close()
+    book = cache.get_or_set(f'book:{book_id}', lambda: load_book(book_id), tags=[f'book:{book_id}'])
     
     if not book:
         return redirect(url_for('main.catalog'))
+    book = availability.overlay(lambda: mysql.primary_connection, [book])[0]
+    also_borrowed = recommendations.for_book(mysql.connection, book_id)
         
     today = datetime.date.today()
     due_date = today + datetime.timedelta(days=14)
     
-    return render_template('borrow_confirm.html', book=book, today=today, due_date=due_date)
+    return render_template('borrow_confirm.html', book=book, today=today, due_date=due_date,
+                           also_borrowed=also_borrowed)
 
 @bp.route('/borrow/process/<int:book_id>', methods=['POST'])
 def process_borrow(book_id):
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
         
-    cursor = mysql.connection.cursor()
     try:
-        cursor.callproc('issue_book', (session['user_id'], book_id))
-        mysql.connection.commit()
+        borrow_book(mysql.connection, session['user_id'], book_id)
+        availability.invalidate(book_id)
+        mysql.stick_to_primary()
+        announce([book_id], session['user_id'], 'borrowed')
         flash('Book borrowed successfully! Enjoy reading.', 'success')
     except Exception as e:
         flash(f'Error borrowing book: {str(e)}', 'danger')
-    finally:
-        cursor.close()
         
     return redirect(url_for('main.dashboard'))
 
@@ -205,18 +487,130 @@ def return_book_route(transaction_id):
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
     
-    cursor = mysql.connection.cursor()
     try:
-        cursor.callproc('return_book', (transaction_id,))
-        mysql.connection.commit()
+        allocated = []
+        loan = return_book(mysql.connection, transaction_id, allocated)
+        if loan is not None:
+            book_id, owner_id = loan
+            availability.invalidate(book_id)
+            # The loan's owner, who may not be the one returning it
+            announce([book_id], owner_id, 'returned', allocated)
+        mysql.stick_to_primary()
         flash('Book returned successfully!', 'success')
     except Exception as e:
         flash(f'Error returning book: {str(e)}', 'danger')
-    finally:
-        cursor.close()
-        
+
+    return redirect(url_for('main.dashboard'))
+
+def announce(book_ids, user_id=None, change=None, allocated=()):
+    # Push the new stock of `book_ids` and the user's loan change to open
+    # /events streams. Call after the write committed; counts come from
+    # the primary, like the availability overlay.
+    try:
+        watched = [book_id for book_id in book_ids if events.wants(f'book:{book_id}')]
+        if watched:
+            events.availability(availability.get_many(lambda: mysql.primary_connection, watched))
+        if user_id is not None and change is not None:
+            for book_id in book_ids:
+                events.loans_changed(user_id, book_id, change)
+        for hold in allocated:
+            events.loans_changed(hold['user_id'], hold['book_id'], 'hold_ready')
+    except Exception:
+        # The write went through; clients catch up on their next page load
+        current_app.logger.exception('could not publish events')
+
+@bp.route('/events')
+def event_stream():
+    # Server-Sent Events: stock of the ?books= ids, the catalog with
+    # ?catalog=1, and the logged-in member's loans and holds
+    try:
+        book_ids = [int(b) for b in request.args.get('books', '').split(',') if b.strip()][:events.max_books]
+    except ValueError:
+        return {'status': 'error', 'message': 'books must be a comma-separated list of ids'}, 400
+    try:
+        subscriber = events.subscribe(book_ids, session.get('user_id'), catalog=request.args.get('catalog') == '1')
+    except EventsBusy:
+        return {'status': 'error', 'message': 'Too many open event streams'}, 503, {'Retry-After': '30'}
+
+    def stream():
+        # The browser reconnects after `retry` ms; comments keep proxies
+        # from timing out an idle stream
+        yield 'retry: 5000\n\n'
+        while not subscriber.closed:
+            pending = subscriber.wait(events.heartbeat)
+            if pending:
+                yield ''.join(format_sse(event) for event in pending)
+            else:
+                yield ': ping\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: events.unsubscribe(subscriber))
+    return response
+
+@bp.route('/holds/<int:book_id>', methods=['POST'])
+def place_hold_route(book_id):
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    try:
+        place_hold(mysql.connection, session['user_id'], book_id)
+        mysql.stick_to_primary()
+        announce([book_id], session['user_id'], 'hold_placed')
+        flash("You're on the waitlist. We'll keep the next returned copy for you.", 'success')
+    except HoldError as e:
+        flash(str(e), 'danger')
+
+    return redirect(url_for('main.dashboard'))
+
+@bp.route('/holds/<int:hold_id>/cancel', methods=['POST'])
+def cancel_hold_route(hold_id):
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    book_id = cancel_hold(mysql.connection, session['user_id'], hold_id)
+    if book_id is not None:
+        availability.invalidate(book_id)
+        mysql.stick_to_primary()
+        announce([book_id], session['user_id'], 'hold_cancelled')
+        flash('Hold cancelled.', 'success')
+
     return redirect(url_for('main.dashboard'))
 
+def load_image_url(book_id):
+    cursor = mysql.primary_connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute("SELECT image_url FROM books WHERE book_id = %s", (book_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row['image_url'] if row else None
+
+@bp.app_template_global()
+def cover_url(book, size='card'):
+    # ?v= changes with image_url, which is what lets /covers be cached forever
+    return url_for('main.cover', book_id=book['book_id'], size=size, v=covers.version(book.get('image_url')))
+
+@bp.route('/covers/<int:book_id>/<size>')
+@mysql.read_only
+def cover(book_id, size):
+    if size not in COVER_SIZES:
+        abort(404)
+    image_url = cache.get_or_set(f'cover:{book_id}', lambda: load_image_url(book_id), tags=[f'book:{book_id}'])
+
+    # Don't hold a pool connection while waiting on the origin
+    mysql.teardown()
+
+    try:
+        path = covers.get(image_url, size)
+    except CoverUnavailable:
+        return redirect(url_for('static', filename='no-cover.svg'))
+
+    versioned = request.args.get('v') == covers.version(image_url)
+    response = send_file(path, mimetype=covers.mimetype(path), max_age=31536000 if versioned else 300)
+    if versioned:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
 @bp.route('/auth/firebase-login', methods=['POST'])
 def firebase_login():
     data = request.get_json()
@@ -232,10 +626,9 @@ def firebase_login():
     
     if not user:
         # Register new firebase user
-        # We set a placeholder password since they login via Auth provider
-        hashed_password = generate_password_hash('firebase_oauth_secret') 
+        # They login via the Auth provider, so store a password that never matches
         cursor.execute("INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, %s, 'member')", 
-                       (username, email, hashed_password))
+                       (username, email, UNUSABLE_PASSWORD))
         mysql.connection.commit()
         
         # Fetch newly created user
@@ -251,6 +644,69 @@ def firebase_login():
     
     return {'status': 'success', 'redirect': url_for('main.dashboard')}
 
+@bp.route('/admin/stats')
+def admin_stats():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return {'status': 'error', 'message': 'Forbidden'}, 403
+    return {'pool': mysql.pool.stats(), 'replicas': mysql.replicas.stats(), 'cache': cache.stats(),
+            'sessions': sessions.stats(), 'events': events.stats(), 'lock_retries': retry.retries}
+
+@bp.route('/admin/export/<name>')
+@mysql.read_only
+def admin_export(name):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return {'status': 'error', 'message': 'Forbidden'}, 403
+    if name not in EXPORTS:
+        return {'status': 'error', 'message': 'Unknown export'}, 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return {'status': 'error', 'message': 'format must be csv or ndjson'}, 400
+    try:
+        start = datetime.date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return {'status': 'error', 'message': 'from and to must be YYYY-MM-DD dates'}, 400
+
+    encode, mimetype = EXPORT_FORMATS[fmt]
+    batches = stream_rows(mysql.connection, *export_query(name, start, end),
+                          batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    body = encode(batches)
+    filename = f'{name}.{fmt}'
+    if request.args.get('gzip') in ('1', 'true'):
+        body, mimetype, filename = gzip_stream(body), 'application/gzip', filename + '.gz'
+
+    # stream_with_context keeps the request (and its pooled connection) alive
+    # until the last chunk is sent
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/admin/users/<int:user_id>/role', methods=['POST'])
+def set_user_role(user_id):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return {'status': 'error', 'message': 'Forbidden'}, 403
+    role = request.form.get('role')
+    if role not in ('admin', 'member'):
+        return {'status': 'error', 'message': 'role must be admin or member'}, 400
+
+    cursor = mysql.connection.cursor()
+    cursor.execute("UPDATE users SET role = %s WHERE user_id = %s", (role, user_id))
+    mysql.connection.commit()
+    found = cursor.rowcount
+    cursor.close()
+    if not found:
+        return {'status': 'error', 'message': 'Unknown user'}, 404
+    # Takes effect on the user's next request, in every session they have open
+    sessions.user_changed(user_id, role=role)
+    return {'status': 'success'}
+
+@bp.route('/admin/users/<int:user_id>/revoke', methods=['POST'])
+def revoke_user_sessions(user_id):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return {'status': 'error', 'message': 'Forbidden'}, 403
+    return {'status': 'success', 'revoked': sessions.revoke_user(user_id)}
+
 @bp.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Field bits packed into each posting, and how much a hit in that field is worth
+TITLE, AUTHOR, DESCRIPTION = 1, 2, 4
+FIELD_WEIGHTS = {TITLE: 3.0, AUTHOR: 2.0, DESCRIPTION: 1.0}
+MASK_WEIGHTS = [sum(w for bit, w in FIELD_WEIGHTS.items() if mask & bit) for mask in range(8)]
+
+LOAD_QUERY = """
+    SELECT b.book_id, b.title, b.description, a.name AS author_name
+    FROM books b
+    LEFT JOIN authors a ON b.author_id = a.author_id
+    WHERE b.book_id > %s
+    ORDER BY b.book_id
+"""
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """In-process inverted index over book title, author and description.
+
+    Every token maps to a posting list of `book_id << 3 | field bits`, kept in
+    book_id order because books are only ever appended. Queries match all
+    terms; the last term is also matched as a prefix so the index can serve
+    type-ahead. Results are ranked by field-weighted hits, ties by book_id.
+    The sorted vocabulary for prefix lookups is brought up to date lazily,
+    on the first prefix lookup after new tokens arrive.
+    """
+
+    def __init__(self, max_expansions=64, refresh_interval=30):
+        self.max_expansions = max_expansions
+        self.refresh_interval = refresh_interval
+        self._postings = {}
+        self._vocab = []  # sorted, for prefix lookups
+        self._new_tokens = []  # not in _vocab yet
+        self._titles = {}
+        self._max_id = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_expansions = app.config.get('SEARCH_MAX_EXPANSIONS', self.max_expansions)
+        self.refresh_interval = app.config.get('SEARCH_REFRESH_INTERVAL', self.refresh_interval)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, book_id, title, author=None, description=None):
+        fields = {}
+        for bit, text in ((TITLE, title), (AUTHOR, author), (DESCRIPTION, description)):
+            for token in tokenize(text):
+                fields[token] = fields.get(token, 0) | bit
+
+        with self._lock:
+            if book_id in self._titles:
+                return
+            for token, bits in fields.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = array('q')
+                    self._new_tokens.append(token)
+                postings.append(book_id << 3 | bits)
+            self._titles[book_id] = title
+
+    def load(self, connection, batch_size=5000):
+        # Stream new rows (book_id > highest indexed id) out of the database
+        cursor = connection.cursor()
+        cursor.execute(LOAD_QUERY, (self._max_id,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            self.ingest(rows)
+        cursor.close()
+        self.mark_loaded()
+
+    def ingest(self, rows):
+        # Rows from LOAD_QUERY, in book_id order
+        for row in rows:
+            self.add(row['book_id'], row['title'], row['author_name'], row['description'])
+        # Only rows read from the DB advance the watermark; add() may run ahead of it
+        if rows:
+            self._max_id = rows[-1]['book_id']
+
+    def mark_loaded(self):
+        self._loaded = True
+        self._last_refresh = time.monotonic()
+
+    @property
+    def watermark(self):
+        return self._max_id
+
+    @property
+    def generation(self):
+        # Changes whenever the indexed books do; the same in every process
+        # that has indexed the same books
+        return self._max_id, len(self._titles)
+
+    def needs_refresh(self):
+        # Build on first use, then pick up books added by other workers periodically
+        return not self._loaded or time.monotonic() - self._last_refresh > self.refresh_interval
+
+    def ensure_loaded(self, connection):
+        if self.needs_refresh():
+            self.load(connection)
+
+    def search(self, query, limit=None, prefix=True):
+        ranked = [book_id for _, book_id in self.search_scored(query, prefix)]
+        return ranked[:limit] if limit else ranked
+
+    def search_scored(self, query, prefix=True):
+        # Returns (score, book_id) pairs, best first
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Rarest term first so the candidate set starts small
+        matches = [self._match(term, prefix and i == len(terms) - 1) for i, term in enumerate(terms)]
+        matches.sort(key=len)
+
+        scores = matches[0]
+        for other in matches[1:]:
+            scores = {book_id: score + other[book_id] for book_id, score in scores.items() if book_id in other}
+            if not scores:
+                return []
+
+        return sorted(((score, book_id) for book_id, score in scores.items()), key=lambda r: (-r[0], r[1]))
+
+    def suggest(self, query, limit=8):
+        return [{'book_id': book_id, 'title': self._titles[book_id]}
+                for book_id in self.search(query, limit=limit)]
+
+    def _sorted_vocab(self):
+        # One sort per batch of new tokens rather than a list insert per
+        # token, which made building quadratic in the vocabulary size
+        if self._new_tokens:
+            with self._lock:
+                if self._new_tokens:
+                    self._vocab = sorted(self._vocab + self._new_tokens)
+                    self._new_tokens = []
+        return self._vocab
+
+    def _expand(self, term):
+        vocab = self._sorted_vocab()
+        start = bisect_left(vocab, term)
+        expanded = []
+        for token in vocab[start:start + self.max_expansions]:
+            if not token.startswith(term):
+                break
+            expanded.append(token)
+        return expanded
+
+    def _match(self, term, prefix):
+        tokens = self._expand(term) if prefix else [term]
+        scores = {}
+        for token in tokens:
+            # Exact hits outrank prefix completions of the same field
+            boost = 1.0 if token == term else 0.5
+            for posting in self._postings.get(token, ()):
+                book_id = posting >> 3
+                score = boost * MASK_WEIGHTS[posting & 7]
+                if score > scores.get(book_id, 0):
+                    scores[book_id] = score
+        return scores
+
+
+search_index = SearchIndex()
@@ -0,0 +1,325 @@
+import pickle
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:  # optional, only needed for SESSION_BACKEND = 'redis'
+    redis = None
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data held server-side; the cookie carries only `sid`."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Who was logged in when the request started; a change means a login
+        # or logout and the sid is rotated (no session fixation)
+        self.opened_user = self.get('user_id')
+
+
+class MemorySessionStore:
+    """Per-process LRU of sessions and cached user profiles.
+
+    Sessions are indexed by user_id so one user's sessions can be updated or
+    revoked together. Only correct with a single server process (or the
+    threaded dev server); use the Redis store to share sessions between
+    processes.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()  # sid -> (expires_at, data)
+        self._profiles = OrderedDict()  # user_id -> (expires_at, profile)
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(sid)
+                return None
+            self._sessions.move_to_end(sid)
+            return dict(entry[1])
+
+    def save(self, sid, data, ttl):
+        with self._lock:
+            if sid in self._sessions:
+                self._remove(sid)
+            self._sessions[sid] = (time.monotonic() + ttl, dict(data))
+            if data.get('user_id') is not None:
+                self._by_user.setdefault(data['user_id'], set()).add(sid)
+            while len(self._sessions) > self.max_entries:
+                self._remove(next(iter(self._sessions)))
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (time.monotonic() + ttl, entry[1])
+
+    def delete(self, sid):
+        with self._lock:
+            if sid in self._sessions:
+                self._remove(sid)
+
+    def update_user(self, user_id, fields):
+        with self._lock:
+            sids = self._by_user.get(user_id, ())
+            for sid in sids:
+                self._sessions[sid][1].update(fields)
+            return len(sids)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            sids = list(self._by_user.get(user_id, ()))
+            for sid in sids:
+                self._remove(sid)
+            self._profiles.pop(user_id, None)
+            return len(sids)
+
+    def revoke_all(self):
+        with self._lock:
+            count = len(self._sessions)
+            self._sessions.clear()
+            self._by_user.clear()
+            self._profiles.clear()
+            return count
+
+    def get_profile(self, user_id):
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._profiles.move_to_end(user_id)
+            return entry[1]
+
+    def set_profile(self, user_id, profile, ttl):
+        with self._lock:
+            self._profiles[user_id] = (time.monotonic() + ttl, profile)
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+
+    def drop_profile(self, user_id):
+        with self._lock:
+            self._profiles.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._sessions), 'profiles': len(self._profiles)}
+
+    def _remove(self, sid):
+        # Called with the lock held
+        _, data = self._sessions.pop(sid)
+        sids = self._by_user.get(data.get('user_id'))
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_user[data['user_id']]
+
+
+class RedisSessionStore:
+    """Sessions on a local Redis-compatible server, shared by every process.
+
+    Values are pickled, so point it only at a server this app owns. Each
+    user's session ids are kept in a set for bulk updates and revocation.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='library:session:'):
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND = 'redis' needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        raw = self.client.get(self.prefix + 'sid:' + sid)
+        return pickle.loads(raw) if raw is not None else None
+
+    def save(self, sid, data, ttl):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + 'sid:' + sid, pickle.dumps(dict(data)), ex=ttl)
+        if data.get('user_id') is not None:
+            user_key = self._user_key(data['user_id'])
+            pipe.sadd(user_key, sid)
+            pipe.expire(user_key, ttl)
+        pipe.execute()
+
+    def touch(self, sid, ttl):
+        self.client.expire(self.prefix + 'sid:' + sid, ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + 'sid:' + sid)
+
+    def update_user(self, user_id, fields):
+        updated = 0
+        for sid in self._user_sids(user_id):
+            key = self.prefix + 'sid:' + sid
+            raw = self.client.get(key)
+            if raw is not None:
+                self.client.set(key, pickle.dumps(dict(pickle.loads(raw), **fields)), keepttl=True)
+                updated += 1
+        return updated
+
+    def revoke_user(self, user_id):
+        sids = self._user_sids(user_id)
+        keys = [self.prefix + 'sid:' + sid for sid in sids]
+        self.client.delete(self._user_key(user_id), self._profile_key(user_id), *keys)
+        return len(sids)
+
+    def revoke_all(self):
+        count = 0
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        for start in range(0, len(keys), 1000):
+            count += sum(key.startswith((self.prefix + 'sid:').encode()) for key in keys[start:start + 1000])
+            self.client.delete(*keys[start:start + 1000])
+        return count
+
+    def get_profile(self, user_id):
+        raw = self.client.get(self._profile_key(user_id))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set_profile(self, user_id, profile, ttl):
+        self.client.set(self._profile_key(user_id), pickle.dumps(profile), ex=ttl)
+
+    def drop_profile(self, user_id):
+        self.client.delete(self._profile_key(user_id))
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}user:{user_id}'
+
+    def _profile_key(self, user_id):
+        return f'{self.prefix}profile:{user_id}'
+
+    def _user_sids(self, user_id):
+        return [sid.decode() for sid in self.client.smembers(self._user_key(user_id))]
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a memory or Redis session store.
+
+    The cookie holds a random session id instead of the signed session data.
+    The store also caches each logged-in user's profile row, so the
+    dashboard doesn't re-read `users` on every load; call `user_changed`
+    after updating a user and `revoke_user` to log them out everywhere.
+    Configured like the MySQL shim.
+    """
+
+    def __init__(self, app=None):
+        self.store = MemorySessionStore()
+        self.ttl = 14 * 24 * 3600
+        self.profile_ttl = 3600
+        self.instrumentation = None
+        self._lock = threading.Lock()
+        self._stats = {'profile_hits': 0, 'profile_misses': 0, 'revoked': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SESSION_TTL', self.ttl)
+        self.profile_ttl = app.config.get('SESSION_PROFILE_TTL', self.profile_ttl)
+        if app.config.get('SESSION_BACKEND', 'memory') == 'redis':
+            self.store = RedisSessionStore(app.config.get('SESSION_REDIS_URL') or
+                                           app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        else:
+            self.store = MemorySessionStore(app.config.get('SESSION_MAX_ENTRIES', 10000))
+        app.session_interface = self
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.load(sid) if sid else None
+        if data is None:
+            return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+        return ServerSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            if not session.new and session.get('user_id') != session.opened_user:
+                self.store.delete(session.sid)
+                session.sid = secrets.token_urlsafe(32)
+            self.store.save(session.sid, session, self.ttl)
+        elif self.should_set_cookie(app, session):
+            # SESSION_REFRESH_EACH_REQUEST: slide the server-side expiry too
+            self.store.touch(session.sid, self.ttl)
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app), domain=domain, path=path)
+
+    def profile(self, user_id, loader):
+        # Read-through like Cache.get_or_set; each hit is a users query saved
+        profile = self.cached_profile(user_id)
+        if profile is None:
+            profile = self.remember_profile(user_id, loader())
+        return profile
+
+    # The I/O-free halves of profile(), shared with the async app
+
+    def cached_profile(self, user_id):
+        profile = self.store.get_profile(user_id)
+        with self._lock:
+            self._stats['profile_hits' if profile is not None else 'profile_misses'] += 1
+        if profile is not None and self.instrumentation is not None:
+            self.instrumentation.record_saved()
+        return profile
+
+    def remember_profile(self, user_id, profile):
+        if profile is not None:
+            self.store.set_profile(user_id, profile, self.profile_ttl)
+        return profile
+
+    def user_changed(self, user_id, **fields):
+        # Drop the cached profile and push changed session fields (role,
+        # username) into every live session of this user
+        self.store.drop_profile(user_id)
+        if fields:
+            self.store.update_user(user_id, fields)
+
+    def revoke_user(self, *user_ids):
+        revoked = sum(self.store.revoke_user(user_id) for user_id in user_ids)
+        with self._lock:
+            self._stats['revoked'] += revoked
+        return revoked
+
+    def revoke_all(self):
+        revoked = self.store.revoke_all()
+        with self._lock:
+            self._stats['revoked'] += revoked
+        return revoked
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.store.stats())
+        return stats
+
+
+sessions = ServerSessionInterface()
@@ -0,0 +1,26 @@
+"""ASGI entry point: async views with the WSGI app behind them.
+
+    hypercorn asgi:app --bind 127.0.0.1:8001 --workers 2
+
+or `python asgi.py` for a single local process. See app/aio.py.
+"""
+import asyncio
+
+from app import create_app
+from app.aio import create_app as create_async_app, Dispatcher
+
+# With `python asgi.py` the password hashing workers (app/passwords.py)
+# re-import this script as __mp_main__; they mustn't build the app, which
+# with PRELOAD would open a pool of connections in each of them
+if __name__ != '__mp_main__':
+    wsgi_app = create_app()
+    async_app = create_async_app(wsgi_app)
+    app = Dispatcher(async_app, wsgi_app)
+
+if __name__ == "__main__":
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
+
+    config = HypercornConfig()
+    config.bind = ["127.0.0.1:8001"]
+    asyncio.run(serve(app, config))
@@ -0,0 +1,129 @@
+"""Batch borrow/return against the per-item path.
+
+A circulation desk checks out and takes back a stack of --batch books. The
+per-item path does one issue_book/return_book call and one commit per book;
+the batch path does the whole stack in one transaction with one stock
+UPDATE. Both run --rounds times against the configured database on fixture
+rows that are removed afterwards.
+
+    python -m benchmarks.batch_circulation --batch 20 --rounds 50
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+import app  # noqa: F401  installs pymysql as MySQLdb
+import MySQLdb
+import MySQLdb.cursors
+from app.circulation import borrow_book, return_book, borrow_books, return_books
+
+load_dotenv()
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+    )
+
+
+def create_fixture(db, books):
+    tag = uuid.uuid4().hex[:10]
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, '!')",
+                   (f'desk_{tag}', f'desk_{tag}@example.com'))
+    user_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, 5, 5)",
+                       [(f'Desk Stack {tag} {i}', f'ds{tag}{i}') for i in range(books)])
+    cursor.execute("SELECT book_id FROM books WHERE isbn LIKE %s ORDER BY book_id", (f'ds{tag}%',))
+    book_ids = [row['book_id'] for row in cursor.fetchall()]
+    db.commit()
+    return user_id, book_ids
+
+
+def drop_fixture(db, user_id, book_ids):
+    cursor = db.cursor()
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    cursor.execute(f"DELETE FROM books WHERE book_id IN ({placeholders})", tuple(book_ids))
+    cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+    db.commit()
+
+
+def open_loans(db, user_id):
+    cursor = db.cursor()
+    cursor.execute("SELECT transaction_id FROM transactions WHERE user_id = %s AND status = 'issued' "
+                   "ORDER BY transaction_id", (user_id,))
+    loans = [row['transaction_id'] for row in cursor.fetchall()]
+    db.commit()
+    return loans
+
+
+def per_item_round(db, user_id, book_ids):
+    started = time.perf_counter()
+    for book_id in book_ids:
+        borrow_book(db, user_id, book_id)
+    borrowed = time.perf_counter()
+    for transaction_id in open_loans(db, user_id):
+        return_book(db, transaction_id)
+    return borrowed - started, time.perf_counter() - borrowed
+
+
+def batch_round(db, user_id, book_ids):
+    started = time.perf_counter()
+    results = borrow_books(db, user_id, book_ids, max_batch=len(book_ids))
+    borrowed = time.perf_counter()
+    loans = [r['transaction_id'] for r in results if r['status'] == 'issued']
+    return_books(db, loans, max_batch=len(loans))
+    return borrowed - started, time.perf_counter() - borrowed
+
+
+def stock(db, book_ids):
+    cursor = db.cursor()
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    cursor.execute(f"SELECT SUM(available_copies) AS n FROM books WHERE book_id IN ({placeholders})",
+                   tuple(book_ids))
+    total = int(cursor.fetchone()['n'])
+    db.commit()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch', type=int, default=20, help="books per desk transaction")
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    db = connect()
+    user_id, book_ids = create_fixture(db, args.batch)
+    failures = []
+    try:
+        for label, run in (('per-item', per_item_round), ('batch', batch_round)):
+            run(db, user_id, book_ids)  # warm up
+            borrow_time = return_time = 0.0
+            for _ in range(args.rounds):
+                b, r = run(db, user_id, book_ids)
+                borrow_time += b
+                return_time += r
+            items = args.rounds * args.batch
+            print(f"{label:<9} borrow {items / borrow_time:9,.0f} books/s ({borrow_time / args.rounds * 1000:7.1f} ms/stack)"
+                  f"   return {items / return_time:9,.0f} books/s ({return_time / args.rounds * 1000:7.1f} ms/stack)")
+            if stock(db, book_ids) != 5 * len(book_ids) or open_loans(db, user_id):
+                failures.append(f"{label}: stock or loans didn't return to their starting state")
+    finally:
+        drop_fixture(db, user_id, book_ids)
+        db.close()
+
+    if failures:
+        print("FAILURE:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Concurrent borrow/return load test on a single hot title.
+
+Hundreds of threads race to borrow a book that has only --copies copies,
+then every loan is returned twice concurrently. The run fails if the title is
+ever oversold, if a duplicate return inflates stock, or if stock doesn't end
+where it started. Runs against the configured database and removes its
+fixture rows afterwards.
+
+    python -m benchmarks.borrow_contention --threads 300 --copies 25
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+import app  # noqa: F401  installs pymysql as MySQLdb
+import MySQLdb
+import MySQLdb.cursors
+from app.circulation import retry, borrow_book, return_book
+from app.pool import ConnectionPool
+
+load_dotenv()
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+    )
+
+
+def create_fixture(copies, users):
+    tag = uuid.uuid4().hex[:10]
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, %s, %s)",
+                   (f'Hot Title {tag}', f'hot{tag}', copies, copies))
+    book_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, '!')",
+                       [(f'load_{tag}_{i}', f'load_{tag}_{i}@example.com') for i in range(users)])
+    cursor.execute("SELECT user_id FROM users WHERE username LIKE %s", (f'load\\_{tag}\\_%',))
+    user_ids = [row['user_id'] for row in cursor.fetchall()]
+    db.commit()
+    db.close()
+    return book_id, user_ids
+
+
+def drop_fixture(book_id, user_ids):
+    db = connect()
+    cursor = db.cursor()
+    # transactions go with them through ON DELETE CASCADE
+    cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f"DELETE FROM users WHERE user_id IN ({placeholders})", tuple(user_ids))
+    db.commit()
+    db.close()
+
+
+def book_state(book_id):
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("SELECT available_copies FROM books WHERE book_id = %s", (book_id,))
+    available = cursor.fetchone()['available_copies']
+    cursor.execute("SELECT COUNT(*) AS n FROM transactions WHERE book_id = %s AND status = 'issued'", (book_id,))
+    issued = cursor.fetchone()['n']
+    db.close()
+    return available, issued
+
+
+def hammer(pool, jobs, worker):
+    # Start every thread on a barrier so they really contend
+    barrier = threading.Barrier(len(jobs))
+    results = [None] * len(jobs)
+
+    def run(index, job):
+        barrier.wait()
+        conn = pool.checkout(timeout=60)
+        try:
+            results[index] = worker(conn, job)
+        except Exception as e:
+            results[index] = e
+        finally:
+            pool.checkin(conn)
+
+    threads = [threading.Thread(target=run, args=(i, job)) for i, job in enumerate(jobs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=300)
+    parser.add_argument('--copies', type=int, default=25)
+    parser.add_argument('--pool-size', type=int, default=50, help="DB connections shared by the threads")
+    args = parser.parse_args()
+
+    book_id, user_ids = create_fixture(args.copies, args.threads)
+    pool = ConnectionPool(connect, size=args.pool_size, timeout=60)
+    failures = []
+    try:
+        results, elapsed = hammer(pool, user_ids, lambda conn, user_id: borrow_book(conn, user_id, book_id))
+        granted = sum(1 for r in results if not isinstance(r, Exception))
+        refused = [r for r in results if isinstance(r, Exception)]
+        unexpected = [r for r in refused if 'not available' not in str(r)]
+        available, issued = book_state(book_id)
+        print(f"borrow: {len(results)} attempts in {elapsed:.2f}s ({len(results) / elapsed:,.0f}/s), "
+              f"{granted} granted, {len(refused)} refused, {retry.retries} lock retries")
+        if granted != args.copies or issued != args.copies or available != 0:
+            failures.append(f"oversold: granted={granted} issued={issued} available={available} copies={args.copies}")
+        if unexpected:
+            failures.append(f"{len(unexpected)} unexpected errors, e.g. {unexpected[0]!r}")
+
+        db = connect()
+        cursor = db.cursor()
+        cursor.execute("SELECT transaction_id FROM transactions WHERE book_id = %s", (book_id,))
+        loans = [row['transaction_id'] for row in cursor.fetchall()]
+        db.close()
+
+        # Each loan is returned by two threads at once
+        results, elapsed = hammer(pool, loans + loans, lambda conn, transaction_id: return_book(conn, transaction_id))
+        errors = [r for r in results if isinstance(r, Exception)]
+        available, issued = book_state(book_id)
+        print(f"return: {len(results)} attempts in {elapsed:.2f}s ({len(results) / elapsed:,.0f}/s), "
+              f"{len(errors)} errors, {retry.retries} lock retries in total")
+        if available != args.copies or issued != 0:
+            failures.append(f"stock drift after returns: available={available} issued={issued} copies={args.copies}")
+        if errors:
+            failures.append(f"{len(errors)} return errors, e.g. {errors[0]!r}")
+    finally:
+        pool.close_all()
+        drop_fixture(book_id, user_ids)
+
+    print(f"pool: {pool.stats()}")
+    if failures:
+        print("FAILURE:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("SUCCESS: no overselling, duplicate returns were no-ops.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Synthetic library data at a chosen scale, for benchmarking.
+
+Fills the configured database with --scale transactions (10k, 100k, 1m or
+10m) plus proportionate users, authors, categories and books:
+
+    transactions  N          (5% still issued, spread over the last 2 years)
+    books         N / 10     (titles built from a small vocabulary, so
+                              searches hit realistic posting lists)
+    users         N / 20
+    authors       books / 5
+    categories    20
+
+Rows are generated server-side with recursive CTEs in --chunk sized
+statements, and the triggers from 0008_book_stats.sql keep book_stats and
+category_stats in step. Every generated name carries the run's tag; remove
+a run with --drop TAG. Users can log in as gen_<tag>_<n>@example.com with
+the password in PASSWORD.
+
+    python -m benchmarks.datagen --scale 1m
+    python -m benchmarks.datagen --drop 3f9a2c
+"""
+import argparse
+import json
+import os
+import time
+import uuid
+
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+import app  # noqa: F401  installs pymysql as MySQLdb
+import MySQLdb
+import MySQLdb.cursors
+from benchmarks.report import run_info, write_json
+
+load_dotenv()
+
+PASSWORD = 'datagen-password'
+
+SCALES = {'10k': 10 ** 4, '100k': 10 ** 5, '1m': 10 ** 6, '10m': 10 ** 7}
+
+ADJECTIVES = "'Silent', 'Hidden', 'Golden', 'Broken', 'Last', 'Crimson', 'Winter', 'Lost', 'Secret', 'Distant'"
+NOUNS = "'River', 'Garden', 'Empire', 'Letter', 'Shadow', 'Kingdom', 'Voyage', 'Harbor', 'Machine', 'Forest'"
+
+SEQ = "WITH RECURSIVE seq (n) AS (SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n + 1 < %s) "
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+    )
+
+
+def fill(db, label, total, insert, params=(), chunk=50000):
+    # `insert` is "INSERT INTO ... (cols)" + a SELECT over seq(n), n = 0..total-1
+    cursor = db.cursor()
+    try:
+        cursor.execute("SET SESSION cte_max_recursion_depth = %s", (chunk + 1,))
+    except MySQLdb.MySQLError:
+        cursor.execute("SET SESSION max_recursive_iterations = %s", (chunk + 1,))  # MariaDB
+    started = time.perf_counter()
+    for start in range(0, total, chunk):
+        head, select = insert.split('SELECT', 1)
+        cursor.execute(head + SEQ + 'SELECT' + select, (start, min(start + chunk, total)) + tuple(params))
+        db.commit()
+        print(f"  {label:<12} {min(start + chunk, total):>12,}/{total:,}", end='\r', flush=True)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<12} {total:>12,} rows in {elapsed:7.1f}s ({total / elapsed:,.0f} rows/s)")
+    return {'rows': total, 'seconds': elapsed}
+
+
+def numbered(db, name, query, params):
+    # Temporary n -> id map, so generated rows can reference each other
+    # without assuming AUTO_INCREMENT left no gaps
+    cursor = db.cursor()
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {name}")
+    cursor.execute(f"CREATE TEMPORARY TABLE {name} (n INT PRIMARY KEY, id INT NOT NULL)")
+    cursor.execute(f"INSERT INTO {name} (n, id) SELECT ROW_NUMBER() OVER (ORDER BY id) - 1, id FROM ({query}) AS q",
+                   params)
+    db.commit()
+
+
+def generate(db, tag, transactions, chunk):
+    books = max(10, transactions // 10)
+    users = max(10, transactions // 20)
+    authors = max(5, books // 5)
+    categories = 20
+    prefix = f'gen_{tag}'
+    pwhash = generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000')
+    stats = {}
+
+    stats['categories'] = fill(db, 'categories', categories, """
+        INSERT INTO categories (name) SELECT CONCAT(%s, '_cat_', n) FROM seq""", (prefix,), chunk)
+    stats['authors'] = fill(db, 'authors', authors, """
+        INSERT INTO authors (name) SELECT CONCAT(%s, '_author_', n) FROM seq""", (prefix,), chunk)
+    numbered(db, 'gen_categories', "SELECT category_id AS id FROM categories WHERE name LIKE %s", (prefix + '\\_%',))
+    numbered(db, 'gen_authors', "SELECT author_id AS id FROM authors WHERE name LIKE %s", (prefix + '\\_%',))
+
+    stats['books'] = fill(db, 'books', books, f"""
+        INSERT INTO books (title, isbn, author_id, category_id, total_copies, available_copies, publication_year,
+                           description)
+        SELECT CONCAT(ELT(1 + seq.n %% 10, {ADJECTIVES}), ' ', ELT(1 + (seq.n DIV 10) %% 10, {NOUNS}), ' ', seq.n),
+               CONCAT(%s, seq.n), a.id, c.id, 3, 3, 1900 + seq.n %% 125, 'Generated for benchmarking.'
+        FROM seq
+        JOIN gen_authors a ON a.n = (seq.n * 7919) %% %s
+        JOIN gen_categories c ON c.n = seq.n %% %s""", (tag, authors, categories), chunk)
+    stats['users'] = fill(db, 'users', users, """
+        INSERT INTO users (username, email, password_hash, role)
+        SELECT CONCAT(%s, '_', n), CONCAT(%s, '_', n, '@example.com'), %s, 'member' FROM seq""",
+                          (prefix, prefix, pwhash), chunk)
+    numbered(db, 'gen_books', "SELECT book_id AS id FROM books WHERE isbn LIKE %s", (tag + '%',))
+    numbered(db, 'gen_users', "SELECT user_id AS id FROM users WHERE username LIKE %s", (prefix + '\\_%',))
+
+    # Popularity is skewed: n*n spreads borrows unevenly over the books. A
+    # member's loans are n apart by `users`, so on its own n*n would give
+    # them one book over and over; the stride term walks them across the
+    # catalog, and members sharing a residue borrow the same run of books.
+    stats['transactions'] = fill(db, 'transactions', transactions, """
+        INSERT INTO transactions (user_id, book_id, borrow_date, due_date, return_date, status)
+        SELECT u.id, b.id, d.borrowed, d.borrowed + INTERVAL 14 DAY,
+               IF(d.n %% 20 = 0, NULL, d.borrowed + INTERVAL (d.n %% 21) DAY), IF(d.n %% 20 = 0, 'issued', 'returned')
+        FROM (SELECT n, CURRENT_DATE - INTERVAL ((n * 31) %% 730) DAY AS borrowed FROM seq) AS d
+        JOIN gen_users u ON u.n = (d.n * 104729) %% %s
+        JOIN gen_books b ON b.n = (d.n * d.n + (d.n DIV %s) * 7919) %% %s""", (users, users, books), chunk)
+
+    # Stock has to agree with the open loans
+    cursor = db.cursor()
+    cursor.execute("""
+        UPDATE books bk
+        JOIN (SELECT t.book_id, COUNT(*) AS issued FROM transactions t
+              JOIN gen_books g ON g.id = t.book_id
+              WHERE t.status = 'issued' GROUP BY t.book_id) AS loans ON loans.book_id = bk.book_id
+        SET bk.total_copies = loans.issued + 3, bk.available_copies = 3
+    """)
+    db.commit()
+    return stats
+
+
+def drop(db, tag, chunk=50000):
+    prefix = f'gen_{tag}'
+    cursor = db.cursor()
+    # Loans go in chunks rather than one huge cascading delete
+    while True:
+        cursor.execute("""
+            DELETE t FROM transactions t
+            JOIN (SELECT t2.transaction_id FROM transactions t2 JOIN users u ON u.user_id = t2.user_id
+                  WHERE u.username LIKE %s LIMIT %s) AS doomed ON doomed.transaction_id = t.transaction_id
+        """, (prefix + '\\_%', chunk))
+        db.commit()
+        if cursor.rowcount == 0:
+            break
+    for table, column in (('users', 'username'), ('books', 'isbn'), ('authors', 'name'), ('categories', 'name')):
+        pattern = tag + '%' if table == 'books' else prefix + '\\_%'
+        while True:
+            cursor.execute(f"DELETE FROM {table} WHERE {column} LIKE %s LIMIT %s", (pattern, chunk))
+            db.commit()
+            if cursor.rowcount == 0:
+                break
+    print(f"removed run {tag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='100k', help="number of transactions")
+    parser.add_argument('--chunk', type=int, default=50000, help="rows per INSERT statement")
+    parser.add_argument('--drop', metavar='TAG', help="remove a previous run instead of generating")
+    parser.add_argument('--json', help="write row counts and timings to this file")
+    args = parser.parse_args()
+
+    db = connect()
+    try:
+        if args.drop:
+            drop(db, args.drop, args.chunk)
+            return
+        tag = uuid.uuid4().hex[:6]
+        print(f"run {tag}: {args.scale} transactions")
+        stats = generate(db, tag, SCALES[args.scale], args.chunk)
+        print(f"done; log in as gen_{tag}_0@example.com / {PASSWORD}, remove with --drop {tag}")
+        if args.json:
+            write_json(args.json, {'run': run_info(scale=args.scale, chunk=args.chunk, tag=tag), 'tables': stats})
+        else:
+            print(json.dumps({'tag': tag, 'tables': stats}))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
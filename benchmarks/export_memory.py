@@ -0,0 +1,131 @@
+"""Checks that /admin/export streams in constant memory.
+
+Inserts --rows fixture loans (dated 2000-01-01 onwards, spread over 1000
+days), then exports them through the app with Flask's test client, reading
+the response chunk by chunk. First a date-filtered export of about a tenth
+of the rows, then all of them, as CSV and gzipped NDJSON. The process's
+peak RSS may grow by at most --max-growth-mb between the small and the full
+export; a fetchall() export would grow with the row count. Fixture rows are
+removed afterwards.
+
+    python -m benchmarks.export_memory --rows 2000000
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from app import create_app
+import MySQLdb
+import MySQLdb.cursors
+
+load_dotenv()
+
+DAYS = 1000
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+    )
+
+
+def create_fixture(db, rows, chunk=100000):
+    tag = uuid.uuid4().hex[:10]
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, '!', 'admin')",
+                   (f'export_{tag}', f'export_{tag}@example.com'))
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, 1, 1)",
+                   (f'Export Fixture {tag}', f'ex{tag}'))
+    book_id = cursor.lastrowid
+    db.commit()
+
+    cursor.execute("SET SESSION cte_max_recursion_depth = %s", (chunk + 1,))
+    for start in range(0, rows, chunk):
+        cursor.execute("""
+            INSERT INTO transactions (user_id, book_id, borrow_date, due_date, return_date, status)
+            WITH RECURSIVE seq (n) AS (SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n + 1 < %s)
+            SELECT %s, %s, DATE '2000-01-01' + INTERVAL (n %% %s) DAY,
+                   DATE '2000-01-15' + INTERVAL (n %% %s) DAY, DATE '2000-01-10' + INTERVAL (n %% %s) DAY, 'returned'
+            FROM seq
+        """, (start, min(start + chunk, rows), user_id, book_id, DAYS, DAYS, DAYS))
+        db.commit()
+        print(f"  fixture {min(start + chunk, rows):,}/{rows:,} rows", end='\r', flush=True)
+    print()
+    return user_id, book_id
+
+
+def drop_fixture(db, user_id, book_id):
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM transactions WHERE user_id = %s", (user_id,))
+    cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+    cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+    db.commit()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def export(client, query):
+    started = time.perf_counter()
+    response = client.get('/admin/export/transactions?' + query, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f"export returned {response.status_code}")
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--max-growth-mb', type=float, default=20.0)
+    args = parser.parse_args()
+
+    db = connect()
+    user_id, book_id = create_fixture(db, args.rows)
+    app = create_app()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['username'], session['role'] = user_id, 'export', 'admin'
+
+    failures = []
+    try:
+        small = 'from=2000-01-01&to=2000-04-09'  # first 100 of the 1000 days
+        full = 'from=2000-01-01&to=2002-09-26'
+        for fmt in ('format=csv', 'format=ndjson&gzip=1'):
+            size, elapsed = export(client, f'{small}&{fmt}')
+            baseline = peak_rss_mb()
+            print(f"{fmt:<20} ~{args.rows // 10:>10,} rows {size / 2 ** 20:8.1f} MiB in {elapsed:6.1f}s   "
+                  f"peak RSS {baseline:7.1f} MiB")
+            size, elapsed = export(client, f'{full}&{fmt}')
+            peak = peak_rss_mb()
+            print(f"{fmt:<20} {args.rows:>11,} rows {size / 2 ** 20:8.1f} MiB in {elapsed:6.1f}s   "
+                  f"peak RSS {peak:7.1f} MiB ({args.rows / elapsed:,.0f} rows/s)")
+            if peak - baseline > args.max_growth_mb:
+                failures.append(f"{fmt}: peak RSS grew {peak - baseline:.1f} MiB from the small to the full export")
+    finally:
+        drop_fixture(db, user_id, book_id)
+        db.close()
+
+    if failures:
+        print("FAILURE:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("OK: memory stayed flat")
+
+
+if __name__ == '__main__':
+    main()
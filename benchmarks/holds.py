@@ -0,0 +1,100 @@
+"""Concurrent hold queue check on a single hot title.
+
+--copies copies are borrowed, then --threads other members place holds at
+once, every loan is returned twice concurrently, and the members whose
+holds came up borrow their copies. The run fails unless placements got
+distinct queue positions, each returned copy went to the earliest waiting
+hold and never back to stock, and the ready holders could borrow while
+nobody else could. Also times the hold status lookup that replaces catalog
+polling. Uses the same fixture helpers as benchmarks.borrow_contention.
+
+    python -m benchmarks.holds --threads 200 --copies 25
+"""
+import argparse
+import sys
+import time
+
+from app.circulation import borrow_book, return_book, place_hold
+from app.holds import holds, USER_HOLDS_QUERY
+from app.pool import ConnectionPool
+from benchmarks.borrow_contention import connect, create_fixture, drop_fixture, book_state, hammer
+from benchmarks.report import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=200, help="members placing holds")
+    parser.add_argument('--copies', type=int, default=25)
+    parser.add_argument('--pool-size', type=int, default=50)
+    args = parser.parse_args()
+
+    book_id, user_ids = create_fixture(args.copies, args.copies + args.threads)
+    borrowers, waiters = user_ids[:args.copies], user_ids[args.copies:]
+    pool = ConnectionPool(connect, size=args.pool_size, timeout=60)
+    failures = []
+    try:
+        hammer(pool, borrowers, lambda conn, user_id: borrow_book(conn, user_id, book_id))
+
+        results, elapsed = hammer(pool, waiters, lambda conn, user_id: place_hold(conn, user_id, book_id))
+        errors = [r for r in results if isinstance(r, Exception)]
+        db = connect()
+        cursor = db.cursor()
+        cursor.execute("SELECT hold_id, user_id, position FROM holds WHERE book_id = %s ORDER BY position",
+                       (book_id,))
+        queue = cursor.fetchall()
+        print(f"place: {len(results)} holds in {elapsed:.2f}s ({len(results) / elapsed:,.0f}/s), {len(errors)} errors")
+        if errors or len({row['position'] for row in queue}) != len(waiters):
+            failures.append(f"placements: {len(errors)} errors, {len(queue)} queued of {len(waiters)}")
+
+        # Status lookups while waiting, as a polling client would
+        latencies = []
+        for user_id in waiters[:100]:
+            started = time.perf_counter()
+            cursor.execute(USER_HOLDS_QUERY, (user_id,))
+            cursor.fetchall()
+            latencies.append(time.perf_counter() - started)
+        lookup = summarize(latencies)
+        print(f"status lookup: p50 {lookup['p50_ms']:.2f} ms, p99 {lookup['p99_ms']:.2f} ms")
+
+        cursor.execute("SELECT transaction_id FROM transactions WHERE book_id = %s", (book_id,))
+        loans = [row['transaction_id'] for row in cursor.fetchall()]
+        db.commit()
+        results, elapsed = hammer(pool, loans + loans, lambda conn, transaction_id: return_book(conn, transaction_id))
+        errors = [r for r in results if isinstance(r, Exception)]
+        cursor.execute("SELECT user_id FROM holds WHERE book_id = %s AND status = 'ready'", (book_id,))
+        ready = {row['user_id'] for row in cursor.fetchall()}
+        expected = {row['user_id'] for row in queue[:args.copies]}
+        available, issued = book_state(book_id)
+        print(f"return: {len(results)} attempts in {elapsed:.2f}s, {len(ready)} holds ready, "
+              f"{available} copies back in stock")
+        if errors:
+            failures.append(f"{len(errors)} return errors, e.g. {errors[0]!r}")
+        if ready != expected or available != 0:
+            failures.append(f"allocation: {len(ready & expected)} of {len(expected)} first in line ready, "
+                            f"{len(ready - expected)} out of order, available={available}")
+
+        # The next in line, still waiting, can't take a reserved copy
+        others = [row['user_id'] for row in queue[args.copies:args.copies + 5]]
+        stolen = [r for r in hammer(pool, others, lambda conn, user_id: borrow_book(conn, user_id, book_id))[0]
+                  if not isinstance(r, Exception)] if others else []
+        results, _ = hammer(pool, sorted(ready), lambda conn, user_id: borrow_book(conn, user_id, book_id)) \
+            if ready else ([], 0)
+        errors = [r for r in results if isinstance(r, Exception)]
+        available, issued = book_state(book_id)
+        print(f"pickup: {len(results) - len(errors)} of {len(ready)} ready holders borrowed, "
+              f"{len(stolen)} waiting members got a reserved copy")
+        if errors or stolen or issued != len(ready) or available != 0:
+            failures.append(f"pickup: errors={len(errors)} stolen={len(stolen)} issued={issued} available={available}")
+        db.close()
+    finally:
+        pool.close_all()
+        drop_fixture(book_id, user_ids)
+
+    if failures:
+        print("FAILURE:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"SUCCESS: FIFO allocation on return, pickup window {holds.pickup_hours}h.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Catalog ingestion throughput.
+
+Writes a synthetic Open Library style JSONL file, then measures rows/s for
+parsing + normalization alone and, with --db, for full loads through
+executemany and LOAD DATA LOCAL INFILE. Loads go into the configured
+database, so point it at a scratch schema.
+
+    python -m benchmarks.ingest --rows 1000000 --db
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import ingest_books
+
+
+def write_fixture(path, rows, seed=7):
+    rng = random.Random(seed)
+    authors = [f'Author {i}' for i in range(max(1, rows // 20))]
+    run = rng.randrange(10 ** 6)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(rows):
+            record = {
+                'title': f'Synthetic Title {i}',
+                'authors': [{'name': rng.choice(authors)}],
+                'isbn_13': [f'97{run:06d}{i:07d}'],
+                'first_publish_year': rng.randint(1900, 2024),
+                'covers': [rng.randint(1, 10 ** 7)],
+                'description': {'type': '/type/text', 'value': 'Generated for benchmarking.'},
+            }
+            # Sprinkle in rows the pipeline has to reject
+            if i % 1000 == 999:
+                record.pop('title')
+            f.write(json.dumps(record) + '\n')
+
+
+def parse_only(path):
+    started = time.perf_counter()
+    count = rejected = 0
+    for _, record in ingest_books.read_records(path, 'jsonl'):
+        count += 1
+        try:
+            ingest_books.normalize(record, {}, 1)
+        except ingest_books.Reject:
+            rejected += 1
+    elapsed = time.perf_counter() - started
+    return count, rejected, elapsed
+
+
+def load(path, load_data, chunk_size):
+    db = ingest_books.connect(load_data)
+    with open(os.devnull, 'w') as rejects:
+        ingestor = ingest_books.Ingestor(db, chunk_size, load_data, rejects)
+        report = ingestor.run(ingest_books.read_records(path, 'jsonl'), progress=lambda message: None)
+    db.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--db', action='store_true', help="also load into the configured database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'books.jsonl')
+        write_fixture(path, args.rows)
+
+        count, rejected, elapsed = parse_only(path)
+        print(f"parse+normalize  {count:,} rows  {rejected:,} rejected  {count / elapsed:>12,.0f} rows/s")
+
+        if args.db:
+            for label, load_data in (('executemany', False), ('load data', True)):
+                # Fresh ISBNs per run so the second mode isn't all duplicates
+                write_fixture(path, args.rows, seed=random.randrange(10 ** 6))
+                report = load(path, load_data, args.chunk_size)
+                print(f"{label:<16} {report['inserted']:,} inserted  {report['rejected']:,} rejected  "
+                      f"{report['rows_per_second']:>12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Requests/s and latency of the sync (WSGI) and async (ASGI) serving modes.
+
+Start both servers against the same database, e.g.
+
+    python run.py                                   # sync, :8000
+    hypercorn asgi:app --bind 127.0.0.1:8001        # async, :8001
+
+then drive the same scenario mix at each:
+
+    python -m benchmarks.loadtest --sync-url http://127.0.0.1:8000 \\
+        --async-url http://127.0.0.1:8001 --concurrency 64 --duration 30
+
+Every client thread logs in as its own fixture member and loops over the
+catalog (browse and search), the member dashboard, and a borrow followed by
+returning that loan. Fixture users and the book they borrow are removed
+afterwards. Pass only one of the URLs to measure a single mode. With
+--json, per-endpoint p50/p95/p99 and throughput are written for comparing
+runs (see benchmarks/report.py). Run it against a database filled by
+benchmarks.datagen to measure at scale.
+"""
+import argparse
+import http.client
+import os
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, urlencode
+
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+import app  # noqa: F401  installs pymysql as MySQLdb
+import MySQLdb
+import MySQLdb.cursors
+from benchmarks.report import summarize, run_info, write_json
+
+load_dotenv()
+
+PASSWORD = 'loadtest-password'
+
+# (name, weight)
+SCENARIOS = [('catalog', 35), ('search', 15), ('dashboard', 30), ('borrow', 20)]
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+        autocommit=True,
+    )
+
+
+def create_fixture(users):
+    tag = uuid.uuid4().hex[:10]
+    # Cheap hash: the login cost isn't what is being measured here
+    pwhash = generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000')
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, %s, %s)",
+                   (f'Load Test {tag}', f'lt{tag}', 10 ** 6, 10 ** 6))
+    book_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                       [(f'lt_{tag}_{i}', f'lt_{tag}_{i}@example.com', pwhash) for i in range(users)])
+    cursor.execute("SELECT user_id, email FROM users WHERE username LIKE %s ORDER BY user_id", (f'lt\\_{tag}\\_%',))
+    accounts = cursor.fetchall()
+    db.close()
+    return book_id, accounts
+
+
+def drop_fixture(book_id, accounts):
+    db = connect()
+    cursor = db.cursor()
+    # transactions go with them through ON DELETE CASCADE
+    cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+    placeholders = ', '.join(['%s'] * len(accounts))
+    cursor.execute(f"DELETE FROM users WHERE user_id IN ({placeholders})", tuple(a['user_id'] for a in accounts))
+    db.close()
+
+
+class Client:
+    """One keep-alive connection with a session cookie; redirects aren't followed."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Server dropped the keep-alive connection; reconnect once
+            self.conn.close()
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie and cookie.startswith('session='):
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.conn.close()
+
+
+def drive(base_url, accounts, book_id, duration):
+    # Returns {endpoint: [latency seconds, ...]}, error count and wall time
+    latencies = {}
+    errors = [0]
+    lock = threading.Lock()
+    names = [name for name, _ in SCENARIOS]
+    weights = [weight for _, weight in SCENARIOS]
+    barrier = threading.Barrier(len(accounts))
+
+    def timed(client, endpoint, method, path, form=None, ok=(200,)):
+        started = time.perf_counter()
+        status = client.request(method, path, form)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.setdefault(endpoint, []).append(elapsed)
+            if status not in ok:
+                errors[0] += 1
+
+    def run(account):
+        client = Client(base_url)
+        db = connect()
+        cursor = db.cursor()
+        client.request('POST', '/login', {'email': account['email'], 'password': PASSWORD})
+        barrier.wait()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            scenario = random.choices(names, weights)[0]
+            if scenario == 'catalog':
+                timed(client, 'catalog', 'GET', '/books')
+            elif scenario == 'search':
+                timed(client, 'catalog search', 'GET', '/books?' + urlencode({'q': random.choice('aeiost')}))
+            elif scenario == 'dashboard':
+                timed(client, 'dashboard', 'GET', '/dashboard')
+            else:
+                timed(client, 'borrow', 'POST', f'/borrow/process/{book_id}', {}, ok=(302,))
+                cursor.execute("""
+                    SELECT MAX(transaction_id) AS transaction_id FROM transactions
+                    WHERE user_id = %s AND book_id = %s AND status = 'issued'
+                """, (account['user_id'], book_id))
+                loan = cursor.fetchone()
+                if loan and loan['transaction_id']:
+                    timed(client, 'return', 'GET', f"/return/{loan['transaction_id']}", ok=(302,))
+        client.close()
+        db.close()
+
+    threads = [threading.Thread(target=run, args=(account,)) for account in accounts]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def report(mode, latencies, errors, elapsed):
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"\n{mode}: {total} requests in {elapsed:.1f}s = {total / elapsed:,.0f} req/s, {errors} errors")
+    print(f"  {'endpoint':<16} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    everything = [s for samples in latencies.values() for s in samples]
+    result = {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(latencies.items())}
+    result['all'] = summarize(everything, elapsed)
+    for endpoint, s in result.items():
+        print(f"  {endpoint:<16} {s['requests']:>9} {s['throughput_rps']:>8,.0f} "
+              f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+    result['all']['errors'] = errors
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sync-url', help="base URL of the WSGI server, e.g. http://127.0.0.1:8000")
+    parser.add_argument('--async-url', help="base URL of the ASGI server, e.g. http://127.0.0.1:8001")
+    parser.add_argument('--concurrency', type=int, default=32, help="client threads, one member each")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds per mode")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+    modes = [(mode, url) for mode, url in (('sync', args.sync_url), ('async', args.async_url)) if url]
+    if not modes:
+        parser.error("pass --sync-url and/or --async-url")
+
+    book_id, accounts = create_fixture(args.concurrency)
+    results = {'run': run_info(concurrency=args.concurrency, duration=args.duration, scenarios=dict(SCENARIOS))}
+    try:
+        for mode, url in modes:
+            results[mode] = report(mode, *drive(url, accounts, book_id, args.duration))
+    finally:
+        drop_fixture(book_id, accounts)
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
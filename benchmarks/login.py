@@ -0,0 +1,50 @@
+"""Password verification throughput per core.
+
+Measures how many login checks per second the hashing service sustains for
+each method, inline on the calling thread and through the process pool at
+increasing worker counts. Login cost is dominated by this KDF call, so
+per-core verifies/s is the ceiling on logins/s per core.
+
+    python -m benchmarks.login --methods scrypt pbkdf2:sha256:600000 --workers 1 2 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.passwords import PasswordHasher
+
+
+def throughput(hasher, pwhash, requests, concurrency):
+    # `concurrency` request threads all logging in at once
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        results = list(threads.map(lambda _: hasher.verify(pwhash, 'correct horse'), range(requests)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', nargs='+', default=['scrypt', 'pbkdf2:sha256:600000'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--requests', type=int, default=64)
+    args = parser.parse_args()
+
+    for method in args.methods:
+        inline = PasswordHasher(method, workers=0)
+        pwhash = inline.hash('correct horse')
+        rate = throughput(inline, pwhash, args.requests // 4 or 1, 1)
+        print(f"\n{inline.current_prefix()}")
+        print(f"  inline              {rate:8.1f} verifies/s  ({rate:8.1f} per core)")
+        for workers in sorted(set(args.workers)):
+            pooled = PasswordHasher(method, workers=workers, max_pending=args.requests)
+            pooled.verify(pwhash, 'correct horse')  # start the pool outside the timing
+            rate = throughput(pooled, pwhash, args.requests, args.requests)
+            pooled.shutdown()
+            print(f"  pool, {workers:>2} workers   {rate:8.1f} verifies/s  ({rate / workers:8.1f} per core)")
+
+
+if __name__ == '__main__':
+    main()
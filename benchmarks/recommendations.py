@@ -0,0 +1,121 @@
+"""Build time of the recommendation tables at the current ledger size.
+
+Fill a scratch database first, then build against it:
+
+    python -m benchmarks.datagen --scale 1m
+    python -m benchmarks.recommendations --json rec-1m.json
+    python -m benchmarks.datagen --scale 10m        # or a separate schema
+    python -m benchmarks.recommendations --json rec-10m.json
+
+Runs a full build from an empty state directory, then adds --new loans
+between random members and books and times the incremental build that
+picks them up, as the worker's hourly run would. Reports wall time, rows
+written, peak memory of this process and the size of the saved state, plus
+p50/p99 of the two page lookups that read the results. The added loans are
+deleted afterwards; book_stats keeps counting them until the next
+reconcile_stats run. Needs requirements-recommend.txt.
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+from benchmarks.loadtest import connect
+from benchmarks.report import summarize, run_info, write_json
+from app.recommendations import Recommender
+
+
+def timed_build(recommender, db, batch_size, full=False):
+    started = time.perf_counter()
+    rows = recommender.build(db, batch_size, full=full)
+    return time.perf_counter() - started, rows
+
+
+def add_loans(db, count):
+    # Returned loans between random members and books; returns the first new id
+    cursor = db.cursor()
+    cursor.execute("SELECT user_id FROM users")
+    users = [row['user_id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT book_id FROM books")
+    books = [row['book_id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT COALESCE(MAX(transaction_id), 0) AS last FROM transactions")
+    first = cursor.fetchone()['last'] + 1
+    rows = [(random.choice(users), random.choice(books)) for _ in range(count)]
+    for start in range(0, count, 5000):
+        cursor.executemany("""
+            INSERT INTO transactions (user_id, book_id, borrow_date, due_date, return_date, status)
+            VALUES (%s, %s, CURRENT_DATE, CURRENT_DATE + INTERVAL 14 DAY, CURRENT_DATE, 'returned')
+        """, rows[start:start + 5000])
+    db.commit()
+    cursor.close()
+    return first
+
+
+def lookups(recommender, db, samples):
+    cursor = db.cursor()
+    cursor.execute("SELECT book_id FROM book_recommendations WHERE position = 1 ORDER BY RAND() LIMIT %s",
+                   (samples,))
+    books = [row['book_id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT user_id FROM user_recommendations WHERE position = 1 ORDER BY RAND() LIMIT %s",
+                   (samples,))
+    users = [row['user_id'] for row in cursor.fetchall()]
+    cursor.close()
+    results = {}
+    for name, lookup, ids in (('for_book', recommender.for_book, books), ('for_user', recommender.for_user, users)):
+        latencies = []
+        for owner in ids:
+            started = time.perf_counter()
+            lookup(db, owner)
+            latencies.append(time.perf_counter() - started)
+        results[name] = summarize(latencies)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000, help="books or members per write transaction")
+    parser.add_argument('--top-k', type=int, default=20)
+    parser.add_argument('--new', type=int, default=10000, help="loans added before the incremental build")
+    parser.add_argument('--samples', type=int, default=200, help="lookups timed per page")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) AS loans FROM transactions")
+    loans = cursor.fetchone()['loans']
+    cursor.close()
+    state_dir = tempfile.mkdtemp(prefix='recommend-bench-')
+    recommender = Recommender(top_k=args.top_k, state_dir=state_dir)
+    result = {'run': run_info(loans=loans, batch_size=args.batch_size, top_k=args.top_k, new=args.new)}
+
+    print(f"{loans:,} loans in the ledger")
+    elapsed, rows = timed_build(recommender, db, args.batch_size, full=True)
+    state_mb = os.path.getsize(os.path.join(state_dir, 'state.npz')) / 2 ** 20
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"full build: {elapsed:.1f}s, {rows:,} rows written, peak RSS {peak_mb:,.0f} MB, state {state_mb:,.1f} MB")
+    result['full'] = {'seconds': elapsed, 'rows': rows, 'peak_rss_mb': peak_mb, 'state_mb': state_mb}
+
+    first = add_loans(db, args.new)
+    try:
+        elapsed, rows = timed_build(recommender, db, args.batch_size)
+        print(f"incremental build after {args.new:,} new loans: {elapsed:.1f}s, {rows:,} rows written")
+        result['incremental'] = {'seconds': elapsed, 'rows': rows}
+    finally:
+        cursor = db.cursor()
+        cursor.execute("DELETE FROM transactions WHERE transaction_id >= %s", (first,))
+        db.commit()
+        cursor.close()
+
+    result['lookups'] = lookups(recommender, db, args.samples)
+    for name, s in result['lookups'].items():
+        print(f"{name}: p50 {s['p50_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms over {s['requests']} lookups")
+    db.close()
+    if args.json:
+        write_json(args.json, result)
+
+
+if __name__ == '__main__':
+    main()
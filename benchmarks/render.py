@@ -0,0 +1,103 @@
+"""Template render time with and without fragment and bytecode caching.
+
+Renders catalog.html with --books cards and the member dashboard with
+--loans rows from synthetic rows; no database is needed. Each page is timed
+with fragment caching off, then with it on and warm (every row a cache hit).
+Cold template load is timed with a fresh Jinja environment each round, once
+compiling from source and once from a filled bytecode cache.
+
+    python -m benchmarks.render --books 300 --loans 50 --rounds 200
+"""
+import argparse
+import datetime
+import decimal
+import shutil
+import tempfile
+import time
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+
+from app import create_app
+from app.fragments import fragments
+from app.routes import ADMIN_PANELS
+
+
+def fake_books(count):
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    return [{'book_id': i, 'title': f'Book {i}', 'author_name': f'Author {i % 97}', 'publication_year': 1990 + i % 30,
+             'available_copies': i % 4, 'image_url': f'https://covers.example.com/{i}.jpg', 'updated_at': now}
+            for i in range(1, count + 1)]
+
+
+def fake_loans(count):
+    today = datetime.date(2024, 1, 1)
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    return [{'transaction_id': i, 'book_id': i, 'title': f'Book {i}', 'image_url': f'https://covers.example.com/{i}.jpg',
+             'borrow_date': today, 'due_date': today + datetime.timedelta(days=14),
+             'fine_amount': decimal.Decimal('0.00'), 'is_overdue': 0, 'status': 'issued',
+             'updated_at': now, 'book_updated_at': now}
+            for i in range(1, count + 1)]
+
+
+def time_renders(render, rounds):
+    render()  # warm up (and fill the fragment cache when it is on)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def time_cold_load(app, bytecode_cache, rounds, templates=('base.html', 'catalog.html', 'dashboard.html')):
+    total = 0.0
+    for _ in range(rounds):
+        env = app.create_jinja_environment()
+        env.bytecode_cache = bytecode_cache
+        started = time.perf_counter()
+        for name in templates:
+            env.get_template(name)
+        total += time.perf_counter() - started
+    return total / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=300, help="cards on the catalog page")
+    parser.add_argument('--loans', type=int, default=50, help="rows in the member's loan table")
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    books, loans = fake_books(args.books), fake_loans(args.loans)
+    user_info = {'user_id': 1, 'username': 'bench', 'email': 'bench@example.com', 'role': 'member'}
+
+    pages = {
+        'catalog': lambda: render_template('catalog.html', books=books, search_query='', total=len(books),
+                                           prev_cursor=None, next_cursor='x', is_estimate=True, sort='title'),
+        'dashboard': lambda: render_template('dashboard.html', my_books=loans, available_books=[], is_admin=False,
+                                             user_info=user_info, panels=ADMIN_PANELS),
+    }
+
+    with app.test_request_context('/books'):
+        print(f"{'page':<10} {'no fragments':>14} {'fragments':>12} {'speedup':>8}")
+        for name, render in pages.items():
+            fragments.enabled = False
+            plain = time_renders(render, args.rounds)
+            fragments.enabled = True
+            cached = time_renders(render, args.rounds)
+            print(f"{name:<10} {plain:11.2f} ms {cached:9.2f} ms {plain / cached:7.1f}x")
+
+    directory = tempfile.mkdtemp()
+    try:
+        bytecode = FileSystemBytecodeCache(directory)
+        time_cold_load(app, bytecode, 1)  # fill it
+        compiled = time_cold_load(app, None, args.rounds // 10 or 1)
+        loaded = time_cold_load(app, bytecode, args.rounds // 10 or 1)
+        print(f"cold template load: {compiled:.2f} ms compiling, {loaded:.2f} ms from bytecode cache "
+              f"({compiled / loaded:.1f}x)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Checks which server answers each route when read replicas are configured.
+
+Points MYSQL_REPLICAS at two aliases of the primary (a real replica isn't
+needed to see the routing) plus, with --dead, an address nothing listens
+on, and records which pool every checkout of a request came from:
+
+    * read-only views are served by a replica, alternating between them
+      (or the fastest one with --policy least_latency)
+    * right after a member borrows and returns, their pages read from the
+      primary until MYSQL_REPLICA_STICKY_SECONDS pass
+    * the dead replica is never chosen after its first failed check
+
+Also times the catalog and dashboard with and without replicas.
+
+    python -m benchmarks.replica_routing --requests 100
+"""
+import argparse
+import os
+import time
+import uuid
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from app import create_app, mysql
+from config import Config
+import MySQLdb
+import MySQLdb.cursors
+from benchmarks.report import summarize
+
+load_dotenv()
+
+READ_ROUTES = ['/books', '/books?q=river', '/dashboard', '/borrow/confirm/{book_id}', '/api/v1/books']
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+        autocommit=True,
+    )
+
+
+def record_checkouts(log):
+    # Tags every checkout with the pool it came from
+    def tap(pool, name):
+        checkout = pool.checkout
+
+        def recorded(timeout=None):
+            conn = checkout(timeout)
+            log.append(name)
+            return conn
+        pool.checkout = recorded
+
+    tap(mysql.pool, 'primary')
+    for replica in mysql.replicas.replicas:
+        tap(replica.pool, replica.name)
+
+
+def served_by(client, log, path):
+    del log[:]
+    response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} returned {response.status_code}")
+    return list(log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--policy', choices=['round_robin', 'least_latency'], default='round_robin')
+    parser.add_argument('--dead', action='store_true', help="add an unreachable replica")
+    args = parser.parse_args()
+
+    host = os.getenv('MYSQL_HOST', 'localhost')
+    port = os.getenv('MYSQL_PORT', '3306')
+    aliases = ['127.0.0.1', 'localhost'] if host in ('localhost', '127.0.0.1') else [host, host]
+    replicas = [f'{alias}:{port}' for alias in aliases] + (['127.0.0.1:1'] if args.dead else [])
+
+    class ReplicaConfig(Config):
+        MYSQL_REPLICAS = replicas
+        MYSQL_REPLICA_POLICY = args.policy
+        MYSQL_REPLICA_STICKY_SECONDS = 2
+
+    class PrimaryConfig(Config):
+        MYSQL_REPLICAS = []
+
+    tag = uuid.uuid4().hex[:10]
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, '!', 'member')",
+                   (f'rr_{tag}', f'rr_{tag}@example.com'))
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, 1000, 1000)",
+                   (f'Replica Routing {tag}', f'rr{tag}'))
+    book_id = cursor.lastrowid
+
+    log = []
+    try:
+        app = create_app(ReplicaConfig)
+        record_checkouts(log)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'], session['username'], session['role'] = user_id, 'replica check', 'member'
+
+        print("read-only routes:")
+        used = Counter()
+        for _ in range(4):
+            for path in READ_ROUTES:
+                path = path.format(book_id=book_id)
+                pools = served_by(client, log, path)
+                used.update(pools)
+                print(f"  {path:<32} {', '.join(pools) or '(cached)'}")
+        print(f"  checkouts by pool: {dict(used)}")
+
+        client.post(f'/borrow/process/{book_id}')
+        cursor.execute("SELECT MAX(transaction_id) AS id FROM transactions WHERE user_id = %s", (user_id,))
+        transaction_id = cursor.fetchone()['id']
+        print(f"after borrow: /dashboard -> {', '.join(served_by(client, log, '/dashboard'))}")
+        client.get(f'/return/{transaction_id}')
+        print(f"after return: /dashboard -> {', '.join(served_by(client, log, '/dashboard'))}")
+        time.sleep(ReplicaConfig.MYSQL_REPLICA_STICKY_SECONDS + 0.5)
+        print(f"sticky window over: /dashboard -> {', '.join(served_by(client, log, '/dashboard'))}")
+
+        for replica in mysql.replicas.stats()['replicas']:
+            latency = f"{replica['latency_ms']:.2f} ms" if replica['latency_ms'] is not None else '-'
+            print(f"  {replica['host']:<20} healthy={replica['healthy']} reads={replica['reads']} "
+                  f"failures={replica['failures']} lag={replica['lag']} ping={latency}")
+
+        print(f"\n{'route':<14} {'primary p50':>12} {'replicas p50':>13}")
+        for path in ('/books', '/dashboard'):
+            row = f"{path:<14}"
+            for config in (PrimaryConfig, ReplicaConfig):
+                client = create_app(config).test_client()
+                with client.session_transaction() as session:
+                    session['user_id'], session['username'], session['role'] = user_id, 'replica check', 'member'
+                latencies = []
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    client.get(path)
+                    latencies.append(time.perf_counter() - started)
+                row += f" {summarize(latencies)['p50_ms']:>12.2f}"
+            print(row)
+    finally:
+        cursor.execute("DELETE FROM transactions WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+        cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
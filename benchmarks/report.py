@@ -0,0 +1,88 @@
+"""Latency summaries and JSON results shared by the benchmark scripts.
+
+Every result file carries the commit and settings it was measured with, so
+runs can be diffed across commits:
+
+    python -m benchmarks.loadtest ... --json before.json
+    git checkout my-branch
+    python -m benchmarks.loadtest ... --json after.json
+    python -m benchmarks.report before.json after.json
+"""
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def summarize(samples, elapsed=None):
+    # Latencies in seconds -> ms percentiles (+ throughput over `elapsed`)
+    samples = sorted(samples)
+    summary = {
+        'requests': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+    }
+    if elapsed:
+        summary['throughput_rps'] = len(samples) / elapsed
+    return summary
+
+
+def run_info(**settings):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': settings,
+    }
+
+
+def write_json(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def _rows(result, prefix=()):
+    # Flattens nested results into {('mode', 'endpoint'): summary}
+    for key, value in result.items():
+        if isinstance(value, dict) and 'p50_ms' in value:
+            yield prefix + (key,), value
+        elif isinstance(value, dict) and key != 'run':
+            yield from _rows(value, prefix + (key,))
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = dict(_rows(json.load(f)))
+    with open(after_path) as f:
+        after = dict(_rows(json.load(f)))
+    print(f"{'':<36} {'p50 ms':>17} {'p99 ms':>17} {'req/s':>19}")
+    for key in sorted(before.keys() & after.keys()):
+        b, a = before[key], after[key]
+        line = f"{'/'.join(key):<36}"
+        for field in ('p50_ms', 'p99_ms', 'throughput_rps'):
+            if field in b and field in a:
+                change = (a[field] - b[field]) / b[field] * 100 if b[field] else 0.0
+                line += f" {a[field]:9.1f} ({change:+5.0f}%)"
+        print(line)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m benchmarks.report BEFORE.json AFTER.json")
+    compare(sys.argv[1], sys.argv[2])
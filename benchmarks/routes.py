@@ -0,0 +1,181 @@
+"""Per-route micro-benchmarks, in process.
+
+Calls each route handler --requests times through Flask's test client
+against the configured database (fill it with benchmarks.datagen first to
+measure at scale) and reports p50/p95/p99 latency and the SQL statements
+each request ran, taken from the Server-Timing header. No HTTP server or
+network is involved, so this isolates handler, query and render cost from
+the serving stack; benchmarks.loadtest measures the whole path.
+
+By default caches stay warm between calls, as in production; --cold clears
+the read-through cache and session profiles before every request.
+
+    python -m benchmarks.routes --requests 200 --json routes.json
+"""
+import argparse
+import os
+import re
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from app import create_app
+from config import Config
+import MySQLdb
+import MySQLdb.cursors
+from app.cache import cache
+from app.sessions import sessions
+from benchmarks.report import summarize, run_info, write_json
+
+load_dotenv()
+
+# (name, role, method, path). {book_id} is the fixture book.
+ROUTES = [
+    ('catalog', 'member', 'GET', '/books'),
+    ('catalog popular', 'member', 'GET', '/books?sort=popular'),
+    ('catalog search', 'member', 'GET', '/books?q=river'),
+    ('suggest', 'member', 'GET', '/books/suggest?q=gol'),
+    ('dashboard', 'member', 'GET', '/dashboard'),
+    ('confirm borrow', 'member', 'GET', '/borrow/confirm/{book_id}'),
+    ('api books', 'member', 'GET', '/api/v1/books'),
+    ('api book', 'member', 'GET', '/api/v1/books/{book_id}'),
+    ('api availability', 'member', 'GET', '/api/v1/availability?ids={book_id}'),
+    ('api my loans', 'member', 'GET', '/api/v1/me/loans'),
+    ('api my holds', 'member', 'GET', '/api/v1/me/holds'),
+    ('admin dashboard', 'admin', 'GET', '/dashboard'),
+    ('admin active loans', 'admin', 'GET', '/admin/panels/active'),
+    ('admin overdue', 'admin', 'GET', '/admin/panels/overdue'),
+    ('admin inventory', 'admin', 'GET', '/admin/panels/inventory'),
+    ('api summary', 'admin', 'GET', '/api/v1/availability/summary'),
+]
+
+QUERIES = re.compile(r'(\d+) queries')
+
+
+def connect():
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DB', 'library_db'),
+        cursorclass=MySQLdb.cursors.DictCursor,
+        autocommit=True,
+    )
+
+
+def create_fixture():
+    tag = uuid.uuid4().hex[:10]
+    db = connect()
+    cursor = db.cursor()
+    users = {}
+    for role in ('member', 'admin'):
+        cursor.execute("INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, '!', %s)",
+                       (f'rb_{role}_{tag}', f'rb_{role}_{tag}@example.com', role))
+        users[role] = cursor.lastrowid
+    cursor.execute("INSERT INTO books (title, isbn, total_copies, available_copies) VALUES (%s, %s, %s, %s)",
+                   (f'Route Bench {tag}', f'rb{tag}', 10 ** 6, 10 ** 6))
+    book_id = cursor.lastrowid
+    db.close()
+    return users, book_id
+
+
+def drop_fixture(users, book_id):
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+    cursor.execute("DELETE FROM users WHERE user_id IN (%s, %s)", tuple(users.values()))
+    db.close()
+
+
+def login(app, user_id, role):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['username'], session['role'] = user_id, f'bench {role}', role
+    return client
+
+
+def call(client, method, path, cold=None):
+    if cold is not None:
+        cold()
+    started = time.perf_counter()
+    response = client.open(path, method=method)
+    elapsed = time.perf_counter() - started
+    match = QUERIES.search(response.headers.get('Server-Timing', ''))
+    return elapsed, response, int(match.group(1)) if match else 0
+
+
+def bench(client, method, path, requests, cold, expect=(200,)):
+    latencies, queries = [], []
+    call(client, method, path)  # warm up
+    for _ in range(requests):
+        elapsed, response, count = call(client, method, path, cold)
+        if response.status_code not in expect:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        latencies.append(elapsed)
+        queries.append(count)
+    return latencies, queries
+
+
+def bench_circulation(client, book_id, requests, cold):
+    # Borrow, then return the loan it made; both are redirects
+    borrow, ret, queries = [], [], []
+    db = connect()
+    cursor = db.cursor()
+    for _ in range(requests):
+        elapsed, _, count = call(client, 'POST', f'/borrow/process/{book_id}', cold)
+        borrow.append(elapsed)
+        cursor.execute("SELECT MAX(transaction_id) AS id FROM transactions WHERE book_id = %s AND status = 'issued'",
+                       (book_id,))
+        elapsed, _, count_return = call(client, 'GET', f"/return/{cursor.fetchone()['id']}", cold)
+        ret.append(elapsed)
+        queries.append((count, count_return))
+    db.close()
+    return borrow, ret, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help="calls per route")
+    parser.add_argument('--cold', action='store_true', help="clear caches before every call")
+    parser.add_argument('--only', nargs='+', help="route names to run (default: all)")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        SERVER_TIMING = True
+
+    app = create_app(BenchConfig)
+    users, book_id = create_fixture()
+
+    def clear_caches():
+        cache.backend.clear()
+        for user_id in users.values():
+            sessions.store.drop_profile(user_id)
+
+    cold = clear_caches if args.cold else None
+    clients = {role: login(app, user_id, role) for role, user_id in users.items()}
+    results = {'run': run_info(requests=args.requests, cold=args.cold)}
+    print(f"{'route':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8}")
+    try:
+        for name, role, method, path in ROUTES:
+            if args.only and name not in args.only:
+                continue
+            latencies, queries = bench(clients[role], method, path.format(book_id=book_id), args.requests, cold)
+            results[name] = dict(summarize(latencies, sum(latencies)), queries=max(queries))
+        if not args.only or 'borrow' in args.only or 'return' in args.only:
+            borrow, ret, queries = bench_circulation(clients['member'], book_id, args.requests, cold)
+            results['borrow'] = dict(summarize(borrow, sum(borrow)), queries=max(q for q, _ in queries))
+            results['return'] = dict(summarize(ret, sum(ret)), queries=max(q for _, q in queries))
+        for name, s in results.items():
+            if name != 'run':
+                print(f"{name:<20} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} "
+                      f"{s['throughput_rps']:>8,.0f} {s['queries']:>8}")
+    finally:
+        drop_fixture(users, book_id)
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
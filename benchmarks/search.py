@@ -0,0 +1,96 @@
+"""Catalog search latency at increasing catalog sizes.
+
+Builds the in-process search index over synthetic books and times exact,
+multi-term and prefix (type-ahead) queries. No database is needed. Besides
+a few common words, titles and descriptions draw from --vocabulary
+generated rare words (names, places, jargon), so at a million books the
+index holds a few hundred thousand terms, as a real catalog would.
+
+    python -m benchmarks.search --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.search import SearchIndex
+
+WORDS = [
+    'history', 'science', 'war', 'love', 'mystery', 'garden', 'ocean', 'empire', 'shadow', 'river',
+    'night', 'king', 'queen', 'city', 'machine', 'dream', 'winter', 'summer', 'stone', 'fire',
+    'secret', 'journey', 'island', 'mountain', 'star', 'forest', 'house', 'child', 'storm', 'light',
+]
+NAMES = ['smith', 'garcia', 'tolkien', 'austen', 'dickens', 'orwell', 'woolf', 'tagore', 'murakami', 'morrison']
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'te', 'vo', 'shi', 'qu', 'bel', 'dor', 'en', 'fa', 'gri', 'hal', 'is', 'jun',
+             'mar', 'nes', 'or', 'pel', 'sa', 'thu', 'ul', 'wen', 'xa', 'yor', 'zel', 'bri', 'cas', 'dra']
+
+
+def rare_words(count, seed=7):
+    # Distinct made-up words of two to five syllables
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    return sorted(words)
+
+
+def synthetic_books(count, rare, seed=42):
+    rng = random.Random(seed)
+    for book_id in range(1, count + 1):
+        # Mostly common words, with a long tail of rare ones like real titles
+        title = ' '.join(rng.choice(WORDS) if rng.random() < 0.6 else rng.choice(rare)
+                         for _ in range(rng.randint(2, 5)))
+        author = f'{rng.choice(NAMES).title()} {rng.choice(rare).title()}'
+        description = f'A book about {rng.choice(WORDS)} and {rng.choice(rare)} in {rng.choice(rare)}.'
+        yield book_id, title, author, description
+
+
+def time_queries(index, queries, repeat):
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, limit=12)
+            samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def run(sizes, repeat, vocabulary):
+    rare = rare_words(vocabulary)
+    query_sets = {
+        'exact': ['history', 'smith', 'ocean'],
+        'multi-term': ['winter journey', 'secret garden', f'love {rare[100]}'],
+        'prefix': ['myst', 'hist', rare[len(rare) // 2][:4]],
+        'rare': [rare[17], rare[-1]],
+    }
+    for size in sizes:
+        index = SearchIndex()
+        started = time.perf_counter()
+        for book in synthetic_books(size, rare):
+            index.add(*book)
+        build_s = time.perf_counter() - started
+        # Done by the first prefix lookup after a build or refresh
+        started = time.perf_counter()
+        index._sorted_vocab()
+        sort_ms = (time.perf_counter() - started) * 1000
+        print(f'\n{size:,} books  (index build {build_s:.1f}s, {len(index._postings):,} terms, '
+              f'vocabulary sort {sort_ms:.0f} ms)')
+        for name, queries in query_sets.items():
+            result = time_queries(index, queries, repeat)
+            print(f"  {name:<11} p50 {result['p50_ms']:>8} ms   p95 {result['p95_ms']:>8} ms   max {result['max_ms']:>8} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--vocabulary', type=int, default=300_000, help="distinct rare words to draw from")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.vocabulary)
@@ -0,0 +1,181 @@
+"""How many /events streams one server process holds, and how fast it fans out.
+
+Start a server (sync or async mode, one process) and point this at it:
+
+    python run.py                                   # sync, :8000
+    hypercorn asgi:app --bind 127.0.0.1:8001        # async, :8001
+
+    python -m benchmarks.sse_capacity --url http://127.0.0.1:8001 --clients 250,500,1000,2000
+
+For each step the listener count is raised to the given number of open
+streams, all watching the same fixture book. A fixture member then borrows
+and returns that book --rounds times, and every availability event a
+listener receives is timed from the start of the borrow or return that
+caused it. Per step it reports streams accepted, refused with 503 (past
+EVENTS_MAX_SUBSCRIBERS) or failed, the share of listeners that saw every
+change, and fan-out latency p50/p99. Stop raising --clients once streams
+start failing or p99 climbs; that's the capacity of one worker. The sync
+server spends a thread per stream, so expect it to top out far below the
+async one. Raise the client's open-file limit (ulimit -n) for large steps.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from benchmarks.loadtest import Client, PASSWORD, connect, create_fixture, drop_fixture
+from benchmarks.report import summarize, run_info, write_json
+
+load_dotenv()
+
+
+class Listener:
+    """One raw-socket event stream, recording when each availability event lands."""
+
+    def __init__(self):
+        self.status = None
+        self.received = []
+        self.writer = None
+
+    async def open(self, host, port, path):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        # HTTP/1.0 so the body isn't chunked and lines can be read as-is
+        self.writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await self.writer.drain()
+        self.status = int((await reader.readline()).split()[1])
+        while (await reader.readline()).strip():
+            pass
+        return reader
+
+    async def listen(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b'data: '):
+                event = json.loads(line[6:])
+                if event.get('type') == 'availability':
+                    self.received.append(time.perf_counter())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def add_listeners(listeners, tasks, count, host, port, path, batch=100):
+    # Open `count` more streams, `batch` connections at a time
+    refused = failed = 0
+    for start in range(0, count, batch):
+        fresh = [Listener() for _ in range(min(batch, count - start))]
+        results = await asyncio.gather(*(listener.open(host, port, path) for listener in fresh),
+                                       return_exceptions=True)
+        for listener, reader in zip(fresh, results):
+            if isinstance(reader, Exception):
+                failed += 1
+            elif listener.status != 200:
+                refused += 1
+                listener.close()
+            else:
+                listeners.append(listener)
+                tasks.append(asyncio.create_task(listener.listen(reader)))
+    return refused, failed
+
+
+def circulate(client, user_id, book_id):
+    # Borrow then return; returns when each request started
+    borrowed = time.perf_counter()
+    client.request('POST', f'/borrow/process/{book_id}', {})
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT MAX(transaction_id) AS transaction_id FROM transactions
+        WHERE user_id = %s AND book_id = %s AND status = 'issued'
+    """, (user_id, book_id))
+    transaction_id = cursor.fetchone()['transaction_id']
+    db.close()
+    returned = time.perf_counter()
+    client.request('GET', f'/return/{transaction_id}')
+    return [borrowed, returned]
+
+
+async def run_step(listeners, client, account, book_id, rounds, interval):
+    for listener in listeners:
+        listener.received.clear()
+    changes = []
+    for _ in range(rounds):
+        changes += await asyncio.to_thread(circulate, client, account['user_id'], book_id)
+        await asyncio.sleep(interval)
+    # Each event is timed from the latest change that started before it
+    latencies = []
+    complete = 0
+    for listener in listeners:
+        for received in listener.received:
+            started = max((t for t in changes if t <= received), default=None)
+            if started is not None:
+                latencies.append(received - started)
+        # Coalescing may merge a borrow and return that land together, so
+        # one event per round is the least a caught-up listener sees
+        complete += len(listener.received) >= rounds
+    return latencies, complete
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    book_id, accounts = create_fixture(1)
+    account = accounts[0]
+    path = f'/events?books={book_id}'
+    listeners, tasks = [], []
+    results = {'run': run_info(url=args.url, clients=args.clients, rounds=args.rounds)}
+    client = Client(args.url)
+    try:
+        client.request('POST', '/login', {'email': account['email'], 'password': PASSWORD})
+        print(f"  {'streams':>8} {'refused':>8} {'failed':>7} {'complete':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        refused = failed = 0
+        for target in args.clients:
+            more_refused, more_failed = await add_listeners(listeners, tasks, max(0, target - len(listeners)),
+                                                            host, port, path)
+            refused += more_refused
+            failed += more_failed
+            await asyncio.sleep(args.settle)
+            open_streams = sum(1 for task in tasks if not task.done())
+            latencies, complete = await run_step(listeners, client, account, book_id, args.rounds, args.interval)
+            summary = summarize(latencies)
+            print(f"  {open_streams:>8} {refused:>8} {failed:>7} {complete / max(len(listeners), 1):>9.0%} "
+                  f"{summary['p50_ms']:>8.1f} {summary['p99_ms']:>8.1f}")
+            results[str(target)] = dict(summary, streams=open_streams, refused=refused, failed=failed,
+                                        complete=complete)
+            if open_streams == 0:
+                break
+    finally:
+        for listener in listeners:
+            listener.close()
+        for task in tasks:
+            task.cancel()
+        client.close()
+        drop_fixture(book_id, accounts)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True, help="base URL of one server process")
+    parser.add_argument('--clients', default='100,250,500,1000',
+                        type=lambda value: [int(n) for n in value.split(',')],
+                        help="comma-separated open-stream counts to step through")
+    parser.add_argument('--rounds', type=int, default=10, help="borrow/return pairs per step")
+    parser.add_argument('--interval', type=float, default=0.5, help="seconds between rounds")
+    parser.add_argument('--settle', type=float, default=1.0, help="seconds to wait after opening streams")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Worker cold start: import to first response, with and without PRELOAD.
+
+Each run starts a fresh interpreter that imports the app, calls create_app
+and sends its first requests through the test client, the way a new worker
+would after a deploy or restart:
+
+    python -m benchmarks.startup --runs 10 --json startup.json
+
+Reports the median of each phase: process start to import done, create_app
+(which includes the warm-up when PRELOAD is on), the first /readyz, the first
+/books page, the first search (which loads the search index) and a /books
+page sorted differently, for the cost of a request once everything is warm.
+`--bytecode` picks the compiled-template cache the runs see: 'warm' shares
+one filled directory, as a restarted worker would; 'cold' gives each run an
+empty one, as a new machine would; 'off' disables it. Needs a database
+filled with benchmarks.datagen.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.report import run_info, write_json
+
+PHASES = ('import', 'create_app', 'readyz', 'first_page', 'first_search', 'warm_page')
+
+# Runs in the child; prints one JSON line of seconds since `started`
+CHILD = """
+import json, sys, time
+started = float(sys.argv[1])
+marks = {}
+from app import create_app
+marks['import'] = time.time() - started
+app = create_app()
+marks['create_app'] = time.time() - started
+client = app.test_client()
+for name, path in (('readyz', '/readyz'), ('first_page', '/books'), ('first_search', '/books?q=the'),
+                   ('warm_page', '/books?sort=popular')):
+    before = time.time()
+    status = client.get(path).status_code
+    marks[name] = time.time() - before
+    marks[name + '_status'] = status
+print(json.dumps(marks))
+"""
+
+
+def run(preload, bytecode_dir):
+    env = dict(os.environ, PRELOAD='1' if preload else '0', TEMPLATE_BYTECODE_DIR=bytecode_dir)
+    started = time.time()
+    done = subprocess.run([sys.executable, '-c', CHILD, repr(started)], env=env, capture_output=True, text=True)
+    if done.returncode != 0:
+        sys.exit(done.stderr)
+    marks = json.loads(done.stdout.strip().splitlines()[-1])
+    # create_app was marked from process start; keep only its own share
+    marks['create_app'] -= marks['import']
+    marks['to_first_page'] = marks['import'] + marks['create_app'] + marks['readyz'] + marks['first_page']
+    return marks
+
+
+def measure(preload, runs, bytecode):
+    shared = tempfile.mkdtemp(prefix='startup-bytecode-')
+    samples = []
+    try:
+        if bytecode == 'warm':
+            run(preload, shared)  # fills the cache; not counted
+        for _ in range(runs):
+            if bytecode == 'cold':
+                shutil.rmtree(shared)
+                os.makedirs(shared)
+            samples.append(run(preload, '' if bytecode == 'off' else shared))
+    finally:
+        shutil.rmtree(shared, ignore_errors=True)
+    result = {name: statistics.median(s[name] for s in samples) * 1000 for name in PHASES + ('to_first_page',)}
+    result['statuses'] = {name: samples[-1][name + '_status'] for name in PHASES[2:]}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help="fresh processes per mode")
+    parser.add_argument('--bytecode', choices=('warm', 'cold', 'off'), default='warm',
+                        help="compiled-template cache seen by each run")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    result = {'run': run_info(runs=args.runs, bytecode=args.bytecode)}
+    print(f"{'mode':<10}" + ''.join(f"{name:>14}" for name in PHASES + ('to_first_page',)) + "  (median ms)")
+    for mode, preload in (('lazy', False), ('preload', True)):
+        result[mode] = measure(preload, args.runs, args.bytecode)
+        print(f"{mode:<10}" + ''.join(f"{result[mode][name]:>14.1f}" for name in PHASES + ('to_first_page',)))
+        if any(status != 200 for status in result[mode]['statuses'].values()):
+            print(f"  unexpected statuses: {result[mode]['statuses']}")
+    if args.json:
+        write_json(args.json, result)
+
+
+if __name__ == '__main__':
+    main()
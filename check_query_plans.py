@@ -0,0 +1,123 @@
+"""EXPLAIN every SELECT the routes run and fail if any of them is a full table scan.
+
+Each entry in ROUTES is requested through Flask's test client against the
+configured database while the statements sent to MySQL are recorded; every
+recorded SELECT is then run through EXPLAIN. Run it against a database with
+realistic data (ingest_books.py): on near-empty tables MySQL may rightly prefer
+a scan, so plan rows estimating fewer than --min-rows rows are not reported.
+"""
+from app import create_app, mysql
+from app.pagination import encode_cursor
+import MySQLdb
+import MySQLdb.cursors
+import argparse
+import sys
+
+recorded = []
+
+
+class RecordingConnection(MySQLdb.connections.Connection):
+    def query(self, sql, unbuffered=False):
+        recorded.append(sql.decode() if isinstance(sql, bytes) else sql)
+        return super().query(sql, unbuffered)
+
+
+# (label, role, url) - role is None for anonymous requests
+def build_routes(sample):
+    return [
+        ('catalog', 'member', '/books'),
+        ('catalog next page', 'member', f"/books?after={encode_cursor((sample['title'], sample['book_id']))}"),
+        ('catalog previous page', 'member', f"/books?before={encode_cursor((sample['title'], sample['book_id']))}"),
+        ('catalog popular', 'member', '/books?sort=popular'),
+        ('catalog popular next page', 'member', f"/books?sort=popular&after={encode_cursor((0, sample['book_id']))}"),
+        ('catalog search', 'member', f"/books?q={sample['title'].split()[0]}"),
+        ('suggest', 'member', f"/books/suggest?q={sample['title'][:3]}"),
+        ('confirm borrow', 'member', f"/borrow/confirm/{sample['book_id']}"),
+        ('member dashboard', 'member', '/dashboard'),
+        ('admin dashboard', 'admin', '/dashboard'),
+        ('panel active', 'admin', '/admin/panels/active'),
+        ('panel active by due date', 'admin', '/admin/panels/active?sort=due_date&dir=asc'),
+        ('panel active for user', 'admin', f"/admin/panels/active?user={sample['username']}"),
+        ('panel overdue', 'admin', '/admin/panels/overdue'),
+        ('panel returned', 'admin', '/admin/panels/returned'),
+        ('panel inventory', 'admin', '/admin/panels/inventory'),
+        ('panel inventory by stock', 'admin', '/admin/panels/inventory?sort=available_copies&dir=desc'),
+        ('panel inventory out of stock', 'admin', '/admin/panels/inventory?stock=out'),
+        ('api books', 'member', '/api/v1/books?fields=title,available_copies'),
+        ('api books search', 'member', f"/api/v1/books?q={sample['title'].split()[0]}"),
+        ('api book', 'member', f"/api/v1/books/{sample['book_id']}"),
+        ('api availability', 'member', f"/api/v1/availability?ids={sample['book_id']}"),
+        ('api availability summary', 'member', '/api/v1/availability/summary'),
+        ('api my loans', 'member', '/api/v1/me/loans'),
+        ('api my loans, all', 'member', '/api/v1/me/loans?status=all'),
+        ('api my holds', 'member', '/api/v1/me/holds'),
+    ]
+
+
+def is_checked(statement):
+    text = statement.lstrip().upper()
+    return text.startswith('SELECT') and 'INFORMATION_SCHEMA' not in text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--min-rows', type=int, default=100,
+                        help="ignore full scans of tables estimated below this many rows")
+    args = parser.parse_args()
+
+    MySQLdb.connect = RecordingConnection
+    app = create_app()
+    client = app.test_client()
+
+    with app.app_context():
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute("SELECT book_id, title FROM books ORDER BY book_id LIMIT 1")
+        book = cursor.fetchone()
+        cursor.execute("SELECT user_id, username FROM users ORDER BY user_id LIMIT 1")
+        user = cursor.fetchone()
+        cursor.close()
+    if not book or not user:
+        print("Need at least one book and one user; seed the database first.")
+        sys.exit(1)
+    sample = {**book, **user}
+
+    statements = []
+    for label, role, url in build_routes(sample):
+        with client.session_transaction() as sess:
+            sess.clear()
+            if role:
+                sess['user_id'] = user['user_id']
+                sess['username'] = user['username']
+                sess['role'] = role
+        del recorded[:]
+        response = client.get(url)
+        if response.status_code >= 500:
+            print(f"FAIL {label}: {url} returned {response.status_code}")
+            sys.exit(1)
+        statements.extend((label, sql) for sql in recorded if is_checked(sql))
+
+    failures = 0
+    with app.app_context():
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        seen = set()
+        for label, sql in statements:
+            if sql in seen:
+                continue
+            seen.add(sql)
+            cursor.execute("EXPLAIN " + sql)
+            for row in cursor.fetchall():
+                table = row.get('table') or ''
+                if row.get('type') == 'ALL' and not table.startswith('<') and (row.get('rows') or 0) >= args.min_rows:
+                    failures += 1
+                    print(f"FULL SCAN [{label}] table={table} rows={row['rows']}\n    {' '.join(sql.split())}\n")
+        cursor.close()
+
+    print(f"Checked {len(seen)} distinct statements from {len(build_routes(sample))} routes.")
+    if failures:
+        print(f"FAILURE: {failures} full table scan(s).")
+        sys.exit(1)
+    print("SUCCESS: no full table scans.")
+
+
+if __name__ == '__main__':
+    main()
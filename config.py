@@ -10,3 +10,120 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or 'password'
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'library_db'
     MYSQL_CURSORCLASS = 'DictCursor'
+
+    # Connection pool (see app/pool.py)
+    MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE') or 10)
+    MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT') or 5.0)
+    MYSQL_POOL_RECYCLE = int(os.environ.get('MYSQL_POOL_RECYCLE') or 3600)
+    MYSQL_POOL_PING_INTERVAL = int(os.environ.get('MYSQL_POOL_PING_INTERVAL') or 30)
+
+    # Warm-up (see app/health.py): open every pool connection, load the search
+    # index and compile all templates in create_app, before the first request.
+    # Don't combine with gunicorn --preload, which would hand the same open
+    # connections to every forked worker.
+    PRELOAD = os.environ.get('PRELOAD', '').lower() in ('1', 'true', 'yes')
+    # /readyz waits this long for a pool connection before reporting the DB down
+    READYZ_DB_TIMEOUT = float(os.environ.get('READYZ_DB_TIMEOUT') or 2.0)
+
+    # Read replicas (see app/replicas.py): comma-separated host[:port] list,
+    # same credentials as the primary. Empty sends everything to the primary.
+    MYSQL_REPLICAS = [h.strip() for h in (os.environ.get('MYSQL_REPLICAS') or '').split(',') if h.strip()]
+    MYSQL_REPLICA_POLICY = os.environ.get('MYSQL_REPLICA_POLICY') or 'round_robin'  # or 'least_latency'
+    MYSQL_REPLICA_HEALTH_INTERVAL = int(os.environ.get('MYSQL_REPLICA_HEALTH_INTERVAL') or 5)
+    MYSQL_REPLICA_MAX_LAG = int(os.environ.get('MYSQL_REPLICA_MAX_LAG') or 10)
+    MYSQL_REPLICA_RETRY_AFTER = int(os.environ.get('MYSQL_REPLICA_RETRY_AFTER') or 30)
+    # After a user's own borrow/return their reads stay on the primary this
+    # long; keep it at or above MYSQL_REPLICA_MAX_LAG
+    MYSQL_REPLICA_STICKY_SECONDS = int(os.environ.get('MYSQL_REPLICA_STICKY_SECONDS') or 10)
+
+    # Catalog search index (see app/search.py)
+    SEARCH_REFRESH_INTERVAL = int(os.environ.get('SEARCH_REFRESH_INTERVAL') or 30)
+    SEARCH_MAX_EXPANSIONS = 64
+
+    # Read-through cache (see app/cache.py): 'memory' or 'redis'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 300)
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 10000)
+    AVAILABILITY_CACHE_TTL = int(os.environ.get('AVAILABILITY_CACHE_TTL') or 30)
+
+    # Deadlock / lock-wait-timeout retries on the borrow and return paths
+    DB_RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS') or 4)
+    DB_RETRY_BACKOFF = float(os.environ.get('DB_RETRY_BACKOFF') or 0.02)
+
+    # Background jobs (worker.py). FINE_PER_DAY must match return_book; the
+    # batch return endpoint uses it too.
+    JOBS_RUN_AT = os.environ.get('JOBS_RUN_AT') or '02:00'
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE') or 1000)
+    FINE_PER_DAY = 1.00
+    REMINDER_DAYS_AHEAD = 1
+
+    # Rows fetched per round trip by the streaming /admin/export endpoints
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 1000)
+
+    # Hold queue (see app/holds.py): a returned copy waits this long for the
+    # next holder; worker.py expires missed pickups every HOLD_SWEEP_INTERVAL seconds
+    HOLD_PICKUP_HOURS = int(os.environ.get('HOLD_PICKUP_HOURS') or 48)
+    HOLD_MAX_PER_USER = int(os.environ.get('HOLD_MAX_PER_USER') or 10)
+    HOLD_SWEEP_INTERVAL = int(os.environ.get('HOLD_SWEEP_INTERVAL') or 300)
+
+    # Live updates over /events (see app/events.py): 'memory' reaches only
+    # streams on the process that made the change; with more than one
+    # server process use redis. EVENTS_REDIS_URL defaults to CACHE_REDIS_URL.
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND') or 'memory'
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS') or 1000)
+    EVENTS_MAX_PENDING = int(os.environ.get('EVENTS_MAX_PENDING') or 100)
+    EVENTS_HEARTBEAT = int(os.environ.get('EVENTS_HEARTBEAT') or 15)
+    EVENTS_MAX_BOOKS = 100
+
+    # Recommendations (see app/recommendations.py), rebuilt by worker.py
+    # every RECOMMEND_INTERVAL seconds from the loans added since the last
+    # run; RECOMMEND_STATE_DIR defaults to instance/recommendations
+    RECOMMEND_INTERVAL = int(os.environ.get('RECOMMEND_INTERVAL') or 3600)
+    RECOMMEND_TOP_K = int(os.environ.get('RECOMMEND_TOP_K') or 20)
+    RECOMMEND_MIN_SUPPORT = int(os.environ.get('RECOMMEND_MIN_SUPPORT') or 2)
+    RECOMMEND_REBUILD_DAYS = int(os.environ.get('RECOMMEND_REBUILD_DAYS') or 7)
+    RECOMMEND_STATE_DIR = os.environ.get('RECOMMEND_STATE_DIR')
+
+    # Items per batch borrow/return request (/api/v1/loans/batch, /api/v1/returns/batch)
+    CIRCULATION_MAX_BATCH = int(os.environ.get('CIRCULATION_MAX_BATCH') or 50)
+
+    # Password hashing (see app/passwords.py). Any werkzeug method string works,
+    # e.g. 'scrypt' or 'pbkdf2:sha256:600000'; stored hashes made with other
+    # parameters are upgraded on the user's next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_MAX_PENDING = 64
+    PASSWORD_HASH_TIMEOUT = 10.0
+
+    # Instrumentation: statements slower than this are logged to app.slow_queries
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS') or 200)
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+    # Adds db/checkout/render timings to every response for browser dev tools
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+    # When set, /metrics requires "Authorization: Bearer <token>"; unset, it
+    # is only served to requests from loopback that didn't come via a proxy
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Server-side sessions (see app/sessions.py): 'memory' or 'redis'. With
+    # more than one server process use redis, or logins won't carry over.
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'memory'
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL')  # defaults to CACHE_REDIS_URL
+    SESSION_TTL = int(os.environ.get('SESSION_TTL') or 14 * 24 * 3600)
+    SESSION_PROFILE_TTL = int(os.environ.get('SESSION_PROFILE_TTL') or 3600)
+    SESSION_MAX_ENTRIES = int(os.environ.get('SESSION_MAX_ENTRIES') or 10000)
+
+    # Rendered catalog cards and loan rows (see app/fragments.py), and the
+    # compiled-template cache; TEMPLATE_BYTECODE_DIR defaults to
+    # instance/jinja-bytecode, an empty value turns it off
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL') or 600)
+    TEMPLATE_BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR')
+
+    # Cover proxy (see app/covers.py); defaults to instance/covers
+    COVER_CACHE_DIR = os.environ.get('COVER_CACHE_DIR')
+    COVER_CACHE_MAX_BYTES = int(os.environ.get('COVER_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+    # Covers are fetched only from public http(s) addresses; list internal
+    # image hosts here (names, addresses or CIDR networks), comma-separated
+    COVER_ALLOWED_HOSTS = [h.strip() for h in (os.environ.get('COVER_ALLOWED_HOSTS') or '').split(',') if h.strip()]
@@ -1,8 +1,7 @@
 -- Database Schema for Online Library Management System
 -- 3NF Normalized Design
 
-CREATE DATABASE IF NOT EXISTS library_db;
-USE library_db;
+-- The database itself is created by init_db.py; migrations run inside it.
 
 -- Users Table
 CREATE TABLE IF NOT EXISTS users (
@@ -0,0 +1,5 @@
+-- Cover image and blurb shown on the catalog and borrow pages
+-- (previously applied by hand through migrate_db.py)
+
+ALTER TABLE books ADD COLUMN image_url VARCHAR(500) DEFAULT 'https://via.placeholder.com/150';
+ALTER TABLE books ADD COLUMN description TEXT;
@@ -1,10 +1,10 @@
-USE library_db;
-
 DELIMITER //
 
+DROP PROCEDURE IF EXISTS issue_book //
+
 -- Procedure to issue a book
 -- Checks availability, decrements stock, creates transaction, sets due date (14 days)
-CREATE PROCEDURE IF NOT EXISTS issue_book(IN p_user_id INT, IN p_book_id INT)
+CREATE PROCEDURE issue_book(IN p_user_id INT, IN p_book_id INT)
 BEGIN
     DECLARE v_available INT;
     
@@ -23,9 +23,11 @@ BEGIN
     END IF;
 END //
 
+DROP PROCEDURE IF EXISTS return_book //
+
 -- Procedure to return a book
 -- Updates return date, calculates fine if overdue, increments stock
-CREATE PROCEDURE IF NOT EXISTS return_book(IN p_transaction_id INT)
+CREATE PROCEDURE return_book(IN p_transaction_id INT)
 BEGIN
     DECLARE v_due_date DATE;
     DECLARE v_return_date DATE;
@@ -0,0 +1,18 @@
+-- Indexes for the query shapes in app/routes.py
+-- Run check_query_plans.py after changing a route query or one of these.
+
+-- Duplicated the UNIQUE key on users.email
+DROP INDEX idx_user_email ON users;
+
+-- Member dashboard: a user's open loans (user_id, status); also serves the
+-- admin loan panels when filtered by user, and the user_id foreign key
+CREATE INDEX idx_tx_user_status ON transactions (user_id, status, borrow_date);
+
+-- Admin panels and dashboard counters: loans by status, sorted by each date
+CREATE INDEX idx_tx_status_borrow ON transactions (status, borrow_date);
+CREATE INDEX idx_tx_status_due ON transactions (status, due_date);
+CREATE INDEX idx_tx_status_return ON transactions (status, return_date);
+
+-- Stock filters and the inventory panel's availability sort; book_id rides
+-- along as the implicit primary key suffix
+CREATE INDEX idx_book_stock ON books (available_copies, title);
@@ -0,0 +1,48 @@
+-- Race-free circulation procedures
+--
+-- issue_book used to read available_copies with a plain SELECT and decrement
+-- it afterwards, so two sessions could both see the last copy. The
+-- conditional UPDATE below checks and decrements in one statement under the
+-- row lock, and ROW_COUNT() says whether a copy was actually taken.
+--
+-- return_book now only acts on a loan that is still 'issued', so returning
+-- the same transaction twice no longer adds a phantom copy to stock.
+
+DELIMITER //
+
+DROP PROCEDURE IF EXISTS issue_book //
+
+CREATE PROCEDURE issue_book(IN p_user_id INT, IN p_book_id INT)
+BEGIN
+    UPDATE books SET available_copies = available_copies - 1
+    WHERE book_id = p_book_id AND available_copies > 0;
+
+    IF ROW_COUNT() = 1 THEN
+        -- Insert Transaction with due date + 14 days
+        INSERT INTO transactions (user_id, book_id, borrow_date, due_date)
+        VALUES (p_user_id, p_book_id, CURRENT_DATE, DATE_ADD(CURRENT_DATE, INTERVAL 14 DAY));
+    ELSE
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Book not available';
+    END IF;
+END //
+
+DROP PROCEDURE IF EXISTS return_book //
+
+CREATE PROCEDURE return_book(IN p_transaction_id INT)
+BEGIN
+    DECLARE v_book_id INT;
+
+    -- Calculate fine: $1 per day overdue
+    UPDATE transactions
+    SET return_date = CURRENT_DATE,
+        fine_amount = GREATEST(DATEDIFF(CURRENT_DATE, due_date), 0) * 1.00,
+        status = 'returned'
+    WHERE transaction_id = p_transaction_id AND status = 'issued';
+
+    IF ROW_COUNT() = 1 THEN
+        SELECT book_id INTO v_book_id FROM transactions WHERE transaction_id = p_transaction_id;
+        UPDATE books SET available_copies = available_copies + 1 WHERE book_id = v_book_id;
+    END IF;
+END //
+
+DELIMITER ;
@@ -0,0 +1,33 @@
+-- Nightly overdue processing (app/jobs.py, run by worker.py)
+
+-- Set by the fine accrual job for open loans past their due date
+ALTER TABLE transactions ADD COLUMN is_overdue TINYINT(1) NOT NULL DEFAULT 0;
+
+-- One row per background job run: how long it took and how much it changed
+CREATE TABLE IF NOT EXISTS job_runs (
+    run_id INT AUTO_INCREMENT PRIMARY KEY,
+    job VARCHAR(50) NOT NULL,
+    started_at DATETIME NOT NULL,
+    finished_at DATETIME,
+    duration_ms INT,
+    rows_touched INT DEFAULT 0,
+    status ENUM('running', 'ok', 'failed') DEFAULT 'running',
+    error TEXT,
+    INDEX idx_job_runs_job (job, started_at)
+);
+
+-- Reminders waiting for a sender. The unique key makes queueing idempotent:
+-- a loan gets at most one reminder of each kind per day.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    notification_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    transaction_id INT NOT NULL,
+    kind ENUM('due_soon', 'overdue') NOT NULL,
+    notify_on DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME,
+    UNIQUE KEY uq_outbox_once (transaction_id, kind, notify_on),
+    INDEX idx_outbox_unsent (sent_at, notification_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE
+);
@@ -0,0 +1,27 @@
+-- Change versions for the JSON API's ETag / Last-Modified (app/api.py)
+
+-- Bumped by every write to the row, including stock changes from the
+-- circulation procedures and fines from the nightly job
+ALTER TABLE books ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+ALTER TABLE transactions ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+-- MAX(updated_at) for the whole catalog is one index dive
+CREATE INDEX idx_book_updated ON books (updated_at);
+-- A member's loan version: MAX(updated_at) and COUNT(*) from the index alone
+CREATE INDEX idx_tx_user_updated ON transactions (user_id, updated_at);
+
+-- Deleted rows leave no updated_at behind, so deletes are counted here.
+-- Only deletes touch this row, keeping it off the borrow/return hot path.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    deletes BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP(6) NULL
+);
+INSERT IGNORE INTO table_versions (table_name) VALUES ('books');
+
+DROP TRIGGER IF EXISTS books_count_delete;
+CREATE TRIGGER books_count_delete AFTER DELETE ON books FOR EACH ROW
+    UPDATE table_versions SET deletes = deletes + 1, changed_at = CURRENT_TIMESTAMP(6)
+    WHERE table_name = 'books';
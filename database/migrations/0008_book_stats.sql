@@ -0,0 +1,126 @@
+-- Materialized catalog statistics
+--
+-- book_stats: per-book borrow counters and open loans, kept current by the
+-- transactions triggers below. The rolling windows only ever grow during the
+-- day; the nightly reconcile_stats job (app/jobs.py) recomputes everything
+-- from the ledger, which also ages borrows out of the 7/30 day windows.
+--
+-- category_stats: titles and copies per category, kept current by the books
+-- triggers. Each category is split over 16 slots (book_id % 16) so that
+-- concurrent borrows in a popular category update different rows instead of
+-- queueing on one; readers SUM the slots.
+
+CREATE TABLE IF NOT EXISTS book_stats (
+    book_id INT PRIMARY KEY,
+    borrows_total INT NOT NULL DEFAULT 0,
+    borrows_7d INT NOT NULL DEFAULT 0,
+    borrows_30d INT NOT NULL DEFAULT 0,
+    active_loans INT NOT NULL DEFAULT 0,
+    last_borrowed_on DATE,
+    -- Catalog sort=popular walks this index
+    INDEX idx_book_stats_popular (borrows_30d, book_id),
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE
+);
+
+-- category_id 0 collects books without a category
+CREATE TABLE IF NOT EXISTS category_stats (
+    category_id INT NOT NULL,
+    slot TINYINT NOT NULL,
+    titles INT NOT NULL DEFAULT 0,
+    total_copies INT NOT NULL DEFAULT 0,
+    available_copies INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (category_id, slot)
+);
+
+-- Backfill from the current ledger
+INSERT INTO book_stats (book_id, borrows_total, borrows_7d, borrows_30d, active_loans, last_borrowed_on)
+SELECT b.book_id,
+       COUNT(t.transaction_id),
+       COALESCE(SUM(t.borrow_date >= CURRENT_DATE - INTERVAL 6 DAY), 0),
+       COALESCE(SUM(t.borrow_date >= CURRENT_DATE - INTERVAL 29 DAY), 0),
+       COALESCE(SUM(t.status = 'issued'), 0),
+       MAX(t.borrow_date)
+FROM books b
+LEFT JOIN transactions t ON t.book_id = b.book_id
+GROUP BY b.book_id
+ON DUPLICATE KEY UPDATE borrows_total = VALUES(borrows_total), borrows_7d = VALUES(borrows_7d),
+    borrows_30d = VALUES(borrows_30d), active_loans = VALUES(active_loans),
+    last_borrowed_on = VALUES(last_borrowed_on);
+
+DELETE FROM category_stats;
+INSERT INTO category_stats (category_id, slot, titles, total_copies, available_copies)
+SELECT COALESCE(category_id, 0), book_id % 16, COUNT(*), COALESCE(SUM(total_copies), 0),
+       COALESCE(SUM(available_copies), 0)
+FROM books
+GROUP BY COALESCE(category_id, 0), book_id % 16;
+
+DELIMITER //
+
+DROP TRIGGER IF EXISTS transactions_stats_insert //
+
+CREATE TRIGGER transactions_stats_insert AFTER INSERT ON transactions FOR EACH ROW
+BEGIN
+    INSERT INTO book_stats (book_id, borrows_total, borrows_7d, borrows_30d, active_loans, last_borrowed_on)
+    VALUES (NEW.book_id, 1, 1, 1, NEW.status = 'issued', NEW.borrow_date)
+    ON DUPLICATE KEY UPDATE borrows_total = borrows_total + 1, borrows_7d = borrows_7d + 1,
+        borrows_30d = borrows_30d + 1, active_loans = active_loans + (NEW.status = 'issued'),
+        last_borrowed_on = GREATEST(COALESCE(last_borrowed_on, NEW.borrow_date), NEW.borrow_date);
+END //
+
+DROP TRIGGER IF EXISTS transactions_stats_update //
+
+CREATE TRIGGER transactions_stats_update AFTER UPDATE ON transactions FOR EACH ROW
+BEGIN
+    IF OLD.status <> NEW.status THEN
+        UPDATE book_stats
+        SET active_loans = active_loans + IF(NEW.status = 'issued', 1, -1)
+        WHERE book_id = NEW.book_id;
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS books_stats_insert //
+
+CREATE TRIGGER books_stats_insert AFTER INSERT ON books FOR EACH ROW
+BEGIN
+    INSERT IGNORE INTO book_stats (book_id) VALUES (NEW.book_id);
+    INSERT INTO category_stats (category_id, slot, titles, total_copies, available_copies)
+    VALUES (COALESCE(NEW.category_id, 0), NEW.book_id % 16, 1, COALESCE(NEW.total_copies, 0),
+            COALESCE(NEW.available_copies, 0))
+    ON DUPLICATE KEY UPDATE titles = titles + 1, total_copies = total_copies + VALUES(total_copies),
+        available_copies = available_copies + VALUES(available_copies);
+END //
+
+DROP TRIGGER IF EXISTS books_stats_update //
+
+CREATE TRIGGER books_stats_update AFTER UPDATE ON books FOR EACH ROW
+BEGIN
+    IF NOT (OLD.category_id <=> NEW.category_id) THEN
+        -- Moved between categories: take it out of the old one entirely
+        UPDATE category_stats
+        SET titles = titles - 1, total_copies = total_copies - COALESCE(OLD.total_copies, 0),
+            available_copies = available_copies - COALESCE(OLD.available_copies, 0)
+        WHERE category_id = COALESCE(OLD.category_id, 0) AND slot = OLD.book_id % 16;
+        INSERT INTO category_stats (category_id, slot, titles, total_copies, available_copies)
+        VALUES (COALESCE(NEW.category_id, 0), NEW.book_id % 16, 1, COALESCE(NEW.total_copies, 0),
+                COALESCE(NEW.available_copies, 0))
+        ON DUPLICATE KEY UPDATE titles = titles + 1, total_copies = total_copies + VALUES(total_copies),
+            available_copies = available_copies + VALUES(available_copies);
+    ELSEIF NOT (OLD.total_copies <=> NEW.total_copies AND OLD.available_copies <=> NEW.available_copies) THEN
+        UPDATE category_stats
+        SET total_copies = total_copies + COALESCE(NEW.total_copies, 0) - COALESCE(OLD.total_copies, 0),
+            available_copies = available_copies + COALESCE(NEW.available_copies, 0) - COALESCE(OLD.available_copies, 0)
+        WHERE category_id = COALESCE(NEW.category_id, 0) AND slot = NEW.book_id % 16;
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS books_stats_delete //
+
+CREATE TRIGGER books_stats_delete AFTER DELETE ON books FOR EACH ROW
+BEGIN
+    UPDATE category_stats
+    SET titles = titles - 1, total_copies = total_copies - COALESCE(OLD.total_copies, 0),
+        available_copies = available_copies - COALESCE(OLD.available_copies, 0)
+    WHERE category_id = COALESCE(OLD.category_id, 0) AND slot = OLD.book_id % 16;
+END //
+
+DELIMITER ;
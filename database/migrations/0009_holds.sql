@@ -0,0 +1,30 @@
+-- Hold queue for out-of-stock titles (app/holds.py)
+--
+-- A hold waits in its book's FIFO queue until a copy comes back. The return
+-- that frees the copy hands it to the first waiting hold in the same
+-- transaction: the copy leaves available_copies and the hold turns 'ready'
+-- with a pickup deadline. Borrowing the book claims the ready hold. Holds
+-- that aren't picked up in time are expired by the expire_holds job, which
+-- passes the copy on to the next in line.
+
+CREATE TABLE IF NOT EXISTS holds (
+    hold_id INT AUTO_INCREMENT PRIMARY KEY,
+    book_id INT NOT NULL,
+    user_id INT NOT NULL,
+    -- Place in the queue while waiting, NULL once the hold has left it, so
+    -- uq_holds_queue only orders the live queue and positions can be reused
+    position INT NULL,
+    status ENUM('waiting', 'ready', 'fulfilled', 'cancelled', 'expired') NOT NULL DEFAULT 'waiting',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ready_at DATETIME NULL,
+    expires_at DATETIME NULL,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    -- Next in line: WHERE book_id = ? AND position IS NOT NULL ORDER BY position
+    UNIQUE KEY uq_holds_queue (book_id, position),
+    -- A member's open holds
+    INDEX idx_holds_user (user_id, status),
+    -- The expiry sweep: ready holds past their deadline
+    INDEX idx_holds_expiry (status, expires_at),
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
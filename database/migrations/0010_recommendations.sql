@@ -0,0 +1,29 @@
+-- Precomputed recommendations (app/recommendations.py)
+--
+-- Built offline from the transactions ledger by the recommendations job:
+-- books borrowed by the same members are scored by cosine similarity over
+-- their sets of borrowers, and each book keeps its top matches. A member's
+-- recommendations add up the matches of everything they have borrowed.
+-- Pages read the first rows of one primary key range; nothing is computed
+-- per request.
+
+CREATE TABLE IF NOT EXISTS book_recommendations (
+    book_id INT NOT NULL,
+    -- 1 = best match
+    position TINYINT UNSIGNED NOT NULL,
+    recommended_book_id INT NOT NULL,
+    score FLOAT NOT NULL,
+    PRIMARY KEY (book_id, position),
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE,
+    FOREIGN KEY (recommended_book_id) REFERENCES books(book_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_recommendations (
+    user_id INT NOT NULL,
+    position TINYINT UNSIGNED NOT NULL,
+    book_id INT NOT NULL,
+    score FLOAT NOT NULL,
+    PRIMARY KEY (user_id, position),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE
+);
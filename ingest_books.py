@@ -0,0 +1,373 @@
+"""Bulk catalog ingestion from local Open Library dumps, JSONL or CSV files.
+
+    python ingest_books.py ol_dump_works.txt.gz --format ol-dump --authors ol_dump_authors.txt.gz
+    python ingest_books.py books.jsonl --rejects rejects.jsonl
+    python ingest_books.py books.csv --load-data
+
+Records are streamed, normalized, and written in chunks: each chunk is one
+transaction with a multi-row authors upsert, a single ISBN lookup and a
+batched books insert (or LOAD DATA LOCAL INFILE). Rows that cannot be loaded
+are written to the rejects file with the reason, never silently dropped.
+"""
+import pymysql
+# Monkey patch MySQLdb to allow using pymysql, as the app does
+pymysql.install_as_MySQLdb()
+import MySQLdb
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_TITLE = 255
+MAX_AUTHOR = 100
+MAX_ISBN = 20
+YEAR_RE = re.compile(r'\b(1[0-9]{3}|20[0-9]{2})\b')
+COVER_URL = "https://covers.openlibrary.org/b/id/{}-L.jpg"
+NO_COVER_URL = "https://via.placeholder.com/300x450?text=No+Cover"
+
+BOOK_COLUMNS = ('title', 'isbn', 'author_id', 'total_copies', 'available_copies',
+                'publication_year', 'image_url', 'description')
+
+
+class Reject(Exception):
+    pass
+
+
+class LoadDataSkipped(Exception):
+    """LOAD DATA LOCAL skipped or truncated rows, which it only warns about."""
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_records(path, fmt):
+    # Yields (line_number, record) pairs; unparseable lines come through as Reject
+    with open_text(path) as f:
+        if fmt == 'csv':
+            for line_number, record in enumerate(csv.DictReader(f), start=2):
+                yield line_number, record
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                if fmt == 'ol-dump':
+                    # type, key, revision, last_modified, JSON
+                    record = json.loads(line.rstrip('\n').split('\t', 4)[4])
+                else:
+                    record = json.loads(line)
+            except (ValueError, IndexError) as e:
+                yield line_number, Reject(f'unparseable line: {e}')
+                continue
+            yield line_number, record
+
+
+def load_author_names(path):
+    # Open Library authors dump: key -> name, for works that only carry author keys
+    names = {}
+    for _, record in read_records(path, 'ol-dump'):
+        if isinstance(record, dict) and record.get('key') and record.get('name'):
+            names[record['key']] = record['name']
+    return names
+
+
+def first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def author_of(record, author_names):
+    name = first(record.get('author_name')) or record.get('author')
+    if not name:
+        for entry in record.get('authors') or []:
+            if not isinstance(entry, dict):
+                continue
+            if entry.get('name'):
+                name = entry['name']
+            else:
+                # Works dump shape: {"author": {"key": "/authors/OL..A"}}
+                key = (entry.get('author') or {}).get('key') or entry.get('key')
+                name = author_names.get(key)
+            if name:
+                break
+    name = (name or 'Unknown Author').strip()
+    return name[:MAX_AUTHOR]
+
+
+def normalize(record, author_names, default_copies):
+    if isinstance(record, Reject):
+        raise record
+    if not isinstance(record, dict):
+        raise Reject('record is not an object')
+    title = (record.get('title') or '').strip()
+    if not title:
+        raise Reject('missing title')
+    if len(title) > MAX_TITLE:
+        raise Reject('title longer than 255 characters')
+
+    isbn = first(record.get('isbn_13')) or first(record.get('isbn_10')) or first(record.get('isbn'))
+    isbn = str(isbn).replace('-', '').strip() if isbn else None
+    if isbn and len(isbn) > MAX_ISBN:
+        raise Reject('isbn longer than 20 characters')
+
+    year = record.get('first_publish_year') or record.get('publication_year') or record.get('year')
+    if not year:
+        match = YEAR_RE.search(str(record.get('publish_date') or first(record.get('publish_year')) or ''))
+        year = match.group(1) if match else None
+    try:
+        year = int(year) if year else None
+    except ValueError:
+        raise Reject(f'bad year {year!r}')
+
+    try:
+        copies = int(record.get('copies') or default_copies)
+    except ValueError:
+        raise Reject(f"bad copies {record.get('copies')!r}")
+    if copies < 1:
+        raise Reject('copies must be at least 1')
+
+    cover = first(record.get('covers')) or record.get('cover_id') or record.get('cover_i')
+    try:
+        cover = int(cover) if cover else None
+    except ValueError:
+        cover = None
+    image_url = record.get('image_url') or (COVER_URL.format(cover) if cover and cover > 0 else NO_COVER_URL)
+
+    description = record.get('description')
+    if isinstance(description, dict):
+        description = description.get('value')
+
+    return {
+        'title': title,
+        'isbn': isbn or None,
+        'author': author_of(record, author_names),
+        'total_copies': copies,
+        'available_copies': copies,
+        'publication_year': year,
+        'image_url': image_url,
+        'description': description,
+    }
+
+
+class Ingestor:
+    def __init__(self, db, chunk_size=5000, load_data=False, rejects=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.load_data = load_data
+        self.rejects = rejects
+        self.author_ids = {}
+        # Authors inserted by the chunk in flight; forgotten again if it rolls back
+        self.new_authors = []
+        self.seen_isbns = set()
+        self.read = self.inserted = self.rejected = 0
+
+    def reject(self, line_number, reason, record=None):
+        self.rejected += 1
+        if self.rejects is not None:
+            excerpt = {k: record.get(k) for k in ('title', 'key', 'isbn')} if isinstance(record, dict) else None
+            self.rejects.write(json.dumps({'line': line_number, 'reason': reason, 'record': excerpt}, default=str) + '\n')
+
+    def run(self, records, author_names=None, default_copies=1, progress=print):
+        started = time.perf_counter()
+        chunk = []
+        for line_number, record in records:
+            self.read += 1
+            try:
+                row = normalize(record, author_names or {}, default_copies)
+            except Reject as e:
+                self.reject(line_number, str(e), record)
+                continue
+            if row['isbn']:
+                if row['isbn'] in self.seen_isbns:
+                    self.reject(line_number, 'duplicate isbn in input', record)
+                    continue
+                self.seen_isbns.add(row['isbn'])
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+                elapsed = time.perf_counter() - started
+                progress(f"{self.read:,} read, {self.inserted:,} inserted, {self.rejected:,} rejected "
+                         f"({self.read / elapsed:,.0f} rows/s)")
+        if chunk:
+            self.flush(chunk)
+        elapsed = time.perf_counter() - started
+        return {
+            'read': self.read,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.read / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def flush(self, chunk):
+        cursor = self.db.cursor()
+        try:
+            self.resolve_authors(cursor, {row['author'] for _, row in chunk})
+            chunk = self.drop_existing_isbns(cursor, chunk)
+            values = [tuple(row[c] if c != 'author_id' else self.author_ids[row['author']] for c in BOOK_COLUMNS)
+                      for _, row in chunk]
+            if values:
+                if self.load_data:
+                    self.load_infile(cursor, values)
+                else:
+                    cursor.executemany(
+                        f"INSERT INTO books ({', '.join(BOOK_COLUMNS)}) VALUES ({', '.join(['%s'] * len(BOOK_COLUMNS))})",
+                        values)
+            self.db.commit()
+            self.new_authors = []
+            self.inserted += len(values)
+        except (MySQLdb.IntegrityError, MySQLdb.DataError, LoadDataSkipped):
+            # Isolate the offending rows instead of losing the whole chunk
+            self.rollback()
+            self.flush_rows(cursor, chunk)
+        finally:
+            cursor.close()
+
+    def flush_rows(self, cursor, chunk):
+        for line_number, row in chunk:
+            try:
+                self.resolve_authors(cursor, {row['author']})
+                cursor.execute(
+                    f"INSERT INTO books ({', '.join(BOOK_COLUMNS)}) VALUES ({', '.join(['%s'] * len(BOOK_COLUMNS))})",
+                    tuple(row[c] if c != 'author_id' else self.author_ids[row['author']] for c in BOOK_COLUMNS))
+                self.db.commit()
+                self.new_authors = []
+                self.inserted += 1
+            except (MySQLdb.IntegrityError, MySQLdb.DataError) as e:
+                self.rollback()
+                self.reject(line_number, f'database: {e.args[-1]}', row)
+
+    def rollback(self):
+        self.db.rollback()
+        for name in self.new_authors:
+            self.author_ids.pop(name, None)
+        self.new_authors = []
+
+    def resolve_authors(self, cursor, names):
+        # In-memory map first; unknown names are upserted and read back in one go
+        missing = [name for name in names if name not in self.author_ids]
+        if not missing:
+            return
+        cursor.executemany("INSERT INTO authors (name) VALUES (%s) ON DUPLICATE KEY UPDATE name = name",
+                           [(name,) for name in missing])
+        placeholders = ', '.join(['%s'] * len(missing))
+        cursor.execute(f"SELECT author_id, name FROM authors WHERE name IN ({placeholders})", tuple(missing))
+        for author_id, name in cursor.fetchall():
+            self.author_ids[name] = author_id
+        self.new_authors.extend(missing)
+        # Collation may fold case/accents, so map any name MySQL matched under another spelling
+        for name in missing:
+            if name not in self.author_ids:
+                cursor.execute("SELECT author_id FROM authors WHERE name = %s", (name,))
+                self.author_ids[name] = cursor.fetchone()[0]
+
+    def drop_existing_isbns(self, cursor, chunk):
+        isbns = [row['isbn'] for _, row in chunk if row['isbn']]
+        if not isbns:
+            return chunk
+        placeholders = ', '.join(['%s'] * len(isbns))
+        cursor.execute(f"SELECT isbn FROM books WHERE isbn IN ({placeholders})", tuple(isbns))
+        existing = {isbn for (isbn,) in cursor.fetchall()}
+        kept = []
+        for line_number, row in chunk:
+            if row['isbn'] in existing:
+                self.reject(line_number, 'isbn already in catalog', row)
+            else:
+                kept.append((line_number, row))
+        return kept
+
+    def load_infile(self, cursor, values):
+        # Tab-separated temp file in the server's default LOAD DATA format
+        def field(value):
+            if value is None:
+                return '\\N'
+            return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8') as f:
+            for row in values:
+                f.write('\t'.join(field(value) for value in row) + '\n')
+            path = f.name
+        try:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE books CHARACTER SET utf8mb4 ({', '.join(BOOK_COLUMNS)})",
+                (path,))
+        finally:
+            os.unlink(path)
+        # LOCAL implies IGNORE: duplicate keys skip the row and bad values are
+        # truncated, each with only a warning. Any of that and the chunk is
+        # redone row by row, where such rows fail and are rejected.
+        loaded = cursor.rowcount
+        cursor.execute("SHOW WARNINGS")
+        warnings = [row for row in cursor.fetchall() if row[0] != 'Note']
+        if loaded != len(values) or warnings:
+            raise LoadDataSkipped(f'{loaded} of {len(values)} rows loaded, {len(warnings)} warnings')
+
+
+def connect(load_data=False):
+    return MySQLdb.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        passwd=os.getenv('MYSQL_PASSWORD'),
+        db=os.getenv('MYSQL_DB', 'library_db'),
+        charset='utf8mb4',
+        local_infile=load_data,
+        autocommit=False
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help="input file (.gz is decompressed on the fly)")
+    parser.add_argument('--format', choices=['jsonl', 'ol-dump', 'csv'],
+                        help="input format (default: guessed from the file name)")
+    parser.add_argument('--authors', help="Open Library authors dump, to resolve author keys to names")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--copies', type=int, default=1, help="copies per title when the record has none")
+    parser.add_argument('--load-data', action='store_true', help="write chunks with LOAD DATA LOCAL INFILE")
+    parser.add_argument('--rejects', default='rejects.jsonl', help="where to write rejected rows")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        name = args.path[:-3] if args.path.endswith('.gz') else args.path
+        fmt = 'csv' if name.endswith('.csv') else 'ol-dump' if name.endswith('.txt') else 'jsonl'
+
+    author_names = {}
+    if args.authors:
+        print(f"Loading author names from {args.authors}...")
+        author_names = load_author_names(args.authors)
+        print(f"{len(author_names):,} authors.")
+
+    try:
+        db = connect(args.load_data)
+    except Exception as e:
+        print(f"Error connecting: {e}")
+        sys.exit(1)
+
+    with open(args.rejects, 'w', encoding='utf-8') as rejects:
+        ingestor = Ingestor(db, args.chunk_size, args.load_data, rejects)
+        report = ingestor.run(read_records(args.path, fmt), author_names, args.copies)
+    db.close()
+
+    print(f"FINISHED! {report['inserted']:,} inserted, {report['rejected']:,} rejected "
+          f"of {report['read']:,} read in {report['seconds']}s ({report['rows_per_second']:,} rows/s).")
+    if report['rejected']:
+        print(f"Rejected rows and reasons: {args.rejects}")
+
+
+if __name__ == '__main__':
+    main()
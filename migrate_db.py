@@ -1,9 +1,18 @@
+from app import migrations
 import MySQLdb
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Versioned schema migrations. Each database/migrations/NNNN_name.sql file is
+# applied once, in order, and recorded in the schema_migrations table.
+parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+parser.add_argument('--status', action='store_true', help="list pending migrations without applying them")
+args = parser.parse_args()
+
 try:
     print("Connecting to database...")
     db = MySQLdb.connect(
@@ -13,25 +22,18 @@ try:
         db=os.getenv('MYSQL_DB', 'library_db'),
         autocommit=True
     )
-    cursor = db.cursor()
-
-    print("Adding 'image_url' column...")
-    try:
-        cursor.execute("ALTER TABLE books ADD COLUMN image_url VARCHAR(500) DEFAULT 'https://via.placeholder.com/150';")
-        print("image_url added.")
-    except Exception as e:
-        print(f"Skipping image_url (might exist): {e}")
 
-    print("Adding 'description' column...")
-    try:
-        cursor.execute("ALTER TABLE books ADD COLUMN description TEXT;")
-        print("description added.")
-    except Exception as e:
-        print(f"Skipping description (might exist): {e}")
+    if args.status:
+        pending = migrations.pending(db)
+        for version, name, _ in pending:
+            print(f"pending: {version:04d}_{name}")
+        print(f"{len(pending)} pending migration(s).")
+    else:
+        applied = migrations.migrate(db)
+        print(f"Migration Complete. Applied {len(applied)} migration(s).")
 
-    cursor.close()
     db.close()
-    print("Migration Complete.")
 
 except Exception as e:
     print(f"Error during migration: {e}")
+    sys.exit(1)
@@ -1,6 +1,7 @@
 from app import create_app
 
-app = create_app()
-
 if __name__ == "__main__":
+    # Built here, not at import: the password hashing workers are spawned
+    # and re-import this script, and shouldn't start an app of their own
+    app = create_app()
     app.run(debug=True, use_reloader=False, port=8000)
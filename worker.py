@@ -0,0 +1,55 @@
+"""Background worker: runs the jobs from app/jobs.py.
+
+    python worker.py          # nightly jobs at JOBS_RUN_AT, periodic ones on their interval
+    python worker.py --once   # run every job now and exit
+"""
+from app import create_app, mysql
+from app.jobs import nightly_jobs, periodic_jobs, run_job
+import argparse
+import datetime
+import time
+
+app = create_app()
+
+
+def run_all(jobs):
+    for name, job in jobs:
+        # Fresh app context per job, so each one checks out its own connection
+        with app.app_context():
+            result = run_job(mysql.connection, name, job)
+        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {name}: {result['status']}, "
+              f"{result['rows_touched']} rows in {result['duration_ms']} ms"
+              + (f" ({result['error']})" if result['error'] else ""))
+
+
+def seconds_until(run_at):
+    hour, minute = (int(part) for part in run_at.split(':'))
+    now = datetime.datetime.now()
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += datetime.timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the library's background jobs.")
+    parser.add_argument('--once', action='store_true', help="run every job now and exit")
+    args = parser.parse_args()
+
+    periodic = periodic_jobs(app)
+    if args.once:
+        run_all(nightly_jobs(app) + [(name, job) for name, job, _ in periodic])
+    else:
+        nightly_at = time.time() + seconds_until(app.config.get('JOBS_RUN_AT', '02:00'))
+        print(f"Next nightly run in {(nightly_at - time.time()) / 3600:.1f}h")
+        due = {name: time.time() for name, _, _ in periodic}
+        while True:
+            if time.time() >= nightly_at:
+                run_all(nightly_jobs(app))
+                nightly_at = time.time() + seconds_until(app.config.get('JOBS_RUN_AT', '02:00'))
+                print(f"Next nightly run in {(nightly_at - time.time()) / 3600:.1f}h")
+            for name, job, interval in periodic:
+                if time.time() >= due[name]:
+                    run_all([(name, job)])
+                    due[name] = time.time() + interval
+            time.sleep(max(1.0, min([nightly_at] + list(due.values())) - time.time()))